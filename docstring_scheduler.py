@@ -0,0 +1,489 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates
+"""
+Scheduling of docstring generation: which components reach the LLMs, in what order and
+how many at once, and when their docstrings are written.
+
+Every engine (sequential, concurrent on worker threads, or with provider batch jobs)
+goes through the same GenerationRun: it skips components that don't need a docstring,
+reuses docstrings from the checkpoint journal and the docstring cache, writes the
+docstrings of a component's dependencies before it is generated, and buffers finished
+docstrings until the last component of their file is done. The engines only differ in
+how they run the pipelines of the components that are left.
+
+Running a pipeline and editing files are left to the caller (see generate_docstrings.py),
+which passes them in as functions.
+"""
+
+import asyncio
+import heapq
+import logging
+import queue
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from src.dependency_analyzer import (
+    CodeComponent,
+    DependencyParser,
+    DocstringCache,
+    dependency_levels,
+    resolve_cycles
+)
+from src.visualizer import ProgressVisualizer
+from src.agent.orchestrator import Orchestrator
+from src.agent.checkpoint import CheckpointJournal
+from src.agent.llm.batch import BatchCollector
+from src.agent.llm.rate_limiter import UsageTracker
+
+logger = logging.getLogger("docstring_generator")
+
+# Generates the docstring of a component with an orchestrator, given the content of its
+# file; returns (docstring, usage), see generate_and_measure
+GenerateFunction = Callable[[CodeComponent, Optional[Orchestrator], str], tuple]
+AsyncGenerateFunction = Callable[[CodeComponent, Orchestrator, str], Awaitable[tuple]]
+
+
+def get_skip_reason(component: CodeComponent, overwrite_docstrings: bool) -> Optional[str]:
+    """
+    Decide whether a component can be skipped instead of generating a docstring.
+
+    Args:
+        component: The component to check.
+        overwrite_docstrings: Whether existing docstrings should be overwritten.
+
+    Returns:
+        The reason to skip the component, or None if it needs a docstring.
+    """
+    # Skip __init__ methods as they don't need docstrings
+    if component.component_type == "method" and component.id.endswith(".__init__"):
+        return "__init__ methods don't need docstrings"
+
+    # compute the length of docstring if exists (using white space as delimiter)
+    docstring_length = len(component.docstring.split()) if component.has_docstring else 0
+    # Skip components that already have docstrings (unless overwrite_docstrings is True)
+    if component.has_docstring and not overwrite_docstrings and docstring_length > 10:
+        return "already has docstring"
+
+    return None
+
+
+def _read_file(file_path: str) -> str:
+    """Read a source file, on the scheduling thread, so reads never interleave with writes."""
+    with open(file_path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+class DocstringWriteBuffer:
+    """
+    Write-behind buffer of generated docstrings, applied one file at a time.
+
+    Docstrings are held per file until flushed, then written with a single call of the
+    apply function. A buffered docstring is not visible in the file yet, so callers
+    flush it before generating anything that depends on its component.
+    """
+
+    def __init__(self, apply_docstrings: Callable[[str, List[tuple]], Dict[str, bool]],
+                 parser: DependencyParser, visualizer: ProgressVisualizer,
+                 journal: Optional[CheckpointJournal] = None):
+        """
+        Initialize an empty buffer.
+
+        Args:
+            apply_docstrings: Writes a list of (component, docstring) to a file and returns
+                whether each component's docstring was written, see apply_docstrings_to_file.
+            parser: The dependency parser, used to re-parse files after writing.
+            visualizer: The progress visualizer.
+            journal: Optional checkpoint journal that records every written docstring.
+        """
+        self.apply_docstrings = apply_docstrings
+        self.parser = parser
+        self.visualizer = visualizer
+        self.journal = journal
+        self._pending: Dict[str, List[tuple]] = defaultdict(list)
+        self._pending_files: Dict[str, str] = {}
+
+    def add(self, component: CodeComponent, docstring: str):
+        """
+        Buffer the docstring of a component.
+
+        Args:
+            component: The component the docstring belongs to.
+            docstring: The generated docstring.
+        """
+        self._pending[component.file_path].append((component, docstring))
+        self._pending_files[component.id] = component.file_path
+
+    def file_of(self, component_id: str) -> Optional[str]:
+        """
+        Get the file a component's buffered docstring will be written to.
+
+        Args:
+            component_id: ID of the component.
+
+        Returns:
+            The file path, or None if the component has no buffered docstring.
+        """
+        return self._pending_files.get(component_id)
+
+    def flush(self, file_path: str, reparse: bool) -> Dict[str, bool]:
+        """
+        Write the buffered docstrings of a file and report the results.
+
+        Args:
+            file_path: The file to write.
+            reparse: Whether to re-parse the file, needed while later components from it
+                are pending.
+
+        Returns:
+            Mapping from component ID to whether its docstring was written.
+        """
+        docstrings = self._pending.pop(file_path, [])
+        for component, _ in docstrings:
+            del self._pending_files[component.id]
+        if not docstrings:
+            return {}
+
+        results = self.apply_docstrings(file_path, docstrings)
+        for component_id, success in results.items():
+            if success:
+                logger.info(f"Successfully updated docstring for {component_id}")
+                self.visualizer.update(component_id, "completed")
+                if self.journal:
+                    self.journal.record_written(component_id)
+            else:
+                logger.error(f"Failed to update docstring for {component_id}")
+                self.visualizer.update(component_id, "error")
+
+        # Re-parse the file in case the line numbers changed due to docstring insertion
+        if reparse and any(results.values()):
+            logger.info(f"Re-parsing file {file_path} for updated line numbers")
+            # Only the touched file is re-parsed; the components dictionary is patched in place
+            self.parser.update_file(file_path)
+        return results
+
+    def flush_dependencies(self, component_id: str, graph: Dict[str, Set[str]], remaining_per_file: Dict[str, int]):
+        """
+        Write the buffered docstrings of a component's dependencies before it is generated,
+        so their new docstrings are part of its context.
+
+        Args:
+            component_id: ID of the component about to be generated.
+            graph: The dependency graph.
+            remaining_per_file: Number of components still pending in each file, the
+                component itself included.
+        """
+        for dep in graph.get(component_id, ()):
+            file_path = self.file_of(dep)
+            if file_path:
+                self.flush(file_path, reparse=remaining_per_file[file_path] > 0)
+
+    def pending_files(self) -> List[str]:
+        """Get the files that have buffered docstrings."""
+        return list(self._pending)
+
+
+class GenerationRun:
+    """
+    The components of a run and the bookkeeping every engine shares.
+
+    A component is resolved right before it would be generated: it is either finished
+    without the LLMs (skipped, or its docstring reused from the checkpoint journal or
+    the docstring cache) or handed back to the engine, which runs its pipeline and
+    passes the result to finish. A component counts as pending in its file until it is
+    finished, so a file is only re-parsed while later components from it are pending.
+    """
+
+    def __init__(self, components: Dict[str, CodeComponent], sorted_components: List[str],
+                 graph: Dict[str, Set[str]], write_buffer: DocstringWriteBuffer, visualizer: ProgressVisualizer,
+                 journal: CheckpointJournal, overwrite_docstrings: bool,
+                 docstring_cache: Optional[DocstringCache] = None):
+        """
+        Initialize the run.
+
+        Args:
+            components: The parsed components, patched in place as files are updated.
+            sorted_components: Component IDs in processing order.
+            graph: The dependency graph (component -> set of dependencies).
+            write_buffer: The buffer the finished docstrings are written through.
+            visualizer: The progress visualizer.
+            journal: The checkpoint journal, consulted before generating and updated after.
+            overwrite_docstrings: Whether existing docstrings should be overwritten.
+            docstring_cache: Optional cache of docstrings from earlier runs, consulted
+                before generating and updated after.
+        """
+        self.components = components
+        self.graph = graph
+        self.write_buffer = write_buffer
+        self.visualizer = visualizer
+        self.journal = journal
+        self.overwrite_docstrings = overwrite_docstrings
+        self.docstring_cache = docstring_cache
+
+        self.scheduled = [component_id for component_id in sorted_components if component_id in components]
+        for component_id in sorted_components:
+            if component_id not in components:
+                logger.warning(f"Component {component_id} not found in parsed components")
+
+        # Count the components still to be finished in each file
+        self.remaining_per_file: Dict[str, int] = defaultdict(int)
+        for component_id in self.scheduled:
+            self.remaining_per_file[components[component_id].file_path] += 1
+        self.finished = 0
+
+    def resolve(self, component_id: str) -> Optional[CodeComponent]:
+        """
+        Finish a component without the LLMs if possible, otherwise prepare its generation.
+
+        Args:
+            component_id: ID of the component.
+
+        Returns:
+            The component to generate a docstring for, once the docstrings of its
+            dependencies are written, or None if it is already finished.
+        """
+        component = self.components[component_id]
+
+        # Components finished in a previous run are taken from the journal
+        record = self.journal.lookup(component)
+        skip_reason = get_skip_reason(component, self.overwrite_docstrings)
+        if record and record["status"] == "written":
+            skip_reason = "already done in a previous run"
+
+        if skip_reason:
+            logger.info(f"Skipping {component_id} - {skip_reason}")
+            self.visualizer.update(component_id, "completed")
+            self.remaining_per_file[component.file_path] -= 1
+            self.finished += 1
+            return None
+        elif component.has_docstring and self.overwrite_docstrings:
+            logger.info(f"Overwriting existing docstring for {component_id}")
+
+        self.write_buffer.flush_dependencies(component_id, self.graph, self.remaining_per_file)
+        component = self.components[component_id]
+        self.visualizer.update(component_id, "processing")
+
+        if record:
+            logger.info(f"Reusing the docstring of {component_id} from the checkpoint journal")
+            if self.docstring_cache:
+                self.docstring_cache.put(component, self.components, record["docstring"])
+            self._complete(component, record["docstring"])
+            return None
+
+        cached_docstring = self.docstring_cache.lookup(component, self.components) if self.docstring_cache else None
+        if cached_docstring is not None:
+            logger.info(f"Reusing the docstring of {component_id} from the docstring cache")
+            self.journal.record_generated(component, cached_docstring, UsageTracker().to_dict())
+            self._complete(component, cached_docstring)
+            return None
+
+        logger.info(f"Generating docstring for {component.component_type}: {component_id}")
+        return component
+
+    def finish(self, component_id: str, docstring: str, usage: Dict[str, float]):
+        """
+        Record and buffer the docstring generated for a resolved component.
+
+        Args:
+            component_id: ID of the component.
+            docstring: The generated docstring, empty if generation failed.
+            usage: Tokens and cost spent on the docstring, see generate_and_measure.
+        """
+        component = self.components[component_id]
+        if docstring.strip():
+            self.journal.record_generated(component, docstring, usage)
+            if self.docstring_cache:
+                self.docstring_cache.put(component, self.components, docstring)
+        self._complete(component, docstring)
+
+    def _complete(self, component: CodeComponent, docstring: str):
+        """Buffer a finished docstring; the file is written once its last component is done."""
+        file_path = component.file_path
+        self.remaining_per_file[file_path] -= 1
+        self.finished += 1
+        self.write_buffer.add(component, docstring)
+        if self.remaining_per_file[file_path] == 0:
+            self.write_buffer.flush(file_path, reparse=False)
+
+    def close(self):
+        """Write the files whose last components were skipped."""
+        for file_path in self.write_buffer.pending_files():
+            self.write_buffer.flush(file_path, reparse=False)
+
+
+def generate_sequentially(generation: GenerationRun, orchestrator: Optional[Orchestrator],
+                          generate: GenerateFunction) -> None:
+    """
+    Generate docstrings one component at a time, in the sorted order.
+
+    Args:
+        generation: The run.
+        orchestrator: The orchestrator (None in placeholder mode).
+        generate: Runs the pipeline of a component.
+    """
+    for component_id in generation.scheduled:
+        component = generation.resolve(component_id)
+        if component is None:
+            continue
+        docstring, usage = generate(component, orchestrator, _read_file(component.file_path))
+        generation.finish(component_id, docstring, usage)
+
+    generation.close()
+
+
+def generate_concurrently(generation: GenerationRun, orchestrators: List[Optional[Orchestrator]],
+                          generate: GenerateFunction, respect_dependencies: bool = True) -> None:
+    """
+    Generate docstrings for many components at once on a pool of worker threads.
+
+    Each worker borrows one orchestrator from the pool for the duration of a component,
+    since orchestrators and their agents keep per-component state. Workers only run the
+    LLM pipeline on in-memory data: all file reads, docstring writes and dependency
+    graph updates happen on the calling thread, so writes to the same file are
+    serialized and never interleave with reads.
+
+    Args:
+        generation: The run; among ready components, earlier ones are started first.
+        orchestrators: One orchestrator per worker (None entries in placeholder mode).
+        generate: Runs the pipeline of a component; called on the worker threads.
+        respect_dependencies: If True, a component only starts once all its
+            dependencies are done; otherwise components start in sorted order.
+    """
+    concurrency = len(orchestrators)
+    scheduled = generation.scheduled
+
+    # Track the unfinished dependencies of every scheduled component
+    position = {component_id: i for i, component_id in enumerate(scheduled)}
+    acyclic_graph = resolve_cycles(generation.graph) if respect_dependencies else {}
+    remaining_deps = {}
+    dependents = defaultdict(list)
+    for component_id in scheduled:
+        deps = [dep for dep in acyclic_graph.get(component_id, ()) if dep in position]
+        remaining_deps[component_id] = len(deps)
+        for dep in deps:
+            dependents[dep].append(component_id)
+
+    ready = [(position[component_id], component_id) for component_id in scheduled if remaining_deps[component_id] == 0]
+    heapq.heapify(ready)
+
+    def release(component_id: str) -> None:
+        """Mark a component as done and queue the dependents it was blocking."""
+        for dependent in dependents[component_id]:
+            remaining_deps[dependent] -= 1
+            if remaining_deps[dependent] == 0:
+                heapq.heappush(ready, (position[dependent], dependent))
+
+    orchestrator_pool = queue.Queue()
+    for orchestrator in orchestrators:
+        orchestrator_pool.put(orchestrator)
+
+    def run(component: CodeComponent, file_content: str) -> tuple:
+        """Generate a docstring with an orchestrator borrowed from the pool."""
+        orchestrator = orchestrator_pool.get()
+        try:
+            return generate(component, orchestrator, file_content)
+        finally:
+            orchestrator_pool.put(orchestrator)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight = {}
+
+        while ready or in_flight:
+            # Start ready components until every worker is busy
+            while ready and len(in_flight) < concurrency:
+                _, component_id = heapq.heappop(ready)
+                component = generation.resolve(component_id)
+                if component is None:
+                    release(component_id)
+                    continue
+                in_flight[executor.submit(run, component, _read_file(component.file_path))] = component_id
+
+            if not in_flight:
+                continue
+
+            # Buffer the docstrings of finished components, a file is written once its
+            # last component is done or a dependent needs it
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                component_id = in_flight.pop(future)
+                docstring, usage = future.result()
+                generation.finish(component_id, docstring, usage)
+                release(component_id)
+
+    generation.close()
+
+    if generation.finished != len(scheduled):
+        logger.warning(f"{len(scheduled) - generation.finished} components could not be scheduled")
+
+
+def generate_in_batches(generation: GenerationRun, create_orchestrator: Callable[[], Orchestrator],
+                        agenerate: AsyncGenerateFunction, collector: BatchCollector,
+                        respect_dependencies: bool = True) -> None:
+    """
+    Generate docstrings with provider batch jobs, one dependency level at a time.
+
+    The components of a level run their pipelines concurrently on one event loop, each
+    with its own orchestrator, and their LLM requests are submitted together as batch
+    jobs, see BatchCollector: first the Reader calls of the whole level, then the calls
+    that follow them, until every pipeline is done. A level starts once the docstrings
+    of its dependencies are written, as in the other modes.
+
+    Args:
+        generation: The run.
+        create_orchestrator: Creates an orchestrator; one is needed per component of
+            the widest level, and they are reused by later levels.
+        agenerate: Runs the async pipeline of a component.
+        collector: The collector submitting the batch jobs.
+        respect_dependencies: If True, components are processed by dependency level;
+            otherwise all of them form a single level.
+    """
+    scheduled = generation.scheduled
+    if respect_dependencies:
+        position = {component_id: i for i, component_id in enumerate(scheduled)}
+        levels = [
+            sorted((component_id for component_id in level if component_id in position), key=position.get)
+            for level in dependency_levels(generation.graph)
+        ]
+        # Components outside the graph have no dependencies to wait for
+        leveled = {component_id for level in levels for component_id in level}
+        levels.append([component_id for component_id in scheduled if component_id not in leveled])
+    else:
+        levels = [scheduled]
+
+    orchestrators: List[Orchestrator] = []
+
+    async def run_level(jobs: List[tuple]) -> List[tuple]:
+        """Run the pipelines of a level concurrently, collecting their requests into batches."""
+        return await asyncio.gather(*(
+            collector.run(agenerate(component, orchestrator, file_content))
+            for (component, file_content), orchestrator in zip(jobs, orchestrators)
+        ))
+
+    levels = [level for level in levels if level]
+    for level_number, level in enumerate(levels, 1):
+        pending = [component_id for component_id in level if generation.resolve(component_id) is not None]
+        if not pending:
+            continue
+
+        # Read the files once the dependencies' docstrings of the whole level are written
+        jobs = []
+        for component_id in pending:
+            component = generation.components[component_id]
+            jobs.append((component, _read_file(component.file_path)))
+
+        while len(orchestrators) < len(jobs):
+            orchestrator = create_orchestrator()
+            orchestrator.use_batches(collector)
+            orchestrators.append(orchestrator)
+
+        logger.info(f"Generating docstrings for {len(jobs)} components of dependency level "
+                    f"{level_number}/{len(levels)} with batch jobs")
+        results = asyncio.run(run_level(jobs))
+
+        for component_id, (docstring, usage) in zip(pending, results):
+            generation.finish(component_id, docstring, usage)
+
+    generation.close()
+
+    for orchestrator in orchestrators:
+        orchestrator.visualizer.close()
+    logger.info(f"Submitted {collector.requests} requests in {collector.batches} batch jobs")
@@ -16,7 +16,8 @@ Key features:
 7. Provides visual representation of progress in the terminal
 
 Usage:
-    python generate_docstrings.py --repo-path PATH --config-path PATH [--test-mode]
+    python generate_docstrings.py --repo-path PATH --config-path PATH [--test-mode] [--workers N] [--concurrency N] [--resume] [--estimate]
+                                [--no-docstring-cache] [--batch]
 """
 
 import os
@@ -27,10 +28,12 @@ import json
 import argparse
 import logging
 import random
+import shutil
+import tempfile
+import textwrap
 from pathlib import Path
-from typing import Dict, List, Set, Optional, Any
+from typing import Awaitable, Dict, List, Set, Optional, Any
 from collections import defaultdict
-import tiktoken  # Add this import for token counting
 
 # Setup logging
 logging.basicConfig(
@@ -47,10 +50,27 @@ from src.dependency_analyzer import (
     CodeComponent, 
     DependencyParser, 
     dependency_first_dfs, 
-    build_graph_from_components
+    dependency_levels,
+    build_graph_from_components,
+    DocstringCache
 )
 from src.visualizer import ProgressVisualizer
 from src.agent.orchestrator import Orchestrator
+from src.agent.checkpoint import CheckpointJournal
+from src.agent.estimator import CostEstimator
+from src.agent.llm.batch import BatchCollector
+from src.agent.llm.tokenizer import get_tokenizer
+from src.agent.llm.response_cache import get_response_caches
+from src.agent.llm.replay_llm import get_recordings
+from src.agent.llm.rate_limiter import get_rate_limiters, track_usage
+from docstring_scheduler import (
+    DocstringWriteBuffer,
+    GenerationRun,
+    get_skip_reason,
+    generate_sequentially,
+    generate_concurrently,
+    generate_in_batches
+)
 
 
 def generate_test_docstring(component: CodeComponent) -> str:
@@ -114,8 +134,63 @@ def generate_test_docstring(component: CodeComponent) -> str:
         """
 
 
+def prepare_focal_component(component_code: str) -> tuple:
+    """
+    Count the tokens of a component's code and truncate it to the focal component limit.
+    
+    Args:
+        component_code: The source code of the component.
+        
+    Returns:
+        Tuple of (code sent to the agents, token count of the untruncated code).
+    """
+    # Estimate token count of the focal component
+    tokenizer = get_tokenizer("cl100k_base")  # Default OpenAI encoding
+    token_count = tokenizer.count(component_code)
+    
+    # Truncate components that are too large (> 10000 tokens)
+    if token_count > 10000:
+        component_code = tokenizer.truncate(component_code, 10000)
+    
+    return component_code, token_count
+
+
+def prepare_orchestrator_inputs(component: CodeComponent, file_content: str,
+                                dependency_graph: Optional[Dict[str, List[str]]] = None) -> Dict[str, Any]:
+    """
+    Build the arguments of Orchestrator.process (or aprocess) for a component.
+    
+    Args:
+        component: The component to generate a docstring for.
+        file_content: Content of the component's file.
+        dependency_graph: Optional dependency graph.
+        
+    Returns:
+        The keyword arguments for the orchestrator.
+    """
+    file_path = component.file_path
+    
+    # Get the component code, truncated if it is too large
+    component_code, token_consume_focal = prepare_focal_component(component.source_code)
+    
+    ast_tree = ast.parse(file_content)
+    ast_node = find_component_node(ast_tree, component)
+    
+    # Pass component.id as the focal_node_dependency_path
+    return {
+        "focal_component": component_code,
+        "file_path": file_path,
+        "ast_node": ast_node,
+        "ast_tree": ast_tree,
+        "dependency_graph": dependency_graph,
+        "focal_node_dependency_path": component.id,
+        "token_consume_focal": token_consume_focal  # Pass token count to orchestrator
+    }
+
+
 def generate_docstring_for_component(component: CodeComponent, orchestrator: Optional[Orchestrator], test_mode: str = 'none',
-                                     dependency_graph: Optional[Dict[str, List[str]]] = None) -> str:
+                                     dependency_graph: Optional[Dict[str, List[str]]] = None,
+                                     file_content: Optional[str] = None) -> str:
     """
     Generate a docstring for a single component.
     
@@ -124,6 +199,8 @@ def generate_docstring_for_component(component: CodeComponent, orchestrator: Opt
         orchestrator: The orchestrator instance.
         test_mode: The test mode to use.
         dependency_graph: Optional dependency graph.
+        file_content: Optional content of the component's file. When given, the file
+            is not read, so the caller controls when file I/O happens.
         
     Returns:
         The generated docstring.
@@ -133,97 +210,59 @@ def generate_docstring_for_component(component: CodeComponent, orchestrator: Opt
     if not orchestrator:
         return ""
     
-    file_path = component.file_path
-    
-    # Get the component code
-    component_code = component.source_code
-    
-    # Estimate token count of the focal component
-    encoding = tiktoken.get_encoding("cl100k_base")  # Default OpenAI encoding
-    token_consume_focal = len(encoding.encode(component_code))
-    
-    # Skip if the component is too large (> 10000 tokens)
-    if token_consume_focal > 10000:
-        # truncate the component code to 10000 tokens
-        component_code = encoding.decode(encoding.encode(component_code)[:10000])
-    
     # Parse the file
-    with open(file_path, "r", encoding="utf-8") as f:
-        file_content = f.read()
+    if file_content is None:
+        with open(component.file_path, "r", encoding="utf-8") as f:
+            file_content = f.read()
     
-    ast_tree = ast.parse(file_content)
-    ast_node = None
-    
-    # Locate the AST node for the component
-    component_parts = component.id.split(".")
-    component_name = component_parts[-1]
-    
-    if component.component_type == "function":
-        # Find top-level function
-        for node in ast.iter_child_nodes(ast_tree):
-            if (isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) 
-                    and node.name == component_name):
-                ast_node = node
-                break
-            
-    elif component.component_type == "class":
-        # Find class
-        for node in ast.iter_child_nodes(ast_tree):
-            if isinstance(node, ast.ClassDef) and node.name == component_name:
-                ast_node = node
-                break
-            
-    elif component.component_type == "method":
-        # Find method inside class
-        class_name, method_name = component_parts[-2:]
-        for node in ast.iter_child_nodes(ast_tree):
-            if isinstance(node, ast.ClassDef) and node.name == class_name:
-                for item in node.body:
-                    if (isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) 
-                            and item.name == method_name):
-                        ast_node = item
-                        break
-                break
+    inputs = prepare_orchestrator_inputs(component, file_content, dependency_graph)
     
     try:
-        # Pass component.id as the focal_node_dependency_path
-        docstring = orchestrator.process(
-            focal_component=component_code,
-            file_path=file_path,
-            ast_node=ast_node,
-            ast_tree=ast_tree,
-            dependency_graph=dependency_graph,
-            focal_node_dependency_path=component.id,
-            token_consume_focal=token_consume_focal  # Pass token count to orchestrator
-        )
+        docstring = orchestrator.process(**inputs)
         return docstring
     except Exception as e:
         print(f"Error generating docstring for {component.id}: {str(e)}")
         return ""
 
 
-def set_docstring_in_file(file_path: str, component: CodeComponent, docstring: str) -> bool:
+async def agenerate_docstring_for_component(component: CodeComponent, orchestrator: Orchestrator,
+                                            dependency_graph: Dict[str, List[str]], file_content: str) -> tuple:
     """
-    Update a Python file with a newly generated docstring for a component.
+    Async version of generate_and_measure, running the orchestrator's async pipeline.
     
     Args:
-        file_path: Path to the file to update.
-        component: The component to update with a docstring.
-        docstring: The docstring to insert.
+        component: The component to generate a docstring for.
+        orchestrator: The orchestrator instance, used by no other component meanwhile.
+        dependency_graph: The dependency graph.
+        file_content: Content of the component's file.
         
     Returns:
-        True if successful, False otherwise.
+        Tuple of (docstring, usage) with usage a dictionary with "input_tokens",
+        "output_tokens" and "cost".
     """
-    # Do not use Try/Except here, we want to fail if there is an error
-    # Read the file
-    with open(file_path, "r", encoding="utf-8") as f:
-        source = f.read()
+    inputs = prepare_orchestrator_inputs(component, file_content, dependency_graph)
     
-    # Parse the file
-    tree = ast.parse(source)
+    # Each task has its own context, so only this component's requests are counted
+    with track_usage() as usage:
+        try:
+            docstring = await orchestrator.aprocess(**inputs)
+        except Exception as e:
+            print(f"Error generating docstring for {component.id}: {str(e)}")
+            docstring = ""
+    return docstring, usage.to_dict()
+
+
+def find_component_node(tree: ast.Module, component: CodeComponent) -> Optional[ast.AST]:
+    """
+    Find the AST node of a component in a parsed file.
     
-    # Find the component in the parsed AST
-    component_node = None
+    Args:
+        tree: The parsed file.
+        component: The component to look for.
+        
+    Returns:
+        The component's node, or None if it is not in the file.
+    """
     component_parts = component.id.split(".")
     component_name = component_parts[-1]
     
@@ -232,15 +271,13 @@ def set_docstring_in_file(file_path: str, component: CodeComponent, docstring: s
         for node in ast.iter_child_nodes(tree):
             if (isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) 
                     and node.name == component_name):
-                component_node = node
-                break
+                return node
                 
     elif component.component_type == "class":
         # Find class
         for node in ast.iter_child_nodes(tree):
             if isinstance(node, ast.ClassDef) and node.name == component_name:
-                component_node = node
-                break
+                return node
                 
     elif component.component_type == "method":
         # Find method inside class
@@ -250,36 +287,170 @@ def set_docstring_in_file(file_path: str, component: CodeComponent, docstring: s
                 for item in node.body:
                     if (isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) 
                             and item.name == method_name):
-                        component_node = item
-                        break
-                break
+                        return item
+                return None
+    
+    return None
+
+
+def _docstring_splice(node: ast.AST, lines: List[str], docstring: str) -> Optional[tuple]:
+    """
+    Compute the text edit that sets the docstring of a node without re-rendering the file.
+    
+    Args:
+        node: The class or function node.
+        lines: The lines of the file, with line endings.
+        docstring: The new docstring (as a plain string).
+        
+    Returns:
+        A (start, end, new_lines) tuple replacing lines[start:end] with new_lines, or None
+        if the node's body doesn't start on its own line (e.g. "def f(): pass").
+    """
+    if not getattr(node, "body", None):
+        return None
+    first_stmt = node.body[0]
+    # A decorated first statement starts at its first decorator
+    body_start = min([first_stmt.lineno] + [d.lineno for d in getattr(first_stmt, "decorator_list", [])]) - 1
+    if body_start < 1 or lines[body_start][:first_stmt.col_offset].strip():
+        return None
+    
+    has_docstring = (
+        isinstance(first_stmt, ast.Expr)
+        and isinstance(first_stmt.value, ast.Constant)
+        and isinstance(first_stmt.value.value, str)
+    )
+    if has_docstring:
+        # Only replace the docstring if no other statement shares its lines
+        start, end = first_stmt.lineno - 1, first_stmt.end_lineno
+        if len(node.body) > 1 and node.body[1].lineno <= end:
+            return None
+        # Offsets are in UTF-8 bytes
+        if lines[end - 1].encode("utf-8")[first_stmt.end_col_offset:].strip():
+            return None
+    else:
+        start = end = body_start
+    
+    # Same layout as set_node_docstring: quotes and text on their own lines
+    stripped_docstring = docstring.strip('\n')
+    if not stripped_docstring:
+        stripped_docstring = "No docstring provided."
+    dedented = textwrap.dedent(stripped_docstring)
+    dedented = dedented.replace('\\', '\\\\').replace('"""', '\\"\\"\\"')
+    indent = lines[body_start][:first_stmt.col_offset]
+    
+    new_lines = [indent + '"""\n']
+    new_lines.extend((indent + line if line.strip() else "") + "\n" for line in dedented.split("\n"))
+    new_lines.append(indent + '"""\n')
+    return start, end, new_lines
+
+
+def _write_file_atomically(file_path: str, content: str):
+    """
+    Replace a file's content through a temporary file and a rename, so readers never
+    see a partially written file.
+    
+    Args:
+        file_path: Path to the file to write.
+        content: The new content.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, temp_path)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def apply_docstrings_to_file(file_path: str, docstrings: List[tuple]) -> Dict[str, bool]:
+    """
+    Write the docstrings of several components of one file in a single pass.
     
-    if not component_node:
-        logger.error(f"Could not find component {component.id} in {file_path}")
-        return False
+    The file is read and parsed once, and every docstring is spliced into the source text
+    bottom-up by line number, so earlier edits never shift the nodes of later ones and
+    the rest of the file (comments, formatting) is kept as is. If some node can't be
+    edited in place, the whole batch falls back to rewriting the AST with ast.unparse.
+    The file is then written once, atomically.
     
-    # Set the docstring
-    set_node_docstring(component_node, docstring)
+    Args:
+        file_path: Path to the file to update.
+        docstrings: (component, docstring) pairs for components of the file.
+        
+    Returns:
+        Mapping from component ID to whether its docstring was written.
+    """
+    # Do not use Try/Except here, we want to fail if there is an error
+    # Read the file
+    with open(file_path, "r", encoding="utf-8") as f:
+        source = f.read()
     
-    # Unparse the AST back to source code
-    if hasattr(ast, "unparse"):
-        new_source = ast.unparse(tree)
+    # Parse the file
+    tree = ast.parse(source)
+    lines = source.splitlines(keepends=True)
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+    
+    results = {}
+    edits = []
+    for component, docstring in docstrings:
+        component_node = find_component_node(tree, component)
+        if not component_node:
+            logger.error(f"Could not find component {component.id} in {file_path}")
+            results[component.id] = False
+            continue
+        results[component.id] = True
+        edits.append((component_node, docstring))
+    
+    if not edits:
+        return results
+    
+    splices = [_docstring_splice(node, lines, docstring) for node, docstring in edits]
+    if all(splice is not None for splice in splices):
+        # Apply bottom-up so the line numbers of the remaining splices stay valid
+        for start, end, new_lines in sorted(splices, key=lambda splice: splice[0], reverse=True):
+            lines[start:end] = new_lines
+        new_source = "".join(lines)
     else:
-        try:
-            import astor
-            new_source = astor.to_source(tree)
-        except ImportError:
-            logger.error(
-                "Error: You need to install 'astor' or use Python 3.9+ to unparse the AST. "
-                f"Skipping file: {file_path}"
-            )
-            return False
+        for node, docstring in edits:
+            set_node_docstring(node, docstring)
+        
+        # Unparse the AST back to source code
+        if hasattr(ast, "unparse"):
+            new_source = ast.unparse(tree)
+        else:
+            try:
+                import astor
+                new_source = astor.to_source(tree)
+            except ImportError:
+                logger.error(
+                    "Error: You need to install 'astor' or use Python 3.9+ to unparse the AST. "
+                    f"Skipping file: {file_path}"
+                )
+                return {component.id: False for component, _ in docstrings}
     
     # Write back to the file
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(new_source)
+    _write_file_atomically(file_path, new_source)
     
-    return True
+    return results
+
+
+def set_docstring_in_file(file_path: str, component: CodeComponent, docstring: str) -> bool:
+    """
+    Update a Python file with a newly generated docstring for a component.
+    
+    Args:
+        file_path: Path to the file to update.
+        component: The component to update with a docstring.
+        docstring: The docstring to insert.
+        
+    Returns:
+        True if successful, False otherwise.
+    """
+    return apply_docstrings_to_file(file_path, [(component, docstring)])[component.id]
 
 
 def set_node_docstring(node: ast.AST, docstring: str):
@@ -292,8 +463,6 @@ def set_node_docstring(node: ast.AST, docstring: str):
         node: The AST node to modify (ClassDef, FunctionDef, etc.).
         docstring: The new docstring (as a plain string) to insert.
     """
-    import textwrap
-    
     # 1. Strip leading/trailing empty lines in the provided docstring
     #    to avoid spurious blank lines.
     stripped_docstring = docstring.strip('\n')
@@ -341,6 +510,76 @@ def set_node_docstring(node: ast.AST, docstring: str):
             node.body.insert(0, docstring_node)
 
 
+def generate_and_measure(component: CodeComponent, orchestrator: Optional[Orchestrator], test_mode: str,
+                         dependency_graph: Dict[str, List[str]], file_content: Optional[str] = None) -> tuple:
+    """
+    Generate a docstring and measure the tokens and cost spent on it.
+    
+    Only the requests made by this thread are counted, so concurrent workers sharing
+    the same rate limiters don't inflate each other's usage.
+    
+    Args:
+        component: The component to generate a docstring for.
+        orchestrator: The orchestrator instance.
+        test_mode: The test mode to use.
+        dependency_graph: The dependency graph.
+        file_content: Optional content of the component's file.
+        
+    Returns:
+        Tuple of (docstring, usage) with usage a dictionary with "input_tokens",
+        "output_tokens" and "cost".
+    """
+    with track_usage() as usage:
+        docstring = generate_docstring_for_component(
+            component, orchestrator, test_mode, dependency_graph, file_content=file_content
+        )
+    return docstring, usage.to_dict()
+
+
+def estimate_generation(components: Dict[str, CodeComponent], sorted_components: List[str],
+                        graph: Dict[str, Set[str]], orchestrator: Orchestrator, overwrite_docstrings: bool,
+                        concurrency: int, respect_dependencies: bool = True,
+                        journal_path: Optional[str] = None,
+                        docstring_cache_path: Optional[str] = None) -> None:
+    """
+    Estimate the tokens, cost and time of generating the docstrings, without calling the LLMs.
+    
+    Args:
+        components: Dictionary of all components.
+        sorted_components: Component IDs in processing order.
+        graph: Dependency graph (component -> set of dependencies).
+        orchestrator: The orchestrator whose agents and configuration are modeled.
+        overwrite_docstrings: Whether existing docstrings would be overwritten.
+        concurrency: Number of components that would be generated at the same time.
+        respect_dependencies: Whether components would wait for their dependencies.
+        journal_path: Checkpoint journal of a run to resume; its finished components are left out.
+        docstring_cache_path: Docstring cache of earlier runs; its unchanged components are left out.
+    """
+    journal = None
+    if journal_path and os.path.exists(journal_path):
+        journal = CheckpointJournal(journal_path, resume=True)
+    docstring_cache = DocstringCache(docstring_cache_path) if docstring_cache_path else None
+    
+    # Only the components that would reach the LLMs are estimated
+    focal_components = {}
+    for component_id in sorted_components:
+        component = components.get(component_id)
+        if not component or get_skip_reason(component, overwrite_docstrings):
+            continue
+        if journal and journal.lookup(component):
+            continue
+        if docstring_cache and docstring_cache.lookup(component, components) is not None:
+            continue
+        focal_components[component_id] = prepare_focal_component(component.source_code)
+    
+    if journal:
+        journal.close()
+    
+    levels = dependency_levels(graph) if respect_dependencies else None
+    estimate = CostEstimator(orchestrator).estimate(focal_components, concurrency, levels)
+    estimate.print_report()
+
+
 def main():
     """
     Main entry point for the docstring generation script with flexible component ordering.
@@ -408,6 +647,45 @@ def main():
         action='store_true',
         help='Overwrite existing docstrings instead of skipping them (default: False)'
     )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Number of processes used to parse the repository (default: 1, i.e. serial parsing)'
+    )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=None,
+        help='Number of components whose docstrings are generated at the same time (default: 1, i.e. sequential; '
+             'for a HuggingFace model, the max_in_flight of its concurrency config)'
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='Resume an interrupted run: components recorded in its checkpoint journal are not generated again'
+    )
+    parser.add_argument(
+        '--no-docstring-cache',
+        action='store_true',
+        help='Generate every docstring instead of reusing those of unchanged components from earlier runs'
+    )
+    parser.add_argument(
+        '--estimate',
+        action='store_true',
+        help='Only estimate the tokens, cost and time of the run under --concurrency, without calling the LLMs'
+    )
+    parser.add_argument(
+        '--batch',
+        action='store_true',
+        help='Send the LLM requests as provider batch jobs, at half the price but with hours of latency; '
+             'each dependency level is processed at once, ignoring --concurrency'
+    )
+    parser.add_argument(
+        '--no-parse-cache',
+        action='store_true',
+        help='Parse every file from scratch instead of reusing the parse cache in output/dependency_graphs'
+    )
     
     args = parser.parse_args()
     repo_path = args.repo_path
@@ -425,6 +703,9 @@ def main():
     # Create a sanitized version of the repo name (remove special characters)
     sanitized_repo_name = ''.join(c if c.isalnum() else '_' for c in repo_name)
     dependency_graph_path = os.path.join(output_dir, f"{sanitized_repo_name}_dependency_graph.json")
+    parse_cache_path = None if args.no_parse_cache else os.path.join(output_dir, f"{sanitized_repo_name}_parse_cache.json")
+    journal_path = os.path.join(output_dir, f"{sanitized_repo_name}_journal.jsonl")
+    docstring_cache_path = None if args.no_docstring_cache else os.path.join(output_dir, f"{sanitized_repo_name}_docstring_cache.json")
     
     # Initialize the orchestrator for docstring generation
     orchestrator = None
@@ -434,7 +715,10 @@ def main():
         logger.info(f"Initializing orchestrator with config: {config_path}")
         # Pass the test_mode to the orchestrator if it's "context_print"
         orchestrator_test_mode = test_mode if test_mode != 'none' else None
-        orchestrator = Orchestrator(repo_path=repo_path, config_path=config_path, test_mode=orchestrator_test_mode)
+        # Only draw the agent status when someone reads it: a terminal or the web interface
+        show_status = (sys.stdout.isatty() or args.enable_web) and not args.estimate
+        orchestrator = Orchestrator(repo_path=repo_path, config_path=config_path, test_mode=orchestrator_test_mode,
+                                    show_status=show_status)
         
         # Check if the overwrite_docstrings option is in the config file
         # If it's there, it overrides the command-line argument
@@ -447,10 +731,37 @@ def main():
     else:
         logger.info("Running in PLACEHOLDER TEST MODE with placeholder docstrings (no LLM calls)")
     
+    # A local vLLM server is only kept busy if enough components send requests at once
+    concurrency = args.concurrency
+    if concurrency is None and orchestrator:
+        llm_config = orchestrator.config.get('llm', {})
+        if llm_config.get('type') == 'huggingface':
+            concurrency = (llm_config.get('concurrency') or {}).get('max_in_flight', 32)
+    concurrency = max(1, concurrency or 1)
+    
+    if args.estimate and not orchestrator:
+        logger.error("--estimate models the configured LLMs and can't be used in placeholder test mode")
+        return
+    if args.batch and not orchestrator:
+        logger.error("--batch sends the requests to the configured LLMs and can't be used in placeholder test mode")
+        return
+    
+    # Orchestrators keep per-component state, so each concurrent worker gets its own
+    # (an estimate only models the run, and batch mode creates its own per level)
+    num_orchestrators = 1 if args.estimate or args.batch else concurrency
+    orchestrators = [orchestrator]
+    for _ in range(num_orchestrators - 1):
+        worker_orchestrator = None
+        if orchestrator:
+            # Only the first orchestrator reports its progress to the console
+            worker_orchestrator = Orchestrator(repo_path=repo_path, config_path=config_path, test_mode=orchestrator_test_mode,
+                                               show_status=False)
+        orchestrators.append(worker_orchestrator)
+    
     # Parse the repository to build the dependency graph
     logger.info(f"Parsing repository: {repo_path}")
     parser = DependencyParser(repo_path)
-    components = parser.parse_repository()
+    components = parser.parse_repository(workers=args.workers, cache_path=parse_cache_path)
     
     # Save the dependency graph for future reference
     parser.save_dependency_graph(dependency_graph_path)
@@ -497,6 +808,15 @@ def main():
         # Default to topological order (already set in sorted_components)
         logger.info("Using topological ordering mode - processing components based on dependencies")
     
+    if args.estimate:
+        estimate_generation(
+            components, sorted_components, graph, orchestrator, overwrite_docstrings, concurrency,
+            respect_dependencies=(order_mode == 'topo'),
+            journal_path=journal_path if args.resume else None,
+            docstring_cache_path=docstring_cache_path
+        )
+        return
+    
     # Check if web interface is enabled
     if args.enable_web:
         try:
@@ -511,70 +831,60 @@ def main():
     visualizer = ProgressVisualizer(components, sorted_components)
     visualizer.initialize()
     
-    # Show dependency statistics
-    visualizer.show_dependency_stats()
+    # Show dependency statistics, including how much parallelism the graph offers
+    visualizer.show_dependency_stats(levels=dependency_levels(graph))
+    
+    # Record finished components, so an interrupted run can be resumed
+    journal = CheckpointJournal(journal_path, resume=args.resume)
+    
+    # Reuse the docstrings of components that didn't change since an earlier run; test
+    # modes don't produce docstrings worth keeping
+    docstring_cache = None
+    if docstring_cache_path and test_mode == 'none':
+        docstring_cache = DocstringCache(docstring_cache_path)
+    
+    # The scheduler decides what is generated when, and where the docstrings are written
+    def generate(component: CodeComponent, orchestrator: Optional[Orchestrator], file_content: str) -> tuple:
+        """Run the pipeline of a component, see generate_and_measure."""
+        return generate_and_measure(component, orchestrator, test_mode, dependency_graph, file_content)
+    
+    def agenerate(component: CodeComponent, orchestrator: Orchestrator, file_content: str) -> Awaitable[tuple]:
+        """Run the async pipeline of a component, see agenerate_docstring_for_component."""
+        return agenerate_docstring_for_component(component, orchestrator, dependency_graph, file_content)
+    
+    write_buffer = DocstringWriteBuffer(apply_docstrings_to_file, parser, visualizer, journal)
+    generation = GenerationRun(components, sorted_components, graph, write_buffer, visualizer, journal,
+                               overwrite_docstrings, docstring_cache=docstring_cache)
+    
+    if args.batch:
+        batch_config = orchestrator.config.get('batch', {})
+        collector = BatchCollector(poll_interval=batch_config.get('poll_interval', 30.0))
+        generate_in_batches(
+            generation,
+            lambda: Orchestrator(repo_path=repo_path, config_path=config_path, test_mode=orchestrator_test_mode,
+                                 show_status=False),
+            agenerate, collector,
+            respect_dependencies=(order_mode == 'topo')
+        )
+    elif concurrency > 1:
+        logger.info(f"Generating docstrings for up to {concurrency} components at a time")
+        generate_concurrently(
+            generation, orchestrators, generate,
+            # Random orderings ignore dependencies, so they are not waited for either
+            respect_dependencies=(order_mode == 'topo')
+        )
+    else:
+        # Process components in order determined by DFS traversal
+        generate_sequentially(generation, orchestrator, generate)
     
-    # Process components in order determined by DFS traversal
-    for component_id in sorted_components:
-        component = components.get(component_id)
-        if not component:
-            logger.warning(f"Component {component_id} not found in parsed components")
-            continue
-        
-        # Skip __init__ methods as they don't need docstrings
-        if component.component_type == "method" and component_id.endswith(".__init__"):
-            logger.info(f"Skipping {component_id} - __init__ methods don't need docstrings")
-            visualizer.update(component_id, "completed")
-            continue
-        
-        # compute the length of docstring if exists (using white space as delimiter)
-        docstring_length = len(component.docstring.split()) if component.has_docstring else 0
-        # Skip components that already have docstrings (unless overwrite_docstrings is True)
-        if component.has_docstring and not overwrite_docstrings and docstring_length > 10:
-            logger.info(f"Skipping {component_id} - already has docstring")
-            visualizer.update(component_id, "completed")
-            continue
-        elif component.has_docstring and overwrite_docstrings:
-            logger.info(f"Overwriting existing docstring for {component_id}")
-        
-        # Update the visualizer
-        visualizer.update(component_id, "processing")
-        
-        # Log the component type
-        comp_type = component.component_type
-        logger.info(f"Processing {comp_type}: {component_id}")
-        
-        # Generate the docstring
-        logger.info(f"Generating docstring for {component_id}")
-        docstring = generate_docstring_for_component(component, orchestrator, test_mode, dependency_graph)
-        
-        # Update the file with the new docstring
-        file_path = component.file_path
-        success = set_docstring_in_file(file_path, component, docstring)
-        
-        if success:
-            logger.info(f"Successfully updated docstring for {component_id}")
-            visualizer.update(component_id, "completed")
-        else:
-            logger.error(f"Failed to update docstring for {component_id}")
-            visualizer.update(component_id, "error")
-        
-        # Re-parse the file in case the line numbers changed due to docstring insertion
-        # This is only necessary if there are more components from the same file
-        same_file_components = [
-            comp_id for comp_id in sorted_components 
-            if comp_id != component_id and components[comp_id].file_path == file_path
-        ]
-        
-        if same_file_components:
-            logger.info(f"Re-parsing file {file_path} for updated line numbers")
-            parser = DependencyParser(repo_path)
-            updated_components = parser.parse_repository()
-            
-            # Update the components dictionary with new line numbers
-            for comp_id, comp in updated_components.items():
-                if comp_id in components:
-                    components[comp_id] = comp
+    journal.close()
+    if docstring_cache:
+        docstring_cache.save(components)
+    
+    # Stop the status display threads before the final report
+    for worker_orchestrator in orchestrators:
+        if worker_orchestrator:
+            worker_orchestrator.visualizer.close()
     
     # Finalize the visualization
     visualizer.finalize()
@@ -599,13 +909,9 @@ def main():
     # Print usage statistics for LLM providers if available
     if orchestrator:
         try:
-            # Access the rate limiters from agents
-            rate_limiters = []
-            
-            for agent_name in ['reader', 'writer', 'verifier']:
-                agent = getattr(orchestrator, agent_name, None)
-                if agent and hasattr(agent, 'llm') and hasattr(agent.llm, 'rate_limiter'):
-                    rate_limiters.append(agent.llm.rate_limiter)
+            # Agents and workers sharing an API key share one rate limiter, so every
+            # provider account is counted once
+            rate_limiters = get_rate_limiters()
             
             # Print statistics for each rate limiter
             if rate_limiters:
@@ -621,6 +927,14 @@ def main():
                 logger.info("=" * 50)
                 logger.info(f"TOTAL COST: ${total_cost:.6f}")
                 logger.info("=" * 50)
+            
+            # Responses served from the cache cost nothing
+            for response_cache in get_response_caches():
+                response_cache.print_stats()
+            
+            # Replayed runs are only exact if no request had to be approximated
+            for recording in get_recordings():
+                recording.print_stats()
         except Exception as e:
             logger.warning(f"Could not print token usage statistics: {e}")
 
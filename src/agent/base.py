@@ -6,6 +6,7 @@ from pathlib import Path
 
 from .llm.factory import LLMFactory
 from .llm.base import BaseLLM
+from .llm.response_cache import ResponseCache, get_response_cache
 
 class BaseAgent(ABC):
     """Base class for all agents in the docstring generation system."""
@@ -22,6 +23,7 @@ class BaseAgent(ABC):
         
         # Initialize LLM and parameters from config
         self.llm, self.llm_params = self._initialize_llm(name, config_path)
+        self.response_cache = self._initialize_response_cache(name, config_path)
 
     
     def _initialize_llm(self, agent_name: str, config_path: Optional[str] = None) -> tuple[BaseLLM, Dict[str, Any]]:
@@ -48,17 +50,49 @@ class BaseAgent(ABC):
         llm_config = agent_config if agent_config else config.get("llm", {})
         
         # Verify api_key is provided in config
-        if ("api_key" not in llm_config or not llm_config["api_key"]) and (llm_config["type"] not in ["huggingface", "local"]):
+        if ("api_key" not in llm_config or not llm_config["api_key"]) and (llm_config["type"] not in ["huggingface", "local", "replay"]):
             raise ValueError("API key must be specified directly in the config file")
 
         # Extract LLM parameters
         llm_params = {
             "max_output_tokens": llm_config.get("max_output_tokens", 4096),
             "temperature": llm_config.get("temperature", 0.1),
-            "model": llm_config.get("model")
+            "model": llm_config.get("model"),
+            "provider": llm_config["type"].lower()
         }
 
-        return LLMFactory.create_llm(llm_config), llm_params
+        return LLMFactory.create_llm(llm_config, global_config=config), llm_params
+    
+    def _initialize_response_cache(self, agent_name: str, config_path: Optional[str] = None) -> Optional[ResponseCache]:
+        """Open the response cache for this agent, if enabled.
+        
+        The response_cache section of the config applies to all agents; a response_cache
+        entry in an agent's own LLM config overrides it for that agent.
+        
+        Args:
+            agent_name: Name of the agent
+            config_path: Optional path to the configuration file
+            
+        Returns:
+            The shared response cache, or None if caching is disabled for this agent
+        """
+        config = LLMFactory.load_config(config_path or "config/agent_config.yaml")
+        agent_config = config.get("agent_llms", {}).get(agent_name.lower())
+        llm_config = agent_config if agent_config else config.get("llm", {})
+        
+        cache_config = {**(config.get("response_cache") or {}), **(llm_config.get("response_cache") or {})}
+        if not cache_config.get("enabled", False):
+            return None
+        # Cached responses would be missing from a recording, and skip the simulated
+        # latency of a replay
+        if llm_config.get("type", "").lower() == "replay":
+            return None
+        
+        return get_response_cache(
+            cache_config.get("path", "output/llm_response_cache.sqlite"),
+            max_size_mb=cache_config.get("max_size_mb", 512),
+            ttl_days=cache_config.get("ttl_days", 30)
+        )
     
     def add_to_memory(self, role: str, content: str) -> None:
         """Add a message to the agent's memory.
@@ -94,6 +128,25 @@ class BaseAgent(ABC):
         """
         return self._memory.copy()
     
+    def _response_cache_key(self, messages: List[Dict[str, Any]]) -> Optional[str]:
+        """Build the response cache key of a request with this agent's LLM.
+        
+        Args:
+            messages: The messages to send
+            
+        Returns:
+            The cache key, or None if caching is disabled
+        """
+        if self.response_cache is None:
+            return None
+        return ResponseCache.make_key(
+            self.llm_params["provider"],
+            self.llm_params["model"],
+            self.llm_params["temperature"],
+            self.llm_params["max_output_tokens"],
+            messages
+        )
+    
     def generate_response(self, messages: Optional[List[Dict[str, Any]]] = None) -> str:
         """Generate a response using the agent's LLM and memory.
         
@@ -103,11 +156,49 @@ class BaseAgent(ABC):
         Returns:
             Generated response text
         """
-        return self.llm.generate(
-            messages=messages if messages is not None else self._memory,
+        messages = messages if messages is not None else self._memory
+        cache_key = self._response_cache_key(messages)
+        if cache_key:
+            response = self.response_cache.get(cache_key)
+            if response is not None:
+                return response
+        
+        response = self.llm.generate(
+            messages=messages,
+            temperature=self.llm_params["temperature"],
+            max_tokens=self.llm_params["max_output_tokens"]
+        )
+        
+        if cache_key and response:
+            self.response_cache.put(cache_key, response)
+        return response
+    
+    async def agenerate_response(self, messages: Optional[List[Dict[str, Any]]] = None) -> str:
+        """Async version of generate_response that doesn't block the event loop.
+        
+        Args:
+            messages: Optional list of messages to use instead of memory
+            
+        Returns:
+            Generated response text
+        """
+        # Cache lookups are local SQLite queries, quick enough to run on the event loop
+        messages = messages if messages is not None else self._memory
+        cache_key = self._response_cache_key(messages)
+        if cache_key:
+            response = self.response_cache.get(cache_key)
+            if response is not None:
+                return response
+        
+        response = await self.llm.agenerate(
+            messages=messages,
             temperature=self.llm_params["temperature"],
             max_tokens=self.llm_params["max_output_tokens"]
         )
+        
+        if cache_key and response:
+            self.response_cache.put(cache_key, response)
+        return response
     
     @abstractmethod
     def process(self, *args, **kwargs) -> Any:
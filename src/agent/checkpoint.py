@@ -0,0 +1,138 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates
+"""
+Checkpoint journal of a docstring generation run, used to resume it after a crash.
+"""
+
+import os
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from ..dependency_analyzer import CodeComponent, component_source_hash
+
+logger = logging.getLogger("CheckpointJournal")
+
+
+class CheckpointJournal:
+    """
+    Append-only journal of finished components, used to resume interrupted runs.
+
+    Every line is a JSON record. A "generated" record is appended as soon as a docstring
+    comes back from the LLM, with the component's source hash, the docstring and the
+    tokens and cost spent on it. A "written" record follows once the docstring is in the
+    file. Each record is flushed to disk before the run goes on, and a torn last line
+    from a crash is ignored when the journal is read back.
+
+    On resume, written components are skipped and generated ones get their journaled
+    docstring back without another LLM call, as long as their code didn't change since.
+    """
+
+    def __init__(self, journal_path: str, resume: bool = False):
+        """
+        Open the journal, replaying it if resuming and starting a new one otherwise.
+
+        Args:
+            journal_path: Path to the journal file.
+            resume: Whether to replay the records of a previous run.
+        """
+        self.journal_path = journal_path
+        self._records: Dict[str, Dict[str, Any]] = {}
+
+        journal_dir = os.path.dirname(journal_path)
+        if journal_dir:
+            os.makedirs(journal_dir, exist_ok=True)
+
+        if resume:
+            self._load()
+        self._file = open(journal_path, "a" if resume else "w", encoding="utf-8")
+
+    def _load(self):
+        """Replay the records of the journal file, if it exists."""
+        if not os.path.exists(self.journal_path):
+            logger.warning(f"No checkpoint journal at {self.journal_path}, starting from scratch")
+            return
+
+        complete_length = 0
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Ignoring incomplete record in checkpoint journal {self.journal_path}")
+                    continue
+                if not line.endswith(b"\n"):
+                    continue
+                complete_length = f.tell()
+
+                if record["status"] == "written":
+                    if record["id"] in self._records:
+                        self._records[record["id"]]["status"] = "written"
+                else:
+                    self._records[record["id"]] = record
+
+        # Drop a record torn by a crash, so new records start on a line of their own
+        if complete_length < os.path.getsize(self.journal_path):
+            os.truncate(self.journal_path, complete_length)
+
+        written = sum(1 for record in self._records.values() if record["status"] == "written")
+        cost = sum(record.get("cost", 0.0) for record in self._records.values())
+        logger.info(
+            f"Resuming from {self.journal_path}: {written} components written and "
+            f"{len(self._records) - written} generated but not written (${cost:.6f} already spent)"
+        )
+
+    def _append(self, record: Dict[str, Any]):
+        """Append a record and make sure it reaches the disk."""
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def lookup(self, component: CodeComponent) -> Optional[Dict[str, Any]]:
+        """
+        Get the journal record of a component, if its code is unchanged.
+
+        Args:
+            component: The component to look up.
+
+        Returns:
+            The record with "status" ("generated" or "written") and "docstring", or None.
+        """
+        record = self._records.get(component.id)
+        if record is None or record["source_hash"] != component_source_hash(component):
+            return None
+        return record
+
+    def record_generated(self, component: CodeComponent, docstring: str, usage: Dict[str, float]):
+        """
+        Record a docstring that was generated but not written yet.
+
+        Args:
+            component: The component the docstring belongs to.
+            docstring: The generated docstring.
+            usage: Tokens and cost spent on the docstring, see generate_and_measure.
+        """
+        record = {
+            "id": component.id,
+            "status": "generated",
+            "source_hash": component_source_hash(component),
+            "docstring": docstring,
+            **usage
+        }
+        self._records[component.id] = record
+        self._append(record)
+
+    def record_written(self, component_id: str):
+        """
+        Record that a component's docstring was written to its file.
+
+        Args:
+            component_id: ID of the component.
+        """
+        # Docstrings that didn't come from the LLM (placeholder mode) aren't journaled
+        if component_id in self._records:
+            self._records[component_id]["status"] = "written"
+            self._append({"id": component_id, "status": "written"})
+
+    def close(self):
+        """Close the journal file."""
+        self._file.close()
@@ -0,0 +1,353 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates
+"""
+Offline estimate of the tokens, cost and time a docstring generation run will take.
+
+Nothing is sent to an LLM. Prompt sizes come from the agents' own prompts and the
+focal components, counted with the same tiktoken encoding the generation uses. What
+the LLMs would answer is replaced by the assumptions of EstimateAssumptions: how
+often the Reader asks for more context and the Verifier rejects a docstring, how
+long the responses are and how fast they are produced. The Reader/Searcher and
+Writer/Verifier rounds are then bounded by the flow_control limits, the context by
+max_input_tokens, and the throughput by the rate_limits of each provider.
+"""
+
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, List, Optional, Tuple
+
+from .llm.tokenizer import get_tokenizer
+from .writer import Writer
+
+
+@dataclass
+class EstimateAssumptions:
+    """Assumed LLM behavior, which can only be known by calling the LLMs."""
+
+    search_probability: float = 0.5  # Chance that the Reader asks for more context in a round
+    rejection_probability: float = 0.3  # Chance that the Verifier rejects a docstring
+    context_tokens_per_search: int = 1500  # Context added by one search, before the context cap
+    reader_output_tokens: int = 300
+    writer_output_tokens: int = 400
+    verifier_output_tokens: int = 150
+    request_latency: float = 2.0  # Seconds before a response starts
+    output_tokens_per_second: float = 50.0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "EstimateAssumptions":
+        """Create the assumptions, overridden by the optional estimate section of the config.
+
+        Args:
+            config: The loaded configuration file
+
+        Returns:
+            The assumptions to estimate with
+        """
+        overrides = config.get("estimate") or {}
+        known = {f.name for f in fields(cls)}
+        return cls(**{key: value for key, value in overrides.items() if key in known})
+
+
+@dataclass
+class UsageEstimate:
+    """Requests and tokens an agent is expected to spend."""
+
+    requests: float = 0.0
+    input_tokens: float = 0.0
+    output_tokens: float = 0.0
+
+    def add(self, other: "UsageEstimate", weight: float = 1.0) -> None:
+        """Add the usage of another estimate, scaled by a weight.
+
+        Args:
+            other: The usage to add
+            weight: Factor applied to the added usage (e.g. its probability)
+        """
+        self.requests += weight * other.requests
+        self.input_tokens += weight * other.input_tokens
+        self.output_tokens += weight * other.output_tokens
+
+
+@dataclass
+class RunEstimate:
+    """Expected and worst-case usage, cost and duration of a run."""
+
+    num_components: int
+    concurrency: int
+    usage: Dict[str, UsageEstimate]
+    cost: float
+    minutes: float
+    bottleneck: str
+    worst_case_usage: Dict[str, UsageEstimate]
+    worst_case_cost: float
+    worst_case_minutes: float
+    assumptions: EstimateAssumptions = field(default_factory=EstimateAssumptions)
+
+    def print_report(self) -> None:
+        """Print the estimate."""
+        print(f"\nEstimate for {self.num_components} components at concurrency {self.concurrency} (no LLM calls made):")
+        for agent_name, usage in self.usage.items():
+            print(
+                f"  {agent_name}: {usage.requests:.0f} requests, "
+                f"{usage.input_tokens:,.0f} input tokens, {usage.output_tokens:,.0f} output tokens"
+            )
+        input_tokens = sum(usage.input_tokens for usage in self.usage.values())
+        output_tokens = sum(usage.output_tokens for usage in self.usage.values())
+        print(f"  Expected tokens: {input_tokens:,.0f} input / {output_tokens:,.0f} output")
+        print(f"  Expected cost: ${self.cost:.2f}")
+        print(f"  Expected time: {self.minutes:.1f} minutes (limited by {self.bottleneck})")
+
+        worst_input = sum(usage.input_tokens for usage in self.worst_case_usage.values())
+        worst_output = sum(usage.output_tokens for usage in self.worst_case_usage.values())
+        print(
+            f"  Worst case (every search and rejection allowed by flow_control): "
+            f"{worst_input:,.0f} input / {worst_output:,.0f} output tokens, "
+            f"${self.worst_case_cost:.2f}, {self.worst_case_minutes:.1f} minutes"
+        )
+        print(
+            f"  Assuming: search probability {self.assumptions.search_probability}, "
+            f"rejection probability {self.assumptions.rejection_probability}, "
+            f"{self.assumptions.context_tokens_per_search} context tokens per search "
+            f"(override in the estimate section of the config)"
+        )
+
+
+def _round_distribution(probability: float, max_rounds: int) -> List[Tuple[int, float]]:
+    """Get the distribution of the number of extra rounds of an agent loop.
+
+    Every round asks for another one with the given probability, up to max_rounds.
+
+    Args:
+        probability: Chance that a round asks for another one
+        max_rounds: Maximum number of extra rounds
+
+    Returns:
+        List of (number of extra rounds, probability)
+    """
+    distribution = [(rounds, probability ** rounds * (1 - probability)) for rounds in range(max_rounds)]
+    distribution.append((max_rounds, probability ** max_rounds))
+    return distribution
+
+
+class CostEstimator:
+    """Estimates the LLM usage of docstring generation with an orchestrator's agents."""
+
+    def __init__(self, orchestrator: Any, assumptions: Optional[EstimateAssumptions] = None):
+        """Initialize the estimator and count the fixed part of every agent's prompts.
+
+        Args:
+            orchestrator: The orchestrator whose agents, flow control and context cap are modeled
+            assumptions: Assumed LLM behavior; read from the config if not given
+        """
+        self.orchestrator = orchestrator
+        self.assumptions = assumptions or EstimateAssumptions.from_config(orchestrator.config)
+        self.tokenizer = get_tokenizer("cl100k_base")
+        self.max_input_tokens = orchestrator.config.get("max_input_tokens", 10000)
+
+        reader = orchestrator.reader
+        writer = orchestrator.writer
+        verifier = orchestrator.verifier
+
+        # Prompt tokens besides the focal component, the context and earlier responses
+        self.reader_overhead = self._count(reader.system_prompt) + self._count(reader._task_description("", ""))
+        self.verifier_overhead = self._count(verifier.system_prompt) + self._count(verifier._task_description("", "", ""))
+        function_overhead = self._count(writer.base_prompt) + self._count(writer._task_description("", ""))
+        self.writer_overhead = {
+            False: function_overhead,
+            True: function_overhead - self._count(writer.function_prompt) + self._count(writer.class_prompt)
+        }
+
+    def _count(self, text: str) -> int:
+        """Count the tokens of a text."""
+        return self.tokenizer.count(text)
+
+    def _component_usage(self, focal_tokens: int, token_consume_focal: int, is_class: bool,
+                         searches: int, rejections: int) -> Dict[str, UsageEstimate]:
+        """Compute the usage of one component for a given number of searches and rejections.
+
+        Args:
+            focal_tokens: Tokens of the focal component as sent to the agents
+            token_consume_focal: Tokens of the untruncated focal component, used for the context cap
+            is_class: Whether the component is a class
+            searches: Number of Searcher rounds
+            rejections: Number of Verifier rejections
+
+        Returns:
+            Usage per agent name
+        """
+        a = self.assumptions
+        context_cap = max(0, self.max_input_tokens - token_consume_focal)
+
+        # Every Reader round after a search sees the context twice: in its refreshed memory and in the task
+        reader = UsageEstimate()
+        for search in range(searches + 1):
+            context = min(search * a.context_tokens_per_search, context_cap)
+            reader.add(UsageEstimate(1, self.reader_overhead + focal_tokens + 2 * context, a.reader_output_tokens))
+
+        # Every revision adds the rejected docstring and the suggestion to the Writer's memory
+        context = min(searches * a.context_tokens_per_search, context_cap)
+        writer = UsageEstimate()
+        verifier = UsageEstimate()
+        for revision in range(rejections + 1):
+            history = revision * (a.writer_output_tokens + a.verifier_output_tokens)
+            writer.add(UsageEstimate(1, self.writer_overhead[is_class] + focal_tokens + context + history,
+                                     a.writer_output_tokens))
+            verifier.add(UsageEstimate(1, self.verifier_overhead + focal_tokens + context + a.writer_output_tokens,
+                                       a.verifier_output_tokens))
+
+        return {"Reader": reader, "Writer": writer, "Verifier": verifier}
+
+    def _latency(self, usage: Dict[str, UsageEstimate]) -> float:
+        """Compute the seconds the sequential requests of one component take."""
+        a = self.assumptions
+        requests = sum(agent_usage.requests for agent_usage in usage.values())
+        output_tokens = sum(agent_usage.output_tokens for agent_usage in usage.values())
+        return requests * a.request_latency + output_tokens / a.output_tokens_per_second
+
+    def _cost(self, usage: Dict[str, UsageEstimate]) -> float:
+        """Compute the cost of the usage with each agent's token prices."""
+        cost = 0.0
+        for agent_name, agent_usage in usage.items():
+            prices = getattr(getattr(self.orchestrator, agent_name.lower()).llm, "prices", None)
+            if prices:
+                cost += prices.cost(agent_usage.input_tokens, agent_usage.output_tokens)
+        return cost
+
+    def _quota_minutes(self, usage: Dict[str, UsageEstimate]) -> Tuple[float, str]:
+        """Compute the minutes the rate limits need to let the usage through.
+
+        Agents using the same API key share one rate limiter and its quota. The actual
+        output counts against the output token quota. On top of that, the limiter admits
+        a request only once max_output_tokens of output fit in the bucket and holds them
+        until the request is done. With many requests in flight these reserves fill the
+        bucket, so the reserve held over each request's latency bounds the run as well.
+
+        Args:
+            usage: Usage per agent name
+
+        Returns:
+            Tuple of (minutes, provider whose quota takes longest)
+        """
+        providers: Dict[int, Dict[str, Any]] = {}
+        for agent_name, agent_usage in usage.items():
+            agent = getattr(self.orchestrator, agent_name.lower())
+            limiter = getattr(agent.llm, "rate_limiter", None)
+            if limiter is None:
+                continue
+            provider = providers.setdefault(
+                id(limiter), {"limiter": limiter, "usage": UsageEstimate(), "reserved_seconds": 0.0}
+            )
+            provider["usage"].add(agent_usage)
+            # Output tokens held by the agent's requests times the seconds they are held
+            reserve = min(agent.llm_params["max_output_tokens"], limiter.output_token_bucket.capacity)
+            provider["reserved_seconds"] += reserve * self._latency({agent_name: agent_usage})
+
+        minutes, bottleneck = 0.0, "request latency"
+        for provider in providers.values():
+            limiter, provider_usage = provider["limiter"], provider["usage"]
+            if not provider_usage.requests:
+                continue
+            provider_minutes = max(
+                provider_usage.requests / limiter.requests_per_minute,
+                provider_usage.input_tokens / limiter.input_tokens_per_minute,
+                provider_usage.output_tokens / limiter.output_tokens_per_minute
+            )
+            if provider_minutes > minutes:
+                minutes, bottleneck = provider_minutes, f"{limiter.provider} rate limits"
+            # The bucket holds at most its capacity in reserves at any time
+            reserve_minutes = provider["reserved_seconds"] / limiter.output_tokens_per_minute / 60
+            if reserve_minutes > minutes:
+                minutes, bottleneck = reserve_minutes, f"{limiter.provider} output tokens reserved for max_output_tokens"
+        return minutes, bottleneck
+
+    @staticmethod
+    def _latency_minutes(latencies: Dict[str, float], concurrency: int,
+                         levels: Optional[List[List[str]]]) -> float:
+        """Compute the minutes the components take when only request latency limits them.
+
+        A component starts once its dependencies are done, so each dependency level takes
+        at least as long as its slowest component and its share of the concurrency.
+
+        Args:
+            latencies: Seconds per component ID
+            concurrency: Number of components generated at the same time
+            levels: Dependency levels, or None if components don't wait for their dependencies
+
+        Returns:
+            Minutes the run takes
+        """
+        if levels is None:
+            levels = [list(latencies)]
+
+        seconds = 0.0
+        for level in levels:
+            level_latencies = [latencies[component_id] for component_id in level if component_id in latencies]
+            if level_latencies:
+                seconds += max(max(level_latencies), sum(level_latencies) / concurrency)
+        return seconds / 60
+
+    def estimate(self, focal_components: Dict[str, Tuple[str, int]], concurrency: int = 1,
+                 levels: Optional[List[List[str]]] = None) -> RunEstimate:
+        """Estimate the usage, cost and duration of generating docstrings for the components.
+
+        Args:
+            focal_components: Component ID -> (code sent to the agents, token count of the untruncated code)
+            concurrency: Number of components generated at the same time
+            levels: Dependency levels (see dependency_levels), or None if components don't
+                    wait for their dependencies
+
+        Returns:
+            The expected and worst-case estimate
+        """
+        a = self.assumptions
+        max_searches = self.orchestrator.max_reader_search_attempts
+        max_rejections = self.orchestrator.max_verifier_rejections
+        search_distribution = _round_distribution(a.search_probability, max_searches)
+        rejection_distribution = _round_distribution(a.rejection_probability, max_rejections)
+
+        usage = {name: UsageEstimate() for name in ("Reader", "Writer", "Verifier")}
+        worst_case_usage = {name: UsageEstimate() for name in usage}
+        latencies: Dict[str, float] = {}
+        worst_case_latencies: Dict[str, float] = {}
+
+        for component_id, (component_code, token_consume_focal) in focal_components.items():
+            focal_tokens = self._count(component_code)
+            is_class = Writer.is_class_component(component_code)
+
+            latencies[component_id] = 0.0
+            for searches, search_probability in search_distribution:
+                for rejections, rejection_probability in rejection_distribution:
+                    probability = search_probability * rejection_probability
+                    component_usage = self._component_usage(
+                        focal_tokens, token_consume_focal, is_class, searches, rejections
+                    )
+                    for name, agent_usage in component_usage.items():
+                        usage[name].add(agent_usage, probability)
+                    latencies[component_id] += probability * self._latency(component_usage)
+
+            component_usage = self._component_usage(
+                focal_tokens, token_consume_focal, is_class, max_searches, max_rejections
+            )
+            for name, agent_usage in component_usage.items():
+                worst_case_usage[name].add(agent_usage)
+            worst_case_latencies[component_id] = self._latency(component_usage)
+
+        quota_minutes, bottleneck = self._quota_minutes(usage)
+        latency_minutes = self._latency_minutes(latencies, concurrency, levels)
+        if latency_minutes >= quota_minutes:
+            bottleneck = "request latency"
+        worst_case_minutes = max(
+            self._quota_minutes(worst_case_usage)[0],
+            self._latency_minutes(worst_case_latencies, concurrency, levels)
+        )
+
+        return RunEstimate(
+            num_components=len(focal_components),
+            concurrency=concurrency,
+            usage=usage,
+            cost=self._cost(usage),
+            minutes=max(latency_minutes, quota_minutes),
+            bottleneck=bottleneck,
+            worst_case_usage=worst_case_usage,
+            worst_case_cost=self._cost(worst_case_usage),
+            worst_case_minutes=worst_case_minutes,
+            assumptions=a
+        )
@@ -4,6 +4,7 @@ from .openai_llm import OpenAILLM
 from .claude_llm import ClaudeLLM
 from .huggingface_llm import HuggingFaceLLM
 from .gemini_llm import GeminiLLM
+from .replay_llm import ReplayLLM
 from .factory import LLMFactory
 
 __all__ = [
@@ -12,5 +13,6 @@ __all__ = [
     'ClaudeLLM',
     'HuggingFaceLLM',
     'GeminiLLM',
+    'ReplayLLM',
     'LLMFactory'
 ] 
\ No newline at end of file
@@ -1,6 +1,27 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates
+import asyncio
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
+from dataclasses import dataclass
+from typing import List, Dict, Any, Hashable, Optional
+
+
+@dataclass
+class BatchRequest:
+    """One request of a batch job."""
+    custom_id: str
+    messages: List[Dict[str, str]]
+    temperature: float
+    max_tokens: Optional[int]
+
+
+@dataclass
+class BatchResult:
+    """The outcome of one request of a batch job."""
+    text: Optional[str] = None
+    input_tokens: int = 0
+    output_tokens: int = 0
+    error: Optional[str] = None
+
 
 class BaseLLM(ABC):
     """Base class for LLM wrappers."""
@@ -24,6 +45,73 @@ class BaseLLM(ABC):
         """
         pass
     
+    async def agenerate(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None
+    ) -> str:
+        """Generate a response from the LLM without blocking the event loop.
+        
+        Wrappers with an async client override this; the default runs
+        generate() in a worker thread.
+        
+        Args:
+            messages: List of message dictionaries with 'role' and 'content' keys
+            temperature: Sampling temperature (0.0 to 1.0)
+            max_tokens: Maximum number of tokens to generate
+            
+        Returns:
+            The generated response text
+        """
+        return await asyncio.to_thread(
+            self.generate,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+    
+    @property
+    def supports_batch(self) -> bool:
+        """Whether the provider has a batch API, i.e. submit_batch and poll_batch are implemented."""
+        return type(self).submit_batch is not BaseLLM.submit_batch
+    
+    @property
+    def batch_key(self) -> Hashable:
+        """Key of the batch jobs this LLM's requests can share with other instances."""
+        return id(self)
+    
+    def submit_batch(self, requests: List[BatchRequest]) -> str:
+        """Submit requests as one batch job of the provider's batch API.
+        
+        Args:
+            requests: The requests, with custom IDs unique within the batch
+            
+        Returns:
+            The ID of the batch job
+        """
+        raise NotImplementedError(f"{type(self).__name__} has no batch API")
+    
+    def poll_batch(self, batch_id: str) -> Optional[Dict[str, BatchResult]]:
+        """Check whether a batch job has ended and get its results.
+        
+        Args:
+            batch_id: ID returned by submit_batch
+            
+        Returns:
+            The results by custom ID once the job has ended, or None while it is running.
+            Requests missing from the results have failed.
+        """
+        raise NotImplementedError(f"{type(self).__name__} has no batch API")
+    
+    def record_batch_usage(self, result: BatchResult) -> None:
+        """Record the tokens and cost of a request answered by a batch job.
+        
+        Args:
+            result: The result of the request
+        """
+        pass
+    
     @abstractmethod
     def format_message(self, role: str, content: str) -> Dict[str, str]:
         """Format a message for the specific LLM API.
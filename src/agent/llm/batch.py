@@ -0,0 +1,196 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates
+"""
+Collection of concurrent LLM requests into provider batch jobs.
+
+Batch APIs answer requests within hours at half the price, which suits offline runs
+where latency doesn't matter. Many component pipelines run concurrently on one event
+loop; every request they make is held back until all of them are waiting for an
+answer or done, and the held requests are then submitted together, one batch job per
+provider account and model. The pipelines therefore advance in lockstep: the first
+job holds the Reader calls of every component, the next the calls that follow them.
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Any, Awaitable, Dict, List, Optional, Set, Tuple
+
+from .base import BaseLLM, BatchRequest, BatchResult
+
+logger = logging.getLogger("LLMBatch")
+
+
+class BatchCollector:
+    """Holds the requests of concurrent pipelines and submits them as batch jobs."""
+
+    def __init__(self, poll_interval: float = 30.0):
+        """
+        Initialize the collector.
+
+        Args:
+            poll_interval: Seconds between checks of a submitted batch job
+        """
+        self.poll_interval = poll_interval
+        self._active = 0
+        self._pending: List[Tuple[BaseLLM, BatchRequest, asyncio.Future]] = []
+        self._jobs: Set[asyncio.Task] = set()
+
+        # Statistics
+        self.batches = 0
+        self.requests = 0
+
+    def run(self, coroutine: Awaitable[Any]) -> Awaitable[Any]:
+        """
+        Run a pipeline whose requests are collected; requests are only submitted once
+        every running pipeline is waiting.
+
+        The pipeline counts as running from this call on, not from when its task starts,
+        so the first pipeline of a gather doesn't submit its request on its own.
+
+        Args:
+            coroutine: The pipeline
+
+        Returns:
+            Awaitable with the result of the pipeline, which must be awaited
+        """
+        self._active += 1
+        return self._run(coroutine)
+
+    async def _run(self, coroutine: Awaitable[Any]) -> Any:
+        """Await a pipeline counted by run and stop counting it when it is done."""
+        try:
+            return await coroutine
+        finally:
+            self._active -= 1
+            self._submit_if_all_waiting()
+
+    async def request(self, llm: BaseLLM, messages: List[Dict[str, str]], temperature: float,
+                      max_tokens: Optional[int]) -> BatchResult:
+        """
+        Queue a request and wait for the batch job that answers it.
+
+        Args:
+            llm: The LLM whose batch API answers the request
+            messages: List of message dictionaries
+            temperature: Sampling temperature
+            max_tokens: Maximum tokens to generate
+
+        Returns:
+            The result of the request
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((llm, BatchRequest("", messages, temperature, max_tokens), future))
+        self._submit_if_all_waiting()
+        return await future
+
+    def _submit_if_all_waiting(self) -> None:
+        """Submit the held requests once no running pipeline can add another one."""
+        if not self._pending or len(self._pending) < self._active:
+            return
+
+        pending, self._pending = self._pending, []
+        groups = defaultdict(list)
+        for llm, request, future in pending:
+            groups[llm.batch_key].append((llm, request, future))
+
+        for items in groups.values():
+            job = asyncio.create_task(self._run_job(items))
+            # Keep a reference, the event loop only keeps weak ones
+            self._jobs.add(job)
+            job.add_done_callback(self._jobs.discard)
+
+    async def _run_job(self, items: List[Tuple[BaseLLM, BatchRequest, asyncio.Future]]) -> None:
+        """Submit one batch job, wait until it has ended and hand out its results."""
+        llm = items[0][0]
+        for i, (_, request, _) in enumerate(items):
+            request.custom_id = f"request-{i}"
+
+        try:
+            batch_id = await asyncio.to_thread(llm.submit_batch, [request for _, request, _ in items])
+            self.batches += 1
+            self.requests += len(items)
+            logger.info(f"Submitted batch job {batch_id} with {len(items)} requests")
+
+            while True:
+                results = await asyncio.to_thread(llm.poll_batch, batch_id)
+                if results is not None:
+                    break
+                await asyncio.sleep(self.poll_interval)
+            logger.info(f"Batch job {batch_id} has ended")
+        except Exception as e:
+            for _, _, future in items:
+                future.set_exception(e)
+            return
+
+        for _, request, future in items:
+            future.set_result(results.get(request.custom_id) or BatchResult(error="missing from the batch results"))
+
+
+class BatchingLLM(BaseLLM):
+    """
+    Wrapper that answers the async requests of an LLM through a BatchCollector.
+
+    Synchronous requests and LLMs without a batch API are passed through unchanged;
+    all other attributes are those of the wrapped LLM.
+    """
+
+    def __init__(self, llm: BaseLLM, collector: BatchCollector):
+        """
+        Wrap an LLM.
+
+        Args:
+            llm: The LLM to wrap
+            collector: The collector of the pipelines using the LLM
+        """
+        self.llm = llm
+        self.collector = collector
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for attributes the wrapper doesn't have itself
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    def generate(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None
+    ) -> str:
+        """Generate a response right away with the wrapped LLM, see BaseLLM.generate."""
+        return self.llm.generate(messages=messages, temperature=temperature, max_tokens=max_tokens)
+
+    async def agenerate(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None
+    ) -> str:
+        """
+        Generate a response through the next batch job.
+
+        Args:
+            messages: List of message dictionaries with 'role' and 'content' keys
+            temperature: Sampling temperature (0.0 to 1.0)
+            max_tokens: Maximum number of tokens to generate
+
+        Returns:
+            The generated response text
+
+        Raises:
+            RuntimeError: If the request failed in the batch job
+        """
+        if not self.llm.supports_batch:
+            return await self.llm.agenerate(messages=messages, temperature=temperature, max_tokens=max_tokens)
+
+        result = await self.collector.request(self.llm, messages, temperature, max_tokens)
+        if result.error is not None:
+            raise RuntimeError(f"Batch request failed: {result.error}")
+
+        # Recorded by the pipeline itself, so its usage tracker counts the request
+        self.llm.record_batch_usage(result)
+        return result.text
+
+    def format_message(self, role: str, content: str) -> Dict[str, str]:
+        """Format a message for the wrapped LLM, see BaseLLM.format_message."""
+        return self.llm.format_message(role, content)
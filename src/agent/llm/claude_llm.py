@@ -1,9 +1,10 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates
-from typing import List, Dict, Any, Optional
-import anthropic
-from .base import BaseLLM
-from .rate_limiter import RateLimiter
-import logging
+from typing import Hashable, List, Dict, Any, Optional, Tuple
+from .base import BaseLLM, BatchRequest, BatchResult
+from .http_clients import get_async_client, get_client
+from .retry import RetryPolicy, acall_with_retries, call_with_retries
+from .rate_limiter import Reservation, TokenPrices, get_rate_limiter
+from .tokenizer import CalibratedTokenEstimator, get_tokenizer
 
 class ClaudeLLM(BaseLLM):
     """Anthropic Claude API wrapper."""
@@ -12,7 +13,10 @@ class ClaudeLLM(BaseLLM):
         self,
         api_key: str,
         model: str,
-        rate_limits: Optional[Dict[str, Any]] = None
+        rate_limits: Optional[Dict[str, Any]] = None,
+        rate_limiter_config: Optional[Dict[str, Any]] = None,
+        retry_config: Optional[Dict[str, Any]] = None,
+        http_client_config: Optional[Dict[str, Any]] = None
     ):
         """Initialize Claude LLM.
         
@@ -20,9 +24,24 @@ class ClaudeLLM(BaseLLM):
             api_key: Anthropic API key
             model: Model identifier (e.g., "claude-3-sonnet-20240229")
             rate_limits: Optional dictionary with rate limit settings
+            rate_limiter_config: Optional rate_limiter section of the config, selecting
+                                 where the rate limiter keeps its state
+            retry_config: Optional retry section of the config, see RetryPolicy
+            http_client_config: Optional http_client section of the config, sizing the
+                                connection pool of the shared clients
         """
-        self.client = anthropic.Anthropic(api_key=api_key)
+        # Clients and their connection pools are shared with all other agents using the
+        # same key. Failed calls are retried by call_with_retries, which follows the rate
+        # limiter; the clients' own retries would not, so they are turned off
+        self.api_key = api_key
+        self.http_client_config = http_client_config
+        self.client = get_client("anthropic", api_key, http_config=http_client_config)
         self.model = model
+        self.retry_policy = RetryPolicy(**(retry_config or {}))
+        
+        # Claude's tokenizer isn't available locally; estimate counts from cl100k_base,
+        # calibrated with the usage reported in every response (~10 tokens of formatting per message)
+        self.token_estimator = CalibratedTokenEstimator(get_tokenizer("cl100k_base"), tokens_per_message=10)
         
         # Default rate limits for Claude 3.7 Sonnet
         default_limits = {
@@ -36,141 +55,226 @@ class ClaudeLLM(BaseLLM):
         # Use provided rate limits or defaults
         limits = rate_limits or default_limits
         
-        # Initialize rate limiter
-        self.rate_limiter = RateLimiter(
+        # Share the rate limiter of the account with all other agents using the same key
+        self.rate_limiter = get_rate_limiter(
             provider="Claude",
+            api_key=api_key,
+            backend=rate_limiter_config,
             requests_per_minute=limits.get("requests_per_minute", default_limits["requests_per_minute"]),
             input_tokens_per_minute=limits.get("input_tokens_per_minute", default_limits["input_tokens_per_minute"]),
-            output_tokens_per_minute=limits.get("output_tokens_per_minute", default_limits["output_tokens_per_minute"]),
-            input_token_price_per_million=limits.get("input_token_price_per_million", default_limits["input_token_price_per_million"]),
-            output_token_price_per_million=limits.get("output_token_price_per_million", default_limits["output_token_price_per_million"])
+            output_tokens_per_minute=limits.get("output_tokens_per_minute", default_limits["output_tokens_per_minute"])
+        )
+        
+        # Prices of this model; other models may share the limiter at other prices
+        self.prices = TokenPrices.per_million(
+            limits.get("input_token_price_per_million", default_limits["input_token_price_per_million"]),
+            limits.get("output_token_price_per_million", default_limits["output_token_price_per_million"])
         )
     
+    @property
+    def async_client(self) -> Any:
+        """The shared async client of the running event loop."""
+        return get_async_client("anthropic", self.api_key, http_config=self.http_client_config)
+    
     def _count_tokens(self, text: str) -> int:
-        """Count tokens in a string using Claude's tokenizer.
+        """Estimate the tokens of a string locally, without calling the API.
         
         Args:
             text: Text to count tokens for
             
         Returns:
-            Token count
+            Estimated Claude token count
         """
-        if not text:
-            return 0
-            
-        try:
-            # Format text as a message for token counting
-            count = self.client.beta.messages.count_tokens(
-                model=self.model,
-                messages=[
-                    {"role": "user", "content": text}
-                ]
-            )
-            return count.input_tokens
-        except Exception as e:
-            # Log the error but don't fail
-            logging.warning(f"Failed to count tokens with Claude tokenizer: {e}")
-            # Fallback: rough estimate if tokenizer fails
-            return len(text.split()) * 1.3
+        return self.token_estimator.estimate_text(text)
     
-    def _count_messages_tokens(self, messages: List[Dict[str, str]], system_message: Optional[str] = None) -> int:
-        """Count tokens in message list with optional system message.
+    def _record_usage(self, response: Any, local_tokens: int, reservation: Reservation, result_text: str) -> None:
+        """Record a request in the rate limiter with the usage Claude reported for it.
+        
+        Args:
+            response: The API response
+            local_tokens: Local token count of the request's messages
+            reservation: Rate limiter reservation the request was admitted with
+            result_text: The generated text
+        """
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            # Exact counts, which also calibrate the estimates of the next requests
+            self.token_estimator.calibrate(local_tokens, usage.input_tokens)
+            self.rate_limiter.record_request(usage.input_tokens, usage.output_tokens, reservation,
+                                             model=self.model, prices=self.prices)
+        else:
+            self.rate_limiter.record_request(reservation.input_tokens, self._count_tokens(result_text), reservation,
+                                             model=self.model, prices=self.prices)
+    
+    def generate(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: Optional[int]
+    ) -> str:
+        """Generate a response using Claude API with rate limiting.
         
         Args:
             messages: List of message dictionaries
-            system_message: Optional system message
+            temperature: Sampling temperature
+            max_output_tokens: Maximum tokens to generate
             
         Returns:
-            Total token count
+            Generated response text
         """
-        if not messages:
-            return 0
-            
-        # Convert messages to Claude format
-        claude_messages = [self._convert_to_claude_message(msg) for msg in messages 
-                          if msg["role"] != "system"]
-        
-        # Format system message if provided
-        system_content = None
-        if system_message:
-            system_content = system_message
-        
-        try:
-            # Use the API to count tokens for all messages at once
-            count = self.client.beta.messages.count_tokens(
+        # Extract system message if present
+        system_message, chat_messages = self._split_messages(messages)
+        
+        # Estimate input tokens locally
+        local_tokens = self.token_estimator.count_local(messages)
+        input_tokens = self.token_estimator.estimate(local_tokens)
+        
+        # Wait if we're approaching rate limits (estimate output tokens as max_output_tokens)
+        reservation = self.rate_limiter.wait_if_needed(input_tokens, max_tokens)
+        
+        # Make the API call, retrying rate limit and server errors; the raw response
+        # has the rate limit headers
+        raw_response = call_with_retries(
+            lambda: self.client.messages.with_raw_response.create(
                 model=self.model,
-                messages=claude_messages,
-                system=system_content
-            )
-            return count.input_tokens
-        except Exception as e:
-            # Log the error but don't fail
-            logging.warning(f"Failed to count tokens with Claude tokenizer: {e}")
-            
-            # Fallback: count tokens individually
-            total_tokens = 0
-            for msg in claude_messages:
-                if "content" in msg and msg["content"]:
-                    total_tokens += self._count_tokens(msg["content"])
-            
-            # Add system message tokens if provided
-            if system_message:
-                total_tokens += self._count_tokens(system_message)
-                
-            # Add overhead for message formatting
-            total_tokens += 10 * len(claude_messages)  # Add ~10 tokens per message for formatting
-            
-            return total_tokens
+                messages=chat_messages,
+                system=system_message,
+                temperature=temperature,
+                max_tokens=max_tokens
+            ),
+            self.retry_policy,
+            rate_limiter=self.rate_limiter,
+            get_headers=lambda raw: raw.headers
+        )
+        response = raw_response.parse()
+        
+        result_text = response.content[0].text
+        
+        # Record the request with the token counts from the response
+        self._record_usage(response, local_tokens, reservation, result_text)
+        
+        return result_text
     
-    def generate(
+    async def agenerate(
         self,
         messages: List[Dict[str, str]],
         temperature: float,
         max_tokens: Optional[int]
     ) -> str:
-        """Generate a response using Claude API with rate limiting.
+        """Generate a response using the async Claude client with rate limiting.
         
         Args:
             messages: List of message dictionaries
             temperature: Sampling temperature
-            max_output_tokens: Maximum tokens to generate
+            max_tokens: Maximum tokens to generate
             
         Returns:
             Generated response text
         """
         # Extract system message if present
-        system_message = None
-        chat_messages = []
+        system_message, chat_messages = self._split_messages(messages)
         
-        for msg in messages:
-            if msg["role"] == "system":
-                system_message = msg["content"]
-            else:
-                chat_messages.append(self._convert_to_claude_message(msg))
+        # Estimate input tokens locally
+        local_tokens = self.token_estimator.count_local(messages)
+        input_tokens = self.token_estimator.estimate(local_tokens)
         
-        # Count input tokens
-        input_tokens = self._count_messages_tokens(messages, system_message)
+        # Wait without blocking the event loop if we're approaching rate limits
+        reservation = await self.rate_limiter.acquire(input_tokens, max_tokens)
         
-        # Wait if we're approaching rate limits (estimate output tokens as max_output_tokens)
-        self.rate_limiter.wait_if_needed(input_tokens, max_tokens)
-        
-        # Make the API call
-        response = self.client.messages.create(
-            model=self.model,
-            messages=chat_messages,
-            system=system_message,
-            temperature=temperature,
-            max_tokens=max_tokens
+        # Make the API call, retrying rate limit and server errors; the raw response
+        # has the rate limit headers
+        raw_response = await acall_with_retries(
+            lambda: self.async_client.messages.with_raw_response.create(
+                model=self.model,
+                messages=chat_messages,
+                system=system_message,
+                temperature=temperature,
+                max_tokens=max_tokens
+            ),
+            self.retry_policy,
+            rate_limiter=self.rate_limiter,
+            get_headers=lambda raw: raw.headers
         )
+        response = raw_response.parse()
         
         result_text = response.content[0].text
         
-        # Count output tokens and record request
-        output_tokens = self._count_tokens(result_text)
-        self.rate_limiter.record_request(input_tokens, output_tokens)
+        # Record the request with the token counts from the response
+        self._record_usage(response, local_tokens, reservation, result_text)
         
         return result_text
     
+    @property
+    def batch_key(self) -> Hashable:
+        """Requests of the same account and model share batch jobs."""
+        return ("Claude", self.api_key, self.model)
+    
+    def submit_batch(self, requests: List[BatchRequest]) -> str:
+        """Submit requests as a job of the Message Batches API.
+        
+        Args:
+            requests: The requests, with custom IDs unique within the batch
+            
+        Returns:
+            The ID of the batch job
+        """
+        batch_requests = []
+        for request in requests:
+            system_message, chat_messages = self._split_messages(request.messages)
+            params = {
+                "model": self.model,
+                "messages": chat_messages,
+                "temperature": request.temperature,
+                "max_tokens": request.max_tokens
+            }
+            if system_message is not None:
+                params["system"] = system_message
+            batch_requests.append({"custom_id": request.custom_id, "params": params})
+        
+        batch = call_with_retries(
+            lambda: self.client.messages.batches.create(requests=batch_requests),
+            self.retry_policy
+        )
+        return batch.id
+    
+    def poll_batch(self, batch_id: str) -> Optional[Dict[str, BatchResult]]:
+        """Check whether a job of the Message Batches API has ended and get its results.
+        
+        Args:
+            batch_id: ID returned by submit_batch
+            
+        Returns:
+            The results by custom ID once the job has ended, or None while it is running
+        """
+        batch = call_with_retries(lambda: self.client.messages.batches.retrieve(batch_id), self.retry_policy)
+        if batch.processing_status != "ended":
+            return None
+        
+        results = {}
+        entries = call_with_retries(lambda: list(self.client.messages.batches.results(batch_id)), self.retry_policy)
+        for entry in entries:
+            if entry.result.type == "succeeded":
+                message = entry.result.message
+                results[entry.custom_id] = BatchResult(
+                    text=message.content[0].text,
+                    input_tokens=message.usage.input_tokens,
+                    output_tokens=message.usage.output_tokens
+                )
+            else:
+                # errored, canceled or expired
+                error = getattr(entry.result, "error", None)
+                results[entry.custom_id] = BatchResult(error=str(error or entry.result.type))
+        return results
+    
+    def record_batch_usage(self, result: BatchResult) -> None:
+        """Record a request answered by a batch job at the batch price.
+        
+        Args:
+            result: The result of the request
+        """
+        self.rate_limiter.record_request(result.input_tokens, result.output_tokens, batch=True,
+                                         model=self.model, prices=self.prices)
+    
     def format_message(self, role: str, content: str) -> Dict[str, str]:
         """Format message for Claude API.
         
@@ -184,6 +288,26 @@ class ClaudeLLM(BaseLLM):
         # Store in standard format, conversion happens in generate()
         return {"role": role, "content": content}
     
+    def _split_messages(self, messages: List[Dict[str, str]]) -> Tuple[Optional[str], List[Dict[str, str]]]:
+        """Separate the system message, which Claude takes as a parameter, from the chat messages.
+        
+        Args:
+            messages: Standard format messages
+            
+        Returns:
+            Tuple of (the last system message or None, the other messages in Claude's format)
+        """
+        system_message = None
+        chat_messages = []
+        
+        for msg in messages:
+            if msg["role"] == "system":
+                system_message = msg["content"]
+            else:
+                chat_messages.append(self._convert_to_claude_message(msg))
+        
+        return system_message, chat_messages
+    
     def _convert_to_claude_message(self, message: Dict[str, str]) -> Dict[str, str]:
         """Convert standard message format to Claude's format.
         
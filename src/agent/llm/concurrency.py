@@ -0,0 +1,259 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates
+"""
+Adaptive limit of the requests in flight to a self-hosted inference server.
+
+vLLM batches all requests it has in flight on every decoding step, so throughput grows
+with the number of concurrent requests until the GPU is saturated; past that point
+every step gets slower and requests only queue up. The limiter keeps a window of
+requests in flight and sizes it from the measured latency per generated token. It
+starts small, so the latency of a lightly loaded server is measured, and doubles every
+round trip until the latency first degrades. From then on, the window grows by one
+request per round trip while the latency stays close to that of the lightly loaded
+server, and shrinks by a fraction once it degrades (additive increase, multiplicative
+decrease).
+"""
+
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger("ConcurrencyLimiter")
+
+
+class _Waiter:
+    """A caller waiting for a slot, woken by the caller releasing one."""
+
+    def __init__(self, wake: Callable[[], None]):
+        self.wake = wake
+        self.granted = False
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limits the requests in flight to a server, adapting the limit to its latency.
+
+    Slots are handed to waiting callers in arrival order, whether they are threads or
+    coroutines on any event loop. The lock is only held for bookkeeping.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 32,
+        min_in_flight: int = 1,
+        initial_in_flight: Optional[int] = None,
+        adaptive: bool = True,
+        latency_tolerance: float = 2.0,
+        backoff: float = 0.9,
+        smoothing: float = 0.2
+    ):
+        """
+        Initialize the limiter.
+
+        Args:
+            max_in_flight: Most requests in flight at once; the limit without adaptation
+            min_in_flight: Fewest requests the adaptive limit goes down to
+            initial_in_flight: Limit to start from, by default min_in_flight
+            adaptive: Whether to adapt the limit to the measured latency
+            latency_tolerance: Latency per token, relative to the lightly loaded latency,
+                               above which the limit shrinks
+            backoff: Factor the limit is multiplied with when it shrinks
+            smoothing: Weight of the newest latency in the running average
+        """
+        self.max_in_flight = max(1, max_in_flight)
+        self.min_in_flight = max(1, min(min_in_flight, self.max_in_flight))
+        self.adaptive = adaptive
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.smoothing = smoothing
+
+        if not adaptive:
+            initial_in_flight = self.max_in_flight
+        elif initial_in_flight is None:
+            initial_in_flight = self.min_in_flight
+        self._limit = float(max(self.min_in_flight, min(initial_in_flight, self.max_in_flight)))
+
+        self._in_flight = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._lock = threading.Lock()
+
+        # Seconds per generated token: lightly loaded latency and running average
+        self._base_latency: Optional[float] = None
+        self._latency: Optional[float] = None
+        # Completions since the limit last shrank; it shrinks at most once per round trip
+        self._since_backoff = 0
+        # Whether the latency hasn't degraded yet, so the limit grows exponentially
+        self._slow_start = True
+
+        # Statistics
+        self.requests = 0
+        self.max_seen_in_flight = 0
+
+    @property
+    def limit(self) -> int:
+        """The current number of requests allowed in flight."""
+        with self._lock:
+            return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        """The number of requests in flight."""
+        with self._lock:
+            return self._in_flight
+
+    def _take_slot(self) -> None:
+        """Count a request as in flight. Must be called with the lock held."""
+        self._in_flight += 1
+        self.max_seen_in_flight = max(self.max_seen_in_flight, self._in_flight)
+
+    def _try_acquire(self, wake: Callable[[], None]) -> Tuple[bool, Optional[_Waiter]]:
+        """
+        Take a slot if one is free and nobody is waiting, otherwise queue a waiter.
+
+        Returns:
+            Tuple of (True, None) if a slot was taken, or (False, the queued waiter)
+        """
+        with self._lock:
+            if not self._waiters and self._in_flight < int(self._limit):
+                self._take_slot()
+                return True, None
+            waiter = _Waiter(wake)
+            self._waiters.append(waiter)
+            return False, waiter
+
+    def acquire(self) -> None:
+        """Wait for a slot; every acquire must be followed by a release."""
+        event = threading.Event()
+        acquired, _ = self._try_acquire(event.set)
+        if not acquired:
+            event.wait()
+
+    async def aacquire(self) -> None:
+        """Async version of acquire that yields to the event loop while waiting."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake() -> None:
+            if not future.done():
+                future.set_result(None)
+
+        acquired, waiter = self._try_acquire(lambda: loop.call_soon_threadsafe(wake))
+        if acquired:
+            return
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted:
+                # The slot was handed over just before the cancellation
+                self.release()
+            raise
+
+    def release(self, latency: Optional[float] = None, output_tokens: int = 0, failed: bool = False) -> None:
+        """
+        Free the slot of a finished request and adapt the limit to its latency.
+
+        Args:
+            latency: Seconds the request took, or None if it wasn't measured
+            output_tokens: Tokens the request generated
+            failed: Whether the request failed, e.g. timed out or was refused by the server
+        """
+        with self._lock:
+            # The window was fully used if nobody else could have sent a request
+            saturated = self._in_flight >= int(self._limit)
+            self._in_flight -= 1
+            self.requests += 1
+            if self.adaptive:
+                self._adapt(latency, output_tokens, failed, saturated)
+
+            # Hand the free slots to the waiters in arrival order
+            while self._waiters and self._in_flight < int(self._limit):
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                self._take_slot()
+                try:
+                    waiter.wake()
+                except RuntimeError:
+                    # The event loop of the waiter is closed; it will never use the slot
+                    self._in_flight -= 1
+
+    def _adapt(self, latency: Optional[float], output_tokens: int, failed: bool, saturated: bool) -> None:
+        """Grow or shrink the limit after a completion. Must be called with the lock held."""
+        self._since_backoff += 1
+        if failed:
+            self._shrink()
+            return
+        if latency is None:
+            return
+
+        # Generating dominates the latency of a request, so it is compared per token
+        sample = latency / max(1, output_tokens)
+        if self._latency is None:
+            self._latency = sample
+        else:
+            self._latency += self.smoothing * (sample - self._latency)
+
+        # The lowest running average, which a single lucky request can't pull down
+        if self._base_latency is None or self._latency < self._base_latency:
+            self._base_latency = self._latency
+
+        if self._latency > self.latency_tolerance * self._base_latency:
+            if self._limit <= self.min_in_flight:
+                # Nothing is queued at the smallest window, so this is the latency of a
+                # lightly loaded server after all (a lucky early average, or the server changed)
+                self._base_latency = self._latency
+            self._shrink()
+        elif saturated:
+            # One more request per completion doubles the window every round trip, one
+            # more per round trip of the whole window grows it linearly
+            increase = 1 if self._slow_start else 1 / self._limit
+            self._limit = min(float(self.max_in_flight), self._limit + increase)
+
+    def _shrink(self) -> None:
+        """Shrink the limit, at most once per round trip. Must be called with the lock held."""
+        self._slow_start = False
+        if self._since_backoff < self._limit:
+            return
+        self._since_backoff = 0
+        limit = max(float(self.min_in_flight), self._limit * self.backoff)
+        if int(limit) < int(self._limit):
+            logger.info(f"Server latency degraded; reducing requests in flight to {int(limit)}")
+        self._limit = limit
+
+
+# Server key -> (limiter, settings it was created with)
+_limiters: Dict[Tuple[str, str], Tuple[AdaptiveConcurrencyLimiter, Dict[str, Any]]] = {}
+_registry_lock = threading.Lock()
+
+
+def get_concurrency_limiter(api_base: str, model: str, **settings) -> AdaptiveConcurrencyLimiter:
+    """
+    Get the shared concurrency limiter of a server and model, creating it on first use.
+
+    All agents sending requests to the same server must share one limiter, since they
+    share its GPU.
+
+    Args:
+        api_base: Base URL of the server
+        model: Model served
+        **settings: Settings, see AdaptiveConcurrencyLimiter; used when the limiter is created
+
+    Returns:
+        The concurrency limiter
+    """
+    key = (api_base, model)
+    with _registry_lock:
+        entry = _limiters.get(key)
+        if entry is None:
+            entry = (AdaptiveConcurrencyLimiter(**settings), settings)
+            _limiters[key] = entry
+
+    limiter, created_settings = entry
+    if settings != created_settings:
+        # Settings of a later agent can't change a limiter that is already in use
+        logger.warning(f"Ignoring different concurrency settings for {model} at {api_base}; the first ones configured apply")
+    return limiter
@@ -1,6 +1,8 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates
 from typing import Dict, Any, Optional
 from pathlib import Path
+import copy
+import threading
 import yaml
 
 from .base import BaseLLM
@@ -8,16 +10,23 @@ from .openai_llm import OpenAILLM
 from .claude_llm import ClaudeLLM
 from .huggingface_llm import HuggingFaceLLM
 from .gemini_llm import GeminiLLM
+from .replay_llm import ReplayLLM
+
+# Resolved config path -> parsed config, so every agent of the process reads the file once
+_configs: Dict[str, Dict[str, Any]] = {}
+_configs_lock = threading.Lock()
 
 class LLMFactory:
     """Factory class for creating LLM instances."""
     
     @staticmethod
-    def create_llm(config: Dict[str, Any]) -> BaseLLM:
+    def create_llm(config: Dict[str, Any], global_config: Optional[Dict[str, Any]] = None) -> BaseLLM:
         """Create an LLM instance based on configuration.
         
         Args:
             config: Configuration dictionary containing LLM settings
+            global_config: The whole configuration, with the sections shared by all LLMs.
+                           If None, the default configuration file is loaded.
             
         Returns:
             An instance of BaseLLM
@@ -36,7 +45,8 @@ class LLMFactory:
         rate_limits = config.get("rate_limits", {})
         
         # If not, check if there are global rate limits for this provider type
-        global_config = LLMFactory.load_config()
+        if global_config is None:
+            global_config = LLMFactory.load_config()
         if not rate_limits and "rate_limits" in global_config:
             # Map LLM types to provider names in rate_limits section
             provider_map = {
@@ -49,29 +59,70 @@ class LLMFactory:
             if provider_limits:
                 rate_limits = provider_limits
         
+        # Rate limiter backend: shared within this process, or with other processes
+        rate_limiter_config = config.get("rate_limiter") or global_config.get("rate_limiter")
+        
+        # Retries of rate limit and server errors
+        retry_config = config.get("retry") or global_config.get("retry")
+        
+        # Connection pools of the clients shared by all agents using the same key
+        http_client_config = config.get("http_client") or global_config.get("http_client")
+        
         if llm_type == "openai":
             return OpenAILLM(
                 api_key=config["api_key"],
                 model=model,
-                rate_limits=rate_limits
+                rate_limits=rate_limits,
+                rate_limiter_config=rate_limiter_config,
+                retry_config=retry_config,
+                http_client_config=http_client_config
             )
         elif llm_type == "claude":
             return ClaudeLLM(
                 api_key=config["api_key"],
                 model=model,
-                rate_limits=rate_limits
+                rate_limits=rate_limits,
+                rate_limiter_config=rate_limiter_config,
+                retry_config=retry_config,
+                http_client_config=http_client_config
             )
         elif llm_type == "gemini":
+            # The Gemini SDK manages its own connections
             return GeminiLLM(
                 api_key=config["api_key"],
                 model=model,
-                rate_limits=rate_limits
+                rate_limits=rate_limits,
+                rate_limiter_config=rate_limiter_config,
+                retry_config=retry_config
             )
         elif llm_type == "huggingface":
             return HuggingFaceLLM(
                 model_name=model,
+                api_base=config.get("api_base", "http://localhost:8000/v1"),
+                api_key=config.get("api_key", "EMPTY"),
                 device=config.get("device", "cuda"),
-                torch_dtype=config.get("torch_dtype", "float16")
+                torch_dtype=config.get("torch_dtype", "float16"),
+                max_input_tokens=config.get("max_input_tokens", 10000),
+                http_client_config=http_client_config,
+                concurrency_config=config.get("concurrency")
+            )
+        elif llm_type == "replay":
+            mode = config.get("mode", "replay")
+            recorded_config = config.get("recorded_llm") or {}
+            recorded_llm = None
+            if mode == "record" and recorded_config:
+                recorded_llm = LLMFactory.create_llm(recorded_config, global_config=global_config)
+            # Replayed usage is priced like the recorded provider
+            if not rate_limits and recorded_config.get("type"):
+                rate_limits = global_config.get("rate_limits", {}).get(recorded_config["type"].lower(), {})
+            return ReplayLLM(
+                model=model,
+                recording_path=config.get("recording", "output/llm_recording.jsonl"),
+                mode=mode,
+                recorded_llm=recorded_llm,
+                latency_config=config.get("latency"),
+                rate_limits=rate_limits,
+                on_miss=config.get("on_miss", "error")
             )
         else:
             raise ValueError(f"Unsupported LLM type: {llm_type}")
@@ -80,6 +131,9 @@ class LLMFactory:
     def load_config(config_path: Optional[str] = None) -> Dict[str, Any]:
         """Load LLM configuration from file.
         
+        The file is read once per process; later calls get a copy of the parsed
+        configuration, which callers may modify.
+        
         Args:
             config_path: Path to the configuration file. If None, uses default path.
             
@@ -92,10 +146,13 @@ class LLMFactory:
         if config_path is None:
             config_path = str(Path(__file__).parent.parent.parent.parent / "config" / "agent_config.yaml")
         
-        if not Path(config_path).exists():
-            raise FileNotFoundError(f"Configuration file not found: {config_path}")
-        
-        with open(config_path, 'r') as f:
-            config = yaml.safe_load(f)
-        
-        return config 
\ No newline at end of file
+        key = str(Path(config_path).resolve())
+        with _configs_lock:
+            if key not in _configs:
+                if not Path(config_path).exists():
+                    raise FileNotFoundError(f"Configuration file not found: {config_path}")
+                
+                with open(config_path, 'r') as f:
+                    _configs[key] = yaml.safe_load(f)
+            
+            return copy.deepcopy(_configs[key]) 
\ No newline at end of file
@@ -1,9 +1,10 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates
 from typing import List, Dict, Any, Optional
-import tiktoken
 import google.generativeai as genai
 from .base import BaseLLM
-from .rate_limiter import RateLimiter
+from .tokenizer import MessageTokenCounter, get_tokenizer
+from .retry import RetryPolicy, acall_with_retries, call_with_retries
+from .rate_limiter import TokenPrices, get_rate_limiter
 
 class GeminiLLM(BaseLLM):
     """Google Gemini API wrapper."""
@@ -12,7 +13,9 @@ class GeminiLLM(BaseLLM):
         self,
         api_key: str,
         model: str,
-        rate_limits: Optional[Dict[str, Any]] = None
+        rate_limits: Optional[Dict[str, Any]] = None,
+        rate_limiter_config: Optional[Dict[str, Any]] = None,
+        retry_config: Optional[Dict[str, Any]] = None
     ):
         """Initialize Gemini LLM.
         
@@ -20,19 +23,25 @@ class GeminiLLM(BaseLLM):
             api_key: Google API key
             model: Model identifier (e.g., "gemini-1.5-flash", "gemini-1.5-pro")
             rate_limits: Optional dictionary with rate limit settings
+            rate_limiter_config: Optional rate_limiter section of the config, selecting
+                                 where the rate limiter keeps its state
+            retry_config: Optional retry section of the config, see RetryPolicy
         """
         genai.configure(api_key=api_key)
         self.model_name = model
         self.model = genai.GenerativeModel(model)
+        self.retry_policy = RetryPolicy(**(retry_config or {}))
         
         try:
             # Initialize tokenizer for token counting
             # Gemini doesn't have a direct tokenizer in the public API
             # Using tiktoken cl100k_base as a reasonable approximation
-            self.tokenizer = tiktoken.get_encoding("cl100k_base")
+            self.tokenizer = get_tokenizer("cl100k_base")
+            self.message_counter = MessageTokenCounter(self.tokenizer, tokens_per_message=4)
         except:
             # Fallback to basic word counting if tokenizer fails
             self.tokenizer = None
+            self.message_counter = None
         
         # Default rate limits for Gemini (adjust based on actual API limits)
         default_limits = {
@@ -46,14 +55,20 @@ class GeminiLLM(BaseLLM):
         # Use provided rate limits or defaults
         limits = rate_limits or default_limits
         
-        # Initialize rate limiter
-        self.rate_limiter = RateLimiter(
+        # Share the rate limiter of the account with all other agents using the same key
+        self.rate_limiter = get_rate_limiter(
             provider="Gemini",
+            api_key=api_key,
+            backend=rate_limiter_config,
             requests_per_minute=limits.get("requests_per_minute", default_limits["requests_per_minute"]),
             input_tokens_per_minute=limits.get("input_tokens_per_minute", default_limits["input_tokens_per_minute"]),
-            output_tokens_per_minute=limits.get("output_tokens_per_minute", default_limits["output_tokens_per_minute"]),
-            input_token_price_per_million=limits.get("input_token_price_per_million", default_limits["input_token_price_per_million"]),
-            output_token_price_per_million=limits.get("output_token_price_per_million", default_limits["output_token_price_per_million"])
+            output_tokens_per_minute=limits.get("output_tokens_per_minute", default_limits["output_tokens_per_minute"])
+        )
+        
+        # Prices of this model; other models may share the limiter at other prices
+        self.prices = TokenPrices.per_million(
+            limits.get("input_token_price_per_million", default_limits["input_token_price_per_million"]),
+            limits.get("output_token_price_per_million", default_limits["output_token_price_per_million"])
         )
     
     def _count_tokens(self, text: str) -> int:
@@ -70,7 +85,7 @@ class GeminiLLM(BaseLLM):
             
         try:
             if self.tokenizer:
-                return len(self.tokenizer.encode(text))
+                return self.tokenizer.count(text)
             else:
                 # Fallback: rough estimate if tokenizer not available
                 return len(text.split()) * 1.3
@@ -92,6 +107,10 @@ class GeminiLLM(BaseLLM):
         """
         if not messages:
             return 0
+        
+        # Only the messages added since the last call are counted
+        if self.message_counter:
+            return self.message_counter.count(messages)
             
         total_tokens = 0
         
@@ -162,7 +181,7 @@ class GeminiLLM(BaseLLM):
         input_tokens = self._count_messages_tokens(messages)
         
         # Wait if we're approaching rate limits
-        self.rate_limiter.wait_if_needed(input_tokens, max_tokens if max_tokens else 1000)
+        reservation = self.rate_limiter.wait_if_needed(input_tokens, max_tokens if max_tokens else 1000)
         
         # Format messages for Gemini API
         gemini_messages = self._convert_messages_to_gemini_format(messages)
@@ -177,19 +196,96 @@ class GeminiLLM(BaseLLM):
                 history=history,
             )
             
-            # Send the last message to get a response
-            response = chat.send_message(last_message.get("parts", ""))
+            # Send the last message to get a response, retrying rate limit and server errors
+            response = call_with_retries(
+                lambda: chat.send_message(last_message.get("parts", "")),
+                self.retry_policy,
+                rate_limiter=self.rate_limiter
+            )
+            result_text = response.text
+        else:
+            # Single message, use generate_content
+            content = gemini_messages[0].get("parts", "") if gemini_messages else ""
+        
+            response = call_with_retries(
+                lambda: self.model.generate_content(
+                    content,
+                    generation_config={
+                        "temperature": temperature,
+                        "max_tokens": max_tokens if max_tokens else None
+                    }
+                ),
+                self.retry_policy,
+                rate_limiter=self.rate_limiter
+            )
+            
+            result_text = response.text
+        
+        # Estimate output tokens (Gemini API doesn't provide usage stats)
+        output_tokens = self._count_tokens(result_text)
+        
+        # Record the request
+        self.rate_limiter.record_request(input_tokens, output_tokens, reservation,
+                                         model=self.model_name, prices=self.prices)
+        
+        return result_text
+    
+    async def agenerate(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None
+    ) -> str:
+        """Generate a response using Gemini's async API with rate limiting.
+        
+        Args:
+            messages: List of message dictionaries
+            temperature: Sampling temperature
+            max_tokens: Maximum tokens to generate
+            
+        Returns:
+            Generated response text
+        """
+        # Count input tokens
+        input_tokens = self._count_messages_tokens(messages)
+        
+        # Wait without blocking the event loop if we're approaching rate limits
+        reservation = await self.rate_limiter.acquire(input_tokens, max_tokens if max_tokens else 1000)
+        
+        # Format messages for Gemini API
+        gemini_messages = self._convert_messages_to_gemini_format(messages)
+        
+        # Check if we need to start a chat or just generate
+        if len(gemini_messages) > 1:
+            # Start a chat with history
+            history = gemini_messages[:-1]  # All but the last message
+            last_message = gemini_messages[-1]  # The last message to send
+            
+            chat = self.model.start_chat(
+                history=history,
+            )
+            
+            # Send the last message to get a response, retrying rate limit and server errors
+            response = await acall_with_retries(
+                lambda: chat.send_message_async(last_message.get("parts", "")),
+                self.retry_policy,
+                rate_limiter=self.rate_limiter
+            )
             result_text = response.text
         else:
             # Single message, use generate_content
             content = gemini_messages[0].get("parts", "") if gemini_messages else ""
         
-            response = self.model.generate_content(
-                content,
-                generation_config={
-                    "temperature": temperature,
-                    "max_tokens": max_tokens if max_tokens else None
-                }
+            response = await acall_with_retries(
+                lambda: self.model.generate_content_async(
+                    content,
+                    generation_config={
+                        "temperature": temperature,
+                        "max_tokens": max_tokens if max_tokens else None
+                    }
+                ),
+                self.retry_policy,
+                rate_limiter=self.rate_limiter
             )
             
             result_text = response.text
@@ -198,7 +294,8 @@ class GeminiLLM(BaseLLM):
         output_tokens = self._count_tokens(result_text)
         
         # Record the request
-        self.rate_limiter.record_request(input_tokens, output_tokens)
+        self.rate_limiter.record_request(input_tokens, output_tokens, reservation,
+                                         model=self.model_name, prices=self.prices)
         
         return result_text
     
@@ -0,0 +1,153 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates
+"""
+Shared API clients of the LLM providers.
+
+Every agent used to create its own SDK clients, each with its own connection pool, so
+concurrent workers each opened new TCP and TLS connections and kept as many sockets
+alive. Clients are shared by all agents using the same provider, base URL and API key
+instead, with keep-alive connection pools sized for the workers. Async clients are
+shared per event loop, since their connections can't be used from another loop.
+"""
+
+import asyncio
+import hashlib
+import logging
+import threading
+import weakref
+from typing import Any, Dict, Optional, Tuple
+
+import anthropic
+import httpx
+import openai
+
+logger = logging.getLogger("HTTPClients")
+
+# Defaults of the http_client section of the config
+DEFAULT_HTTP_CONFIG = {
+    "max_connections": 100,            # Open connections per client
+    "max_keepalive_connections": 100,  # Idle connections kept open for reuse
+    "keepalive_expiry": 30.0,          # Seconds an idle connection is kept open
+    "timeout": 600.0,                  # Seconds to wait for a response
+    "connect_timeout": 10.0            # Seconds to wait for a connection
+}
+
+# (provider, base URL, API key hash, max retries) -> (client, HTTP config it was created with)
+_ClientKey = Tuple[str, Optional[str], str, int]
+_clients: Dict[_ClientKey, Tuple[Any, Dict[str, Any]]] = {}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[_ClientKey, Tuple[Any, Dict[str, Any]]]]" = \
+    weakref.WeakKeyDictionary()
+_registry_lock = threading.Lock()
+
+
+def _create_client(provider: str, api_key: str, base_url: Optional[str], max_retries: int,
+                   http_config: Dict[str, Any], asynchronous: bool) -> Any:
+    """
+    Create an SDK client with its own connection pool.
+
+    Args:
+        provider: "openai" for OpenAI and OpenAI-compatible servers, or "anthropic"
+        api_key: API key of the account
+        base_url: Base URL of the API, or None for the provider's default
+        max_retries: Retries of the SDK itself
+        http_config: Complete HTTP settings, see DEFAULT_HTTP_CONFIG
+        asynchronous: Whether to create an async client
+
+    Returns:
+        The client
+
+    Raises:
+        ValueError: If the provider is not supported
+    """
+    if provider == "openai":
+        sdk = openai
+        client_class = openai.AsyncOpenAI if asynchronous else openai.OpenAI
+    elif provider == "anthropic":
+        sdk = anthropic
+        client_class = anthropic.AsyncAnthropic if asynchronous else anthropic.Anthropic
+    else:
+        raise ValueError(f"Unsupported client provider: {provider}")
+
+    limits = httpx.Limits(
+        max_connections=http_config["max_connections"],
+        max_keepalive_connections=http_config["max_keepalive_connections"],
+        keepalive_expiry=http_config["keepalive_expiry"]
+    )
+    timeout = httpx.Timeout(http_config["timeout"], connect=http_config["connect_timeout"])
+
+    # The SDKs' default HTTP clients, with the SDKs' settings except for the pool and timeouts
+    http_client_class = sdk.DefaultAsyncHttpxClient if asynchronous else sdk.DefaultHttpxClient
+    return client_class(
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=max_retries,
+        timeout=timeout,
+        http_client=http_client_class(limits=limits, timeout=timeout)
+    )
+
+
+def _get_shared_client(clients: Dict[_ClientKey, Tuple[Any, Dict[str, Any]]], provider: str, api_key: str,
+                       base_url: Optional[str], max_retries: int, http_config: Optional[Dict[str, Any]],
+                       asynchronous: bool) -> Any:
+    """Get a client from a registry, creating it on first use. Must be called with the lock held."""
+    http_config = {**DEFAULT_HTTP_CONFIG, **(http_config or {})}
+    key = (provider, base_url, hashlib.sha256(api_key.encode("utf-8")).hexdigest(), max_retries)
+    entry = clients.get(key)
+    if entry is None:
+        entry = (_create_client(provider, api_key, base_url, max_retries, http_config, asynchronous), http_config)
+        clients[key] = entry
+
+    client, created_config = entry
+    if http_config != created_config:
+        # The pool of a client that is already in use can't be resized
+        logger.warning(f"Ignoring different HTTP client settings for the same {provider} API key; the first ones configured apply")
+    return client
+
+
+def get_client(provider: str, api_key: str, base_url: Optional[str] = None, max_retries: int = 0,
+               http_config: Optional[Dict[str, Any]] = None) -> Any:
+    """
+    Get the shared client of a provider account, creating it on first use.
+
+    Args:
+        provider: "openai" for OpenAI and OpenAI-compatible servers, or "anthropic"
+        api_key: API key of the account
+        base_url: Base URL of the API, or None for the provider's default
+        max_retries: Retries of the SDK itself; the wrappers retry with call_with_retries
+        http_config: The http_client section of the config, see DEFAULT_HTTP_CONFIG;
+                     used when the client is created
+
+    Returns:
+        The client, which is thread safe
+
+    Raises:
+        ValueError: If the provider is not supported
+    """
+    with _registry_lock:
+        return _get_shared_client(_clients, provider, api_key, base_url, max_retries, http_config, False)
+
+
+def get_async_client(provider: str, api_key: str, base_url: Optional[str] = None, max_retries: int = 0,
+                     http_config: Optional[Dict[str, Any]] = None) -> Any:
+    """
+    Get the shared async client of a provider account for the running event loop.
+
+    Must be called from a coroutine. The clients of a loop are dropped with the loop.
+
+    Args:
+        provider: "openai" for OpenAI and OpenAI-compatible servers, or "anthropic"
+        api_key: API key of the account
+        base_url: Base URL of the API, or None for the provider's default
+        max_retries: Retries of the SDK itself; the wrappers retry with acall_with_retries
+        http_config: The http_client section of the config, see DEFAULT_HTTP_CONFIG;
+                     used when the client is created
+
+    Returns:
+        The async client
+
+    Raises:
+        ValueError: If the provider is not supported
+    """
+    loop = asyncio.get_running_loop()
+    with _registry_lock:
+        clients = _async_clients.setdefault(loop, {})
+        return _get_shared_client(clients, provider, api_key, base_url, max_retries, http_config, True)
@@ -1,9 +1,12 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates
+import time
 from typing import List, Dict, Any, Optional
-from openai import OpenAI
 import torch
-import tiktoken
 from .base import BaseLLM
+from .concurrency import get_concurrency_limiter
+from .http_clients import get_async_client, get_client
+from .retry import is_retryable
+from .tokenizer import MessageTokenCounter, get_tokenizer_for_model
 
 class HuggingFaceLLM(BaseLLM):
     """HuggingFace model wrapper using vLLM's OpenAI-compatible API."""
@@ -15,7 +18,9 @@ class HuggingFaceLLM(BaseLLM):
         api_key: str = "EMPTY",
         device: str = None,  # Kept for backward compatibility
         torch_dtype: torch.dtype = None,  # Kept for backward compatibility
-        max_input_tokens: int = 10000  # Maximum input tokens allowed
+        max_input_tokens: int = 10000,  # Maximum input tokens allowed
+        http_client_config: Optional[Dict[str, Any]] = None,
+        concurrency_config: Optional[Dict[str, Any]] = None
     ):
         """Initialize HuggingFace LLM via vLLM API.
         
@@ -26,19 +31,33 @@ class HuggingFaceLLM(BaseLLM):
             device: Ignored (handled by vLLM server)
             torch_dtype: Ignored (handled by vLLM server)
             max_input_tokens: Maximum number of input tokens allowed
+            http_client_config: Optional http_client section of the config, sizing the
+                                connection pool of the shared clients
+            concurrency_config: Optional settings of the requests kept in flight to the
+                                server, see AdaptiveConcurrencyLimiter
         """
         self.model_name = model_name
-        self.client = OpenAI(
-            api_key=api_key,
-            base_url=api_base,
-        )
+        # Clients and their connection pools are shared with all other agents using the
+        # same server; the OpenAI SDK's default of 2 retries is kept
+        self.api_key = api_key
+        self.api_base = api_base
+        self.http_client_config = http_client_config
+        self.client = get_client("openai", api_key, base_url=api_base, max_retries=2, http_config=http_client_config)
         self.max_input_tokens = max_input_tokens
-        # Initialize tokenizer based on model
-        try:
-            self.tokenizer = tiktoken.encoding_for_model(model_name)
-        except KeyError:
-            # Fall back to cl100k_base for unknown models (used by GPT-4, GPT-3.5-turbo)
-            self.tokenizer = tiktoken.get_encoding("cl100k_base")
+        # Shared tokenizer based on model, falling back to cl100k_base for unknown models
+        # (used by GPT-4, GPT-3.5-turbo); ~4 tokens of formatting per message and 2 for
+        # the final assistant message
+        self.tokenizer = get_tokenizer_for_model(model_name)
+        self.message_counter = MessageTokenCounter(self.tokenizer, tokens_per_message=4, tokens_per_reply=2)
+        # vLLM batches the requests in flight, so agents send theirs concurrently up to a
+        # limit shared by all agents using the server and sized from its latency
+        self.concurrency_limiter = get_concurrency_limiter(api_base, model_name, **(concurrency_config or {}))
+    
+    @property
+    def async_client(self) -> Any:
+        """The shared async client of the running event loop."""
+        return get_async_client("openai", self.api_key, base_url=self.api_base, max_retries=2,
+                                http_config=self.http_client_config)
     
     def _count_tokens(self, messages: List[Dict[str, str]]) -> int:
         """Count the number of tokens in a list of messages.
@@ -49,22 +68,15 @@ class HuggingFaceLLM(BaseLLM):
         Returns:
             Total token count
         """
-        token_count = 0
-        
-        for message in messages:
-            # Count tokens in content
-            token_count += len(self.tokenizer.encode(message["content"]))
-            # Add overhead for message format (role, etc.)
-            token_count += 4  # Approximate tokens for message formatting
-            
-        # Add tokens for the formatting between messages
-        token_count += 2  # Final assistant message tokens
-        
-        return token_count
+        return self.tokenizer.count_messages(messages, tokens_per_message=4, tokens_per_reply=2)
     
     def _truncate_messages(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
         """Truncate messages to stay within the token limit.
         
+        Every message is counted once and the budget is updated as messages are kept;
+        a message that doesn't fit is cut at a token boundary instead of being
+        re-encoded until it does.
+        
         Args:
             messages: List of message dictionaries
             
@@ -73,7 +85,8 @@ class HuggingFaceLLM(BaseLLM):
         """
         if not messages:
             return []
-            
+        
+        tokens_per_message = self.message_counter.tokens_per_message
         system_messages = [m for m in messages if m["role"].lower() == "system"]
         non_system_messages = [m for m in messages if m["role"].lower() != "system"]
         
@@ -83,35 +96,28 @@ class HuggingFaceLLM(BaseLLM):
         
         # Process non-system messages from newest to oldest
         for message in reversed(non_system_messages):
-            message_tokens = self._count_tokens([message])
+            message_tokens = self.tokenizer.count(message["content"]) + tokens_per_message
             
             if message_tokens <= token_budget:
                 # We can include the entire message
                 result.insert(len(system_messages), message)
                 token_budget -= message_tokens
             elif message["role"].lower() == "user" and token_budget > 20:
-                # For user messages, we can truncate content if needed
-                # Keep enough tokens for comprehension (at least some portion)
-                content = message["content"]
-                # Estimate how much content to keep
-                keep_ratio = token_budget / message_tokens
-                # Truncate from beginning to keep most recent content
-                if keep_ratio < 0.5:
+                # For user messages, keep the most recent content that fits
+                keep_tokens = token_budget - tokens_per_message
+                if keep_tokens < (message_tokens - tokens_per_message) / 2:
                     # If we need to cut more than half, add indicator of truncation
-                    truncated_content = f"[...truncated...] {content[int(len(content) * (1 - keep_ratio + 0.1)):].strip()}"
+                    prefix = "[...truncated...] "
+                    keep_tokens -= self.tokenizer.count(prefix)
                 else:
-                    truncated_content = content[int(len(content) * (1 - keep_ratio)):].strip()
+                    prefix = ""
+                truncated_content = prefix + self.tokenizer.truncate(message["content"], keep_tokens, keep_end=True).strip()
                 
-                truncated_message = {
+                result.insert(len(system_messages), {
                     "role": message["role"],
                     "content": truncated_content
-                }
-                
-                # Verify the truncated message fits
-                truncated_tokens = self._count_tokens([truncated_message])
-                if truncated_tokens <= token_budget:
-                    result.insert(len(system_messages), truncated_message)
-                    token_budget -= truncated_tokens
+                })
+                token_budget = 0
             
             # If we can't fit any more messages, stop
             if token_budget <= 20:  # Keep some buffer
@@ -122,25 +128,18 @@ class HuggingFaceLLM(BaseLLM):
         
         return result
     
-    def generate(
-        self,
-        messages: List[Dict[str, str]],
-        temperature: float,
-        max_tokens: Optional[int]
-    ) -> str:
-        """Generate a response using the vLLM API.
+    def _prepare_messages(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Truncate messages to the input limit and format them for vLLM.
         
         Args:
             messages: List of message dictionaries
-            temperature: Sampling temperature
-            max_output_tokens: Maximum tokens to generate
             
         Returns:
-            Generated response text
+            Messages with an optional leading system message followed by strictly
+            alternating user/assistant messages, ending with a user message
         """
-        max_output_tokens = max_tokens if max_tokens is not None else self.max_output_tokens
-        # Check token count and truncate if needed
-        total_tokens = self._count_tokens(messages)
+        # Check token count and truncate if needed; the history is counted incrementally
+        total_tokens = self.message_counter.count(messages)
         if total_tokens > self.max_input_tokens:
             messages = self._truncate_messages(messages)
             
@@ -193,17 +192,97 @@ class HuggingFaceLLM(BaseLLM):
                            f"Based on your last response: '{formatted_messages[-1]['content']}', please continue."
             })
         
-        # Call the API
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=formatted_messages,
-            temperature=temperature,
-            max_tokens=max_output_tokens
-        )
+        return formatted_messages
+    
+    def generate(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: Optional[int]
+    ) -> str:
+        """Generate a response using the vLLM API.
+        
+        Args:
+            messages: List of message dictionaries
+            temperature: Sampling temperature
+            max_output_tokens: Maximum tokens to generate
+            
+        Returns:
+            Generated response text
+        """
+        max_output_tokens = max_tokens if max_tokens is not None else self.max_output_tokens
+        formatted_messages = self._prepare_messages(messages)
+        
+        # Call the API once a slot of the in-flight window is free
+        self.concurrency_limiter.acquire()
+        start_time = time.monotonic()
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=formatted_messages,
+                temperature=temperature,
+                max_tokens=max_output_tokens
+            )
+        except BaseException as e:
+            self.concurrency_limiter.release(failed=isinstance(e, Exception) and is_retryable(e))
+            raise
+        self.concurrency_limiter.release(time.monotonic() - start_time, self._output_tokens(response))
         
         # Extract the generated text
         return response.choices[0].message.content
     
+    async def agenerate(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: Optional[int]
+    ) -> str:
+        """Generate a response using the async client of the vLLM API.
+        
+        Args:
+            messages: List of message dictionaries
+            temperature: Sampling temperature
+            max_tokens: Maximum tokens to generate
+            
+        Returns:
+            Generated response text
+        """
+        max_output_tokens = max_tokens if max_tokens is not None else self.max_output_tokens
+        formatted_messages = self._prepare_messages(messages)
+        
+        # Call the API once a slot of the in-flight window is free
+        await self.concurrency_limiter.aacquire()
+        start_time = time.monotonic()
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model_name,
+                messages=formatted_messages,
+                temperature=temperature,
+                max_tokens=max_output_tokens
+            )
+        except BaseException as e:
+            # Cancelled requests free their slot too
+            self.concurrency_limiter.release(failed=isinstance(e, Exception) and is_retryable(e))
+            raise
+        self.concurrency_limiter.release(time.monotonic() - start_time, self._output_tokens(response))
+        
+        # Extract the generated text
+        return response.choices[0].message.content
+    
+    def _output_tokens(self, response: Any) -> int:
+        """Get the number of generated tokens of a response, counting them if vLLM didn't report it.
+        
+        Args:
+            response: The chat completion
+            
+        Returns:
+            Number of generated tokens
+        """
+        usage = getattr(response, "usage", None)
+        if usage is not None and usage.completion_tokens is not None:
+            return usage.completion_tokens
+        return self.tokenizer.count(response.choices[0].message.content)
+    
     def format_message(self, role: str, content: str) -> Dict[str, str]:
         """Format message for OpenAI API compatible format.
         
@@ -1,9 +1,11 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates
-from typing import List, Dict, Any, Optional
-import openai
-import tiktoken
-from .base import BaseLLM
-from .rate_limiter import RateLimiter
+import json
+from typing import Hashable, List, Dict, Any, Optional
+from .base import BaseLLM, BatchRequest, BatchResult
+from .tokenizer import MessageTokenCounter, get_tokenizer_for_model
+from .http_clients import get_async_client, get_client
+from .retry import RetryPolicy, acall_with_retries, call_with_retries
+from .rate_limiter import TokenPrices, get_rate_limiter
 
 class OpenAILLM(BaseLLM):
     """OpenAI API wrapper."""
@@ -12,7 +14,10 @@ class OpenAILLM(BaseLLM):
         self,
         api_key: str,
         model: str,
-        rate_limits: Optional[Dict[str, Any]] = None
+        rate_limits: Optional[Dict[str, Any]] = None,
+        rate_limiter_config: Optional[Dict[str, Any]] = None,
+        retry_config: Optional[Dict[str, Any]] = None,
+        http_client_config: Optional[Dict[str, Any]] = None
     ):
         """Initialize OpenAI LLM.
         
@@ -20,16 +25,26 @@ class OpenAILLM(BaseLLM):
             api_key: OpenAI API key
             model: Model identifier (e.g., "gpt-4", "gpt-3.5-turbo")
             rate_limits: Optional dictionary with rate limit settings
+            rate_limiter_config: Optional rate_limiter section of the config, selecting
+                                 where the rate limiter keeps its state
+            retry_config: Optional retry section of the config, see RetryPolicy
+            http_client_config: Optional http_client section of the config, sizing the
+                                connection pool of the shared clients
         """
-        self.client = openai.OpenAI(api_key=api_key)
+        # Clients and their connection pools are shared with all other agents using the
+        # same key. Failed calls are retried by call_with_retries, which follows the rate
+        # limiter; the clients' own retries would not, so they are turned off
+        self.api_key = api_key
+        self.http_client_config = http_client_config
+        self.client = get_client("openai", api_key, http_config=http_client_config)
         self.model = model
+        self.retry_policy = RetryPolicy(**(retry_config or {}))
         
-        try:
-            # Initialize tokenizer for the model
-            self.tokenizer = tiktoken.encoding_for_model(model)
-        except:
-            # Fallback to cl100k_base for new models
-            self.tokenizer = tiktoken.get_encoding("cl100k_base")
+        # Shared tokenizer for the model (cl100k_base for new models); message histories
+        # are counted incrementally: ~4 tokens of formatting per message, and every reply
+        # is primed with <|start|>assistant<|message|>
+        self.tokenizer = get_tokenizer_for_model(model)
+        self.message_counter = MessageTokenCounter(self.tokenizer, tokens_per_message=4, tokens_per_reply=3)
         
         # Default rate limits for GPT-4o-mini
         default_limits = {
@@ -43,16 +58,27 @@ class OpenAILLM(BaseLLM):
         # Use provided rate limits or defaults
         limits = rate_limits or default_limits
         
-        # Initialize rate limiter
-        self.rate_limiter = RateLimiter(
+        # Share the rate limiter of the account with all other agents using the same key
+        self.rate_limiter = get_rate_limiter(
             provider="OpenAI",
+            api_key=api_key,
+            backend=rate_limiter_config,
             requests_per_minute=limits.get("requests_per_minute", default_limits["requests_per_minute"]),
             input_tokens_per_minute=limits.get("input_tokens_per_minute", default_limits["input_tokens_per_minute"]),
-            output_tokens_per_minute=limits.get("output_tokens_per_minute", default_limits["output_tokens_per_minute"]),
-            input_token_price_per_million=limits.get("input_token_price_per_million", default_limits["input_token_price_per_million"]),
-            output_token_price_per_million=limits.get("output_token_price_per_million", default_limits["output_token_price_per_million"])
+            output_tokens_per_minute=limits.get("output_tokens_per_minute", default_limits["output_tokens_per_minute"])
+        )
+        
+        # Prices of this model; other models may share the limiter at other prices
+        self.prices = TokenPrices.per_million(
+            limits.get("input_token_price_per_million", default_limits["input_token_price_per_million"]),
+            limits.get("output_token_price_per_million", default_limits["output_token_price_per_million"])
         )
     
+    @property
+    def async_client(self) -> Any:
+        """The shared async client of the running event loop."""
+        return get_async_client("openai", self.api_key, http_config=self.http_client_config)
+    
     def _count_tokens(self, text: str) -> int:
         """Count tokens in a string using the model's tokenizer.
         
@@ -66,7 +92,7 @@ class OpenAILLM(BaseLLM):
             return 0
             
         try:
-            return len(self.tokenizer.encode(text))
+            return self.tokenizer.count(text)
         except Exception as e:
             # Log the error but don't fail
             import logging
@@ -83,23 +109,7 @@ class OpenAILLM(BaseLLM):
         Returns:
             Total token count
         """
-        if not messages:
-            return 0
-            
-        total_tokens = 0
-        
-        # Count tokens in each message
-        for message in messages:
-            if "content" in message and message["content"]:
-                total_tokens += self._count_tokens(message["content"])
-            
-        # Add overhead for message formatting (varies by model, but ~4 tokens per message)
-        total_tokens += 4 * len(messages)
-        
-        # Add tokens for model overhead (varies by model)
-        total_tokens += 3  # Every reply is primed with <|start|>assistant<|message|>
-        
-        return total_tokens
+        return self.message_counter.count(messages)
     
     def generate(
         self,
@@ -121,15 +131,22 @@ class OpenAILLM(BaseLLM):
         input_tokens = self._count_messages_tokens(messages)
         
         # Wait if we're approaching rate limits (estimate output tokens as max_output_tokens)
-        self.rate_limiter.wait_if_needed(input_tokens, max_tokens)
-        
-        # Make the API call
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens if max_tokens else None
+        reservation = self.rate_limiter.wait_if_needed(input_tokens, max_tokens)
+        
+        # Make the API call, retrying rate limit and server errors; the raw response
+        # has the rate limit headers
+        raw_response = call_with_retries(
+            lambda: self.client.chat.completions.with_raw_response.create(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens if max_tokens else None
+            ),
+            self.retry_policy,
+            rate_limiter=self.rate_limiter,
+            get_headers=lambda raw: raw.headers
         )
+        response = raw_response.parse()
         
         result_text = response.choices[0].message.content
         
@@ -137,10 +154,146 @@ class OpenAILLM(BaseLLM):
         output_tokens = response.usage.completion_tokens if hasattr(response, 'usage') else self._count_tokens(result_text)
         input_tokens = response.usage.prompt_tokens if hasattr(response, 'usage') else input_tokens
         
-        self.rate_limiter.record_request(input_tokens, output_tokens)
+        self.rate_limiter.record_request(input_tokens, output_tokens, reservation,
+                                         model=self.model, prices=self.prices)
         
         return result_text
     
+    async def agenerate(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: Optional[int]
+    ) -> str:
+        """Generate a response using the async OpenAI client with rate limiting.
+        
+        Args:
+            messages: List of message dictionaries
+            temperature: Sampling temperature
+            max_tokens: Maximum tokens to generate
+            
+        Returns:
+            Generated response text
+        """
+        # Count input tokens
+        input_tokens = self._count_messages_tokens(messages)
+        
+        # Wait without blocking the event loop if we're approaching rate limits
+        reservation = await self.rate_limiter.acquire(input_tokens, max_tokens)
+        
+        # Make the API call, retrying rate limit and server errors; the raw response
+        # has the rate limit headers
+        raw_response = await acall_with_retries(
+            lambda: self.async_client.chat.completions.with_raw_response.create(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens if max_tokens else None
+            ),
+            self.retry_policy,
+            rate_limiter=self.rate_limiter,
+            get_headers=lambda raw: raw.headers
+        )
+        response = raw_response.parse()
+        
+        result_text = response.choices[0].message.content
+        
+        # Count output tokens and record request
+        output_tokens = response.usage.completion_tokens if hasattr(response, 'usage') else self._count_tokens(result_text)
+        input_tokens = response.usage.prompt_tokens if hasattr(response, 'usage') else input_tokens
+        
+        self.rate_limiter.record_request(input_tokens, output_tokens, reservation,
+                                         model=self.model, prices=self.prices)
+        
+        return result_text
+    
+    @property
+    def batch_key(self) -> Hashable:
+        """Requests of the same account and model share batch jobs."""
+        return ("OpenAI", self.api_key, self.model)
+    
+    def submit_batch(self, requests: List[BatchRequest]) -> str:
+        """Submit requests as a job of the OpenAI Batch API.
+        
+        Args:
+            requests: The requests, with custom IDs unique within the batch
+            
+        Returns:
+            The ID of the batch job
+        """
+        lines = [
+            json.dumps({
+                "custom_id": request.custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": self.model,
+                    "messages": request.messages,
+                    "temperature": request.temperature,
+                    "max_tokens": request.max_tokens if request.max_tokens else None
+                }
+            })
+            for request in requests
+        ]
+        batch_file = call_with_retries(
+            lambda: self.client.files.create(file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch"),
+            self.retry_policy
+        )
+        batch = call_with_retries(
+            lambda: self.client.batches.create(
+                input_file_id=batch_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h"
+            ),
+            self.retry_policy
+        )
+        return batch.id
+    
+    def poll_batch(self, batch_id: str) -> Optional[Dict[str, BatchResult]]:
+        """Check whether a job of the OpenAI Batch API has ended and get its results.
+        
+        Args:
+            batch_id: ID returned by submit_batch
+            
+        Returns:
+            The results by custom ID once the job has ended, or None while it is running
+        """
+        batch = call_with_retries(lambda: self.client.batches.retrieve(batch_id), self.retry_policy)
+        if batch.status in ("validating", "in_progress", "finalizing", "cancelling"):
+            return None
+        
+        # Failed, expired and cancelled jobs still have results for the requests they finished
+        results = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            content = call_with_retries(lambda: self.client.files.content(file_id), self.retry_policy)
+            for line in content.text.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                response = item.get("response") or {}
+                if response.get("status_code") == 200:
+                    body = response["body"]
+                    results[item["custom_id"]] = BatchResult(
+                        text=body["choices"][0]["message"]["content"],
+                        input_tokens=body["usage"]["prompt_tokens"],
+                        output_tokens=body["usage"]["completion_tokens"]
+                    )
+                else:
+                    error = item.get("error") or response.get("body", {}).get("error")
+                    results[item["custom_id"]] = BatchResult(error=str(error or f"batch job {batch.status}"))
+        return results
+    
+    def record_batch_usage(self, result: BatchResult) -> None:
+        """Record a request answered by a batch job at the batch price.
+        
+        Args:
+            result: The result of the request
+        """
+        self.rate_limiter.record_request(result.input_tokens, result.output_tokens, batch=True,
+                                         model=self.model, prices=self.prices)
+    
     def format_message(self, role: str, content: str) -> Dict[str, str]:
         """Format message for OpenAI API.
         
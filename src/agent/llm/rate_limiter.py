@@ -1,20 +1,146 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates
+import os
 import time
-from typing import Dict, List, Optional
-from collections import deque
+import struct
+import asyncio
+import hashlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 import threading
 import logging
 
+from .retry import RateLimitInfo
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, where only the memory backend works
+    fcntl = None
+
 # Configure logging
-logging.basicConfig(level=logging.INFO, 
+logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("RateLimiter")
 
+# Batch APIs of OpenAI and Anthropic charge half the price of regular requests
+BATCH_PRICE_FACTOR = 0.5
+
+
+class TokenBucket:
+    """
+    A bucket that refills continuously up to its per-minute capacity.
+    
+    The level is updated lazily from the time of the last update, so checking and taking
+    are constant time. Not thread safe; the rate limiter holds its lock around every call.
+    """
+    
+    def __init__(self, capacity: float, now: float):
+        """
+        Initialize a full bucket.
+        
+        Args:
+            capacity: Units allowed per minute, which is also the largest burst
+            now: Current time in seconds
+        """
+        self.capacity = capacity
+        self.refill_rate = capacity / 60
+        self.level = capacity
+        self.updated = now
+    
+    def refill(self, now: float):
+        """Add the units refilled since the last update."""
+        if now > self.updated:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.refill_rate)
+            self.updated = now
+    
+    def wait_time(self, amount: float) -> float:
+        """Get the seconds until the bucket holds the amount, after a refill."""
+        # Tolerate rounding errors, or a caller could wake up a hair too early forever
+        if self.level >= amount - 1e-6:
+            return 0.0
+        return (amount - self.level) / self.refill_rate
+    
+    def take(self, amount: float):
+        """Take units out of the bucket; usage beyond a reservation may leave it owing."""
+        self.level -= amount
+    
+    def give_back(self, amount: float):
+        """Return units that were taken but not used."""
+        self.level = min(self.capacity, self.level + amount)
+    
+    def set_capacity(self, capacity: float):
+        """Change the per-minute capacity, keeping the current level if it still fits."""
+        self.capacity = capacity
+        self.refill_rate = capacity / 60
+        self.level = min(self.capacity, self.level)
+
+
+@dataclass
+class Reservation:
+    """Tokens taken from the buckets for a request before it was sent, settled by record_request."""
+    input_tokens: int
+    output_tokens: int
+
+
+@dataclass
+class TokenPrices:
+    """Prices per token of a model."""
+    input_token_price: float = 0.0
+    output_token_price: float = 0.0
+    
+    @classmethod
+    def per_million(cls, input_token_price_per_million: float, output_token_price_per_million: float) -> "TokenPrices":
+        """Create the prices from the prices per million tokens of the config."""
+        return cls(input_token_price_per_million / 1_000_000, output_token_price_per_million / 1_000_000)
+    
+    def cost(self, input_tokens: float, output_tokens: float) -> float:
+        """Get the cost of the given tokens."""
+        return input_tokens * self.input_token_price + output_tokens * self.output_token_price
+
+
+@dataclass
+class UsageTracker:
+    """Tokens and cost of the requests recorded while the tracker is active, see track_usage."""
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost: float = 0.0
+    
+    def to_dict(self) -> Dict[str, float]:
+        """Get the usage as a dictionary with "input_tokens", "output_tokens" and "cost"."""
+        return {"input_tokens": self.input_tokens, "output_tokens": self.output_tokens, "cost": self.cost}
+
+
+# Trackers of the current thread or task; asyncio tasks inherit them from their creator
+_active_trackers: ContextVar[Tuple[UsageTracker, ...]] = ContextVar("active_usage_trackers", default=())
+
+
+@contextmanager
+def track_usage() -> Iterator[UsageTracker]:
+    """
+    Track the requests recorded by the current thread or task, on any rate limiter.
+    
+    Rate limiters are shared by all agents and workers of a process, so the difference
+    of their totals before and after some work includes the requests of other threads.
+    
+    Yields:
+        The tracker, which keeps counting until the block exits
+    """
+    tracker = UsageTracker()
+    token = _active_trackers.set(_active_trackers.get() + (tracker,))
+    try:
+        yield tracker
+    finally:
+        _active_trackers.reset(token)
+
+
 class RateLimiter:
     """
     Rate limiter for LLM API calls.
-    Tracks requests, input tokens, and output tokens per minute.
-    Also tracks cost based on token pricing.
+    Tracks requests, input tokens, and output tokens per minute with token buckets.
+    Also tracks cost based on token pricing, per model, since agents using different
+    models of the same account share one limiter.
     """
     
     def __init__(
@@ -23,9 +149,10 @@ class RateLimiter:
         requests_per_minute: int,
         input_tokens_per_minute: int,
         output_tokens_per_minute: int,
-        input_token_price_per_million: float,
-        output_token_price_per_million: float,
-        buffer_percentage: float = 0.1  # Buffer to avoid hitting exact limits
+        input_token_price_per_million: float = 0.0,
+        output_token_price_per_million: float = 0.0,
+        buffer_percentage: float = 0.1,  # Buffer to avoid hitting exact limits
+        clock: Callable[[], float] = time.monotonic
     ):
         """
         Initialize the rate limiter.
@@ -35,146 +162,282 @@ class RateLimiter:
             requests_per_minute: Maximum requests per minute
             input_tokens_per_minute: Maximum input tokens per minute
             output_tokens_per_minute: Maximum output tokens per minute
-            input_token_price_per_million: Price per million input tokens
-            output_token_price_per_million: Price per million output tokens
+            input_token_price_per_million: Price per million input tokens of requests
+                                           recorded without prices of their own
+            output_token_price_per_million: Price per million output tokens of requests
+                                            recorded without prices of their own
             buffer_percentage: Percentage buffer to avoid hitting exact limits
+            clock: Function returning the current time in seconds
         """
         self.provider = provider
+        self.buffer_percentage = buffer_percentage
         self.requests_per_minute = requests_per_minute * (1 - buffer_percentage)
         self.input_tokens_per_minute = input_tokens_per_minute * (1 - buffer_percentage)
         self.output_tokens_per_minute = output_tokens_per_minute * (1 - buffer_percentage)
         
-        # Pricing
-        self.input_token_price = input_token_price_per_million / 1_000_000
-        self.output_token_price = output_token_price_per_million / 1_000_000
+        # Pricing of requests recorded without the prices of their model
+        self.prices = TokenPrices.per_million(input_token_price_per_million, output_token_price_per_million)
         
-        # Track usage within a sliding window (1 minute)
-        self.request_timestamps = deque()
-        self.input_token_usage = deque()  # Tuples of (timestamp, token_count)
-        self.output_token_usage = deque()  # Tuples of (timestamp, token_count)
+        # One bucket per limit, refilled continuously instead of tracking a sliding window
+        self.clock = clock
+        now = clock()
+        self.request_bucket = TokenBucket(self.requests_per_minute, now)
+        self.input_token_bucket = TokenBucket(self.input_tokens_per_minute, now)
+        self.output_token_bucket = TokenBucket(self.output_tokens_per_minute, now)
         
         # Total usage stats
         self.total_requests = 0
         self.total_input_tokens = 0
         self.total_output_tokens = 0
         self.total_cost = 0.0
+        # Model (or the provider, for requests recorded without one) -> its share of the totals
+        self.usage_by_model: Dict[str, UsageTracker] = {}
         
-        # Thread lock for thread safety
+        # Thread lock for thread safety; it is never held while waiting
         self.lock = threading.Lock()
     
-    def _clean_old_entries(self, usage_queue: deque, current_time: float):
-        """Remove entries older than 1 minute from the queue."""
-        one_minute_ago = current_time - 60
+    @property
+    def buckets(self) -> Tuple[TokenBucket, TokenBucket, TokenBucket]:
+        """The request, input token and output token buckets."""
+        return self.request_bucket, self.input_token_bucket, self.output_token_bucket
+    
+    @contextmanager
+    def _bucket_lock(self) -> Iterator[None]:
+        """Hold the lock around reading and updating the buckets."""
+        with self.lock:
+            yield
+    
+    def _warn_if_over_capacity(self, input_tokens: int, estimated_output_tokens: int):
+        """Warn if a single request is bigger than the entire per-minute capacity."""
+        if input_tokens > self.input_tokens_per_minute or estimated_output_tokens > self.output_tokens_per_minute:
+            logger.warning(
+                f"Request uses more tokens ({input_tokens} in / {estimated_output_tokens} out) "
+                f"than the configured per-minute capacity. It will wait for the full capacity."
+            )
+    
+    def try_reserve(self, input_tokens: int, estimated_output_tokens: Optional[int] = None) -> Tuple[Optional[Reservation], float]:
+        """
+        Reserve capacity for a request if all of it is available now.
         
-        # Handle different queue formats (timestamps vs. (timestamp, value) tuples)
-        if usage_queue and isinstance(usage_queue[0], tuple):
-            # For token usage queues that store (timestamp, count) tuples
-            while usage_queue and usage_queue[0][0] < one_minute_ago:
-                usage_queue.popleft()
-        else:
-            # For request_timestamps queue that stores timestamp floats directly
-            while usage_queue and usage_queue[0] < one_minute_ago:
-                usage_queue.popleft()
+        Nothing is taken if the request doesn't fit, so callers that wait don't hold
+        capacity back from others. The lock is only held for a few arithmetic operations.
+        
+        Args:
+            input_tokens: Number of input tokens for the upcoming request
+            estimated_output_tokens: Estimated number of output tokens
+        
+        Returns:
+            Tuple of (reservation to pass to record_request, 0), or (None, seconds until the
+            request fits) if the caller has to wait and try again
+        """
+        if estimated_output_tokens is None:
+            estimated_output_tokens = input_tokens // 2  # Rough fallback estimate
+        
+        # A request bigger than a bucket waits for the full bucket instead of forever
+        reservation = Reservation(
+            min(input_tokens, self.input_token_bucket.capacity),
+            min(estimated_output_tokens, self.output_token_bucket.capacity)
+        )
+        amounts = (
+            (self.request_bucket, min(1, self.request_bucket.capacity)),
+            (self.input_token_bucket, reservation.input_tokens),
+            (self.output_token_bucket, reservation.output_tokens)
+        )
+        
+        with self._bucket_lock():
+            now = self.clock()
+            wait_time = 0.0
+            for bucket, amount in amounts:
+                bucket.refill(now)
+                wait_time = max(wait_time, bucket.wait_time(amount))
+            if wait_time > 0:
+                return None, wait_time
+            for bucket, amount in amounts:
+                bucket.take(amount)
+        return reservation, 0.0
     
-    def _get_usage_count(self, usage_queue: deque):
-        """Get the total count from a usage queue."""
-        return sum(count for _, count in usage_queue)
+    def wait_if_needed(self, input_tokens: int, estimated_output_tokens: Optional[int] = None) -> Reservation:
+        """
+        Reserve capacity for a request, sleeping until it is available.
+        
+        Args:
+            input_tokens: Number of input tokens for the upcoming request
+            estimated_output_tokens: Estimated number of output tokens
+        
+        Returns:
+            The reservation to pass to record_request
+        """
+        if estimated_output_tokens is None:
+            estimated_output_tokens = input_tokens // 2  # Rough fallback estimate
+        self._warn_if_over_capacity(input_tokens, estimated_output_tokens)
+        
+        while True:
+            reservation, wait_time = self.try_reserve(input_tokens, estimated_output_tokens)
+            if reservation:
+                return reservation
+            
+            logger.info(f"Rate limit approaching for {self.provider}. Waiting {wait_time:.2f} seconds...")
+            time.sleep(wait_time)
     
-    def wait_if_needed(self, input_tokens: int, estimated_output_tokens: Optional[int] = None):
+    async def acquire(self, input_tokens: int, estimated_output_tokens: Optional[int] = None) -> Reservation:
         """
-        Check if we're about to exceed rate limits and wait if necessary.
-        This improved version uses a while loop instead of recursion to
-        avoid potential infinite waiting scenarios.
+        Async version of wait_if_needed that yields to the event loop while waiting.
         
         Args:
             input_tokens: Number of input tokens for the upcoming request
             estimated_output_tokens: Estimated number of output tokens
+        
+        Returns:
+            The reservation to pass to record_request
         """
-        with self.lock:
-            if estimated_output_tokens is None:
-                estimated_output_tokens = input_tokens // 2  # Rough fallback estimate
+        if estimated_output_tokens is None:
+            estimated_output_tokens = input_tokens // 2  # Rough fallback estimate
+        self._warn_if_over_capacity(input_tokens, estimated_output_tokens)
+        
+        while True:
+            reservation, wait_time = self.try_reserve(input_tokens, estimated_output_tokens)
+            if reservation:
+                return reservation
             
-            # If this single request is bigger than the entire capacity, warn or handle
-            if input_tokens > self.input_tokens_per_minute or estimated_output_tokens > self.output_tokens_per_minute:
-                logger.warning(
-                    f"Request uses more tokens ({input_tokens} in / {estimated_output_tokens} out) "
-                    f"than the configured per-minute capacity. This request may never succeed."
-                )
+            logger.info(f"Rate limit approaching for {self.provider}. Waiting {wait_time:.2f} seconds...")
+            await asyncio.sleep(wait_time)
+    
+    def observe(self, info: RateLimitInfo):
+        """
+        Adjust the buckets to the rate limits reported in a provider's response headers.
+        
+        Reported limits replace the configured ones, less the buffer, so the limiter
+        converges to the quota the account actually has. A reported remaining amount
+        lowers a bucket that is fuller than the provider's, which happens when other
+        clients use the same account or the configured limits are too high.
+        
+        Args:
+            info: Rate limit state parsed from the headers, see parse_rate_limit_headers
+        """
+        reported = (
+            (self.request_bucket, info.requests_limit, info.requests_remaining),
+            (self.input_token_bucket, info.input_tokens_limit, info.input_tokens_remaining),
+            (self.output_token_bucket, info.output_tokens_limit, info.output_tokens_remaining)
+        )
+        if all(limit is None and remaining is None for _, limit, remaining in reported):
+            return
+        
+        changed_limits = False
+        with self._bucket_lock():
+            now = self.clock()
+            for bucket, limit, remaining in reported:
+                bucket.refill(now)
+                if limit:
+                    capacity = limit * (1 - self.buffer_percentage)
+                    if abs(capacity - bucket.capacity) > 1e-6:
+                        bucket.set_capacity(capacity)
+                        changed_limits = True
+                if remaining is not None:
+                    # Keep the same buffer below the provider's limit as below a full bucket
+                    buffer = bucket.capacity / (1 - self.buffer_percentage) - bucket.capacity
+                    bucket.level = min(bucket.level, remaining - buffer)
             
-            while True:
-                current_time = time.time()
-                
-                # Clean up old entries
-                self._clean_old_entries(self.request_timestamps, current_time)
-                self._clean_old_entries(self.input_token_usage, current_time)
-                self._clean_old_entries(self.output_token_usage, current_time)
-                
-                # Calculate current usage
-                current_requests = len(self.request_timestamps)
-                current_input_tokens = self._get_usage_count(self.input_token_usage)
-                current_output_tokens = self._get_usage_count(self.output_token_usage)
-                
-                # Check if adding this request would exceed limits
-                if ((current_requests + 1) <= self.requests_per_minute and
-                    (current_input_tokens + input_tokens) <= self.input_tokens_per_minute and
-                    (current_output_tokens + estimated_output_tokens) <= self.output_tokens_per_minute):
-                    # We can proceed now
-                    break
-                
-                # Otherwise, compute how long to wait
-                wait_time = 0
-                if self.request_timestamps:
-                    wait_time = max(wait_time, 60 - (current_time - self.request_timestamps[0]))
-                if self.input_token_usage:
-                    wait_time = max(wait_time, 60 - (current_time - self.input_token_usage[0][0]))
-                if self.output_token_usage:
-                    wait_time = max(wait_time, 60 - (current_time - self.output_token_usage[0][0]))
-                
-                # If wait_time is still <= 0, we won't fix usage by waiting
-                if wait_time <= 0:
-                    logger.warning(
-                        "Waiting cannot reduce usage enough to allow this request; "
-                        "request exceeds per-minute capacity or usage remains too high."
-                    )
-                    break
-                
-                logger.info(f"Rate limit approaching for {self.provider}. Waiting {wait_time:.2f} seconds...")
-                time.sleep(wait_time)
+            self.requests_per_minute = self.request_bucket.capacity
+            self.input_tokens_per_minute = self.input_token_bucket.capacity
+            self.output_tokens_per_minute = self.output_token_bucket.capacity
+        
+        if changed_limits:
+            logger.info(
+                f"Using the {self.provider} rate limits reported by the API: "
+                f"{self.requests_per_minute:,.0f} requests, {self.input_tokens_per_minute:,.0f} input tokens "
+                f"and {self.output_tokens_per_minute:,.0f} output tokens per minute (after buffer)"
+            )
+    
+    def pause(self, seconds: float):
+        """
+        Hold back every new request for a while, e.g. after the provider answered 429.
+        
+        The request bucket is emptied so that the next request fits only after the given
+        time, which also pauses other processes sharing the buckets. Afterwards requests
+        are paced at the refill rate until the bucket has filled up again, instead of
+        all waiting callers being sent at once.
+        
+        Args:
+            seconds: Seconds to pause
+        """
+        with self._bucket_lock():
+            bucket = self.request_bucket
+            bucket.refill(self.clock())
+            bucket.level = min(bucket.level, min(1, bucket.capacity) - seconds * bucket.refill_rate)
     
-    def record_request(self, input_tokens: int, output_tokens: int):
+    @staticmethod
+    def _settle(bucket: TokenBucket, unused: float):
+        """Give back reserved units that weren't used, or take the ones used beyond the reservation."""
+        if unused >= 0:
+            bucket.give_back(unused)
+        else:
+            bucket.take(-unused)
+    
+    def record_request(self, input_tokens: int, output_tokens: int, reservation: Optional[Reservation] = None,
+                       batch: bool = False, model: Optional[str] = None, prices: Optional[TokenPrices] = None):
         """
         Record an API request and its token usage.
         
         Args:
             input_tokens: Number of input tokens used
             output_tokens: Number of output tokens generated
+            reservation: Reservation the request was admitted with; the difference to the
+                         actual usage is taken from or given back to the buckets. Without
+                         it, the request and its usage are taken in full.
+            batch: Whether the request was answered by a batch job, which doesn't count
+                   against the per-minute limits and is charged at the batch price
+            model: Model that answered the request, to break the totals down by model
+            prices: Token prices of the model; the limiter's own prices if None
         """
-        with self.lock:
-            current_time = time.time()
+        # Calculate cost
+        total_cost = (prices or self.prices).cost(input_tokens, output_tokens)
+        if batch:
+            total_cost *= BATCH_PRICE_FACTOR
+        
+
+        with self._bucket_lock():
+            now = self.clock()
+            for bucket in self.buckets:
+                bucket.refill(now)
             
-            # Record request and token usage
-            self.request_timestamps.append(current_time)
-            self.input_token_usage.append((current_time, input_tokens))
-            self.output_token_usage.append((current_time, output_tokens))
+            # Batch jobs have separate limits of their own
+            if not batch:
+                if reservation is None:
+                    self.request_bucket.take(1)
+                    self.input_token_bucket.take(input_tokens)
+                    self.output_token_bucket.take(output_tokens)
+                else:
+                    self._settle(self.input_token_bucket, reservation.input_tokens - input_tokens)
+                    self._settle(self.output_token_bucket, reservation.output_tokens - output_tokens)
             
             # Update total stats
             self.total_requests += 1
             self.total_input_tokens += input_tokens
             self.total_output_tokens += output_tokens
-            
-            # Calculate cost
-            input_cost = input_tokens * self.input_token_price
-            output_cost = output_tokens * self.output_token_price
-            total_cost = input_cost + output_cost
             self.total_cost += total_cost
             
-            # Log usage and cost
-            logger.info(
-                f"{self.provider} Request: {self.total_requests} | "
-                f"Tokens: {input_tokens}in/{output_tokens}out | "
-                f"Cost: ${total_cost:.6f} | "
-                f"Total Cost: ${self.total_cost:.6f}"
-            )
+            model_usage = self.usage_by_model.setdefault(model or self.provider, UsageTracker())
+            model_usage.requests += 1
+            model_usage.input_tokens += input_tokens
+            model_usage.output_tokens += output_tokens
+            model_usage.cost += total_cost
+            
+            total_requests = self.total_requests
+            cumulative_cost = self.total_cost
+        
+        for tracker in _active_trackers.get():
+            tracker.requests += 1
+            tracker.input_tokens += input_tokens
+            tracker.output_tokens += output_tokens
+            tracker.cost += total_cost
+        
+        # Log usage and cost
+        logger.info(
+            f"{model or self.provider} {'Batch request' if batch else 'Request'}: {total_requests} | "
+            f"Tokens: {input_tokens}in/{output_tokens}out | "
+            f"Cost: ${total_cost:.6f} | "
+            f"Total Cost: ${cumulative_cost:.6f}"
+        )
     
     def print_usage_stats(self):
         """Print current usage statistics."""
@@ -183,4 +446,142 @@ class RateLimiter:
             logger.info(f"  Total Requests: {self.total_requests}")
             logger.info(f"  Total Input Tokens: {self.total_input_tokens}")
             logger.info(f"  Total Output Tokens: {self.total_output_tokens}")
-            logger.info(f"  Total Cost: ${self.total_cost:.6f}")
\ No newline at end of file
+            logger.info(f"  Total Cost: ${self.total_cost:.6f}")
+            if len(self.usage_by_model) > 1:
+                for model, usage in sorted(self.usage_by_model.items()):
+                    logger.info(
+                        f"  {model}: {usage.requests} requests | "
+                        f"Tokens: {usage.input_tokens}in/{usage.output_tokens}out | Cost: ${usage.cost:.6f}"
+                    )
+
+
+class FileRateLimiter(RateLimiter):
+    """
+    Rate limiter whose buckets are shared by all processes on the host.
+    
+    The bucket levels live in a small state file. Every check or update locks the file
+    with flock, reads the levels, updates them and writes them back, so processes
+    working with the same API key stay within one quota together. Usage totals and
+    costs are still kept per process. The wall clock is used, since the times stored
+    in the file are compared across processes.
+    """
+    
+    # Level and last update of the request, input token and output token buckets
+    STATE_FORMAT = struct.Struct("<6d")
+    
+    def __init__(self, provider: str, state_path: str, **limits):
+        """
+        Initialize the rate limiter and open its state file.
+        
+        Args:
+            provider: LLM provider name ("openai" or "claude")
+            state_path: Path to the state file, shared by all processes using the same API key
+            **limits: Limits and default prices, see RateLimiter
+        """
+        if fcntl is None:
+            raise ValueError("The file rate limiter backend requires fcntl, which is not available on this platform")
+        
+        super().__init__(provider, clock=time.time, **limits)
+        self.state_path = state_path
+        
+        state_dir = os.path.dirname(state_path)
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        self._fd = os.open(state_path, os.O_RDWR | os.O_CREAT, 0o600)
+    
+    @contextmanager
+    def _bucket_lock(self) -> Iterator[None]:
+        """Hold the thread lock and the file lock, and sync the buckets with the state file."""
+        with self.lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                self._load_state()
+                yield
+                self._save_state()
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+    
+    def _load_state(self):
+        """Read the bucket levels written by the last process; a new file keeps the full buckets."""
+        data = os.pread(self._fd, self.STATE_FORMAT.size, 0)
+        if len(data) != self.STATE_FORMAT.size:
+            return
+        
+        now = self.clock()
+        values = self.STATE_FORMAT.unpack(data)
+        for i, bucket in enumerate(self.buckets):
+            # Other processes may be configured with other limits, and the clock may
+            # have been set back since the file was written
+            bucket.level = min(bucket.capacity, values[2 * i])
+            bucket.updated = min(now, values[2 * i + 1])
+    
+    def _save_state(self):
+        """Write the bucket levels for the other processes."""
+        values = []
+        for bucket in self.buckets:
+            values.extend((bucket.level, bucket.updated))
+        os.pwrite(self._fd, self.STATE_FORMAT.pack(*values), 0)
+
+
+# (provider, API key hash) -> (limiter, limits it was created with), shared by every
+# agent and worker of the process
+_rate_limiters: Dict[Tuple[str, str], Tuple[RateLimiter, Dict[str, float]]] = {}
+_registry_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str, api_key: str, backend: Optional[Dict[str, Any]] = None, **limits) -> RateLimiter:
+    """
+    Get the shared rate limiter of a provider account, creating it on first use.
+    
+    All agents using the same API key draw from one quota, so they must share one
+    limiter; separate limiters would each allow the full rate.
+    
+    Args:
+        provider: LLM provider name ("OpenAI", "Claude" or "Gemini")
+        api_key: API key of the account
+        backend: The rate_limiter section of the config. Its "backend" is "memory" to
+                 share the limiter within this process (the default), or "file" to share
+                 it with all processes on the host through a state file in "state_dir"
+        **limits: Limits, see RateLimiter; used when the limiter is created. Prices
+                  depend on the model and are passed to record_request instead.
+        
+    Returns:
+        The rate limiter
+        
+    Raises:
+        ValueError: If the backend is not supported
+    """
+    backend = backend or {}
+    backend_type = backend.get("backend", "memory")
+    key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+    key = (provider, key_hash)
+    with _registry_lock:
+        entry = _rate_limiters.get(key)
+        if entry is None:
+            if backend_type == "memory":
+                limiter = RateLimiter(provider=provider, **limits)
+            elif backend_type == "file":
+                state_dir = backend.get("state_dir", "output/rate_limits")
+                state_path = os.path.join(state_dir, f"{provider.lower()}_{key_hash[:16]}.state")
+                limiter = FileRateLimiter(provider, state_path, **limits)
+            else:
+                raise ValueError(f"Unsupported rate limiter backend: {backend_type}")
+            entry = (limiter, limits)
+            _rate_limiters[key] = entry
+    
+    limiter, created_limits = entry
+    if limits != created_limits:
+        # Limits of a later agent can't change a limiter that is already in use
+        logger.warning(f"Ignoring different rate limits for the same {provider} API key; the first ones configured apply")
+    return limiter
+
+
+def get_rate_limiters() -> List[RateLimiter]:
+    """
+    Get every rate limiter created in this process.
+    
+    Returns:
+        The rate limiters, which also keep the token usage and cost totals
+    """
+    with _registry_lock:
+        return [limiter for limiter, _ in _rate_limiters.values()]
@@ -0,0 +1,446 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates
+"""
+Record and replay of LLM responses, for benchmarks and regression tests without network.
+
+In record mode every request is sent to a real LLM, and the request with its response,
+token usage and latency is appended to a recording. In replay mode the same requests
+are answered from the recording by the hash of the request, after a simulated latency,
+and their recorded token usage is counted as if they had been sent. The whole pipeline
+runs, context assembly, searches and agent loops included, and its results and usage
+are deterministic.
+
+A request missing from the recording is an error, so a replay never silently differs
+from the recorded run. Concurrent runs don't send exactly the same requests every time
+though: the file contents in a prompt include the docstrings other components got so
+far. For them, misses can be answered with the most similar recorded request of the
+same agent instead; how many were is reported with the other end-of-run statistics.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from .base import BaseLLM
+from .rate_limiter import TokenPrices, get_rate_limiter, track_usage
+from .response_cache import ResponseCache
+from .tokenizer import get_tokenizer
+
+logger = logging.getLogger("ReplayLLM")
+
+
+def _content_lines(messages: List[Dict[str, str]]) -> FrozenSet[str]:
+    """Get the distinct non-empty lines of the non-system messages, to compare requests by."""
+    return frozenset(
+        line for message in messages if message["role"] != "system"
+        for line in message["content"].splitlines() if line.strip()
+    )
+
+
+@dataclass
+class RecordedResponse:
+    """A request and its response in a recording."""
+    key: str
+    shape: str
+    messages: List[Dict[str, str]]
+    response: str
+    input_tokens: int
+    output_tokens: int
+    latency: float
+
+
+class Recording:
+    """
+    Append-only JSONL file of recorded responses, shared by all agents using it.
+
+    A request recorded several times is answered with its responses in turn.
+    """
+
+    def __init__(self, path: str):
+        """
+        Load a recording, creating its directory if needed.
+
+        Args:
+            path: Path of the JSONL file
+        """
+        self.path = path
+        self._responses: Dict[str, List[RecordedResponse]] = {}
+        # Shape -> (lines, key) of the requests of that shape, for finding similar ones
+        self._shapes: Dict[str, List[Tuple[FrozenSet[str], str]]] = {}
+        # Key -> number of times the request was replayed
+        self._replayed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        # Statistics: requests answered like a similar recorded one
+        self.closest_matches = 0
+
+        recording_dir = os.path.dirname(path)
+        if recording_dir:
+            os.makedirs(recording_dir, exist_ok=True)
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        response = RecordedResponse(**json.loads(line))
+                    except (ValueError, TypeError):
+                        # A line cut short when a recording run was killed
+                        continue
+                    self._add(response)
+            logger.info(f"Loaded {len(self)} recorded responses from {path}")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(responses) for responses in self._responses.values())
+
+    def _add(self, response: RecordedResponse) -> None:
+        """Index a response. Must be called with the lock held, or before the recording is shared."""
+        responses = self._responses.setdefault(response.key, [])
+        if not responses:
+            self._shapes.setdefault(response.shape, []).append((_content_lines(response.messages), response.key))
+        responses.append(response)
+
+    def append(self, response: RecordedResponse) -> None:
+        """
+        Add a response to the recording and write it to the file.
+
+        Args:
+            response: The response
+        """
+        line = json.dumps(asdict(response)) + "\n"
+        with self._lock:
+            self._add(response)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def next_response(self, key: str) -> Optional[RecordedResponse]:
+        """
+        Get the next recorded response of a request.
+
+        Args:
+            key: Key of the request, see ReplayLLM.request_key
+
+        Returns:
+            The response, or None if the request wasn't recorded
+        """
+        with self._lock:
+            responses = self._responses.get(key)
+            if not responses:
+                return None
+            replayed = self._replayed.get(key, 0)
+            self._replayed[key] = replayed + 1
+            return responses[replayed % len(responses)]
+
+    def print_stats(self) -> None:
+        """Print how many requests were replayed, and how many of them only approximately."""
+        with self._lock:
+            replayed = sum(self._replayed.values())
+            closest_matches = self.closest_matches
+        logger.info(f"Recording {self.path}:")
+        logger.info(f"  Replayed: {replayed} | Answered like a similar request: {closest_matches}")
+        if closest_matches:
+            logger.warning(f"{closest_matches} requests were missing from {self.path}; "
+                           f"their results differ from the recorded run")
+
+    def closest_key(self, shape: str, messages: List[Dict[str, str]]) -> Optional[str]:
+        """
+        Find the recorded request of a shape whose messages share the most lines with a request.
+
+        Args:
+            shape: Shape of the request, see ReplayLLM.request_shape
+            messages: Messages of the request
+
+        Returns:
+            The key of the most similar recorded request, or None if none has the shape
+        """
+        lines = _content_lines(messages)
+        best_key, best_similarity = None, -1.0
+        with self._lock:
+            candidates = list(self._shapes.get(shape, ()))
+        for recorded_lines, key in candidates:
+            union = len(lines | recorded_lines)
+            similarity = len(lines & recorded_lines) / union if union else 1.0
+            if similarity > best_similarity:
+                best_key, best_similarity = key, similarity
+
+        if best_key is not None:
+            with self._lock:
+                self.closest_matches += 1
+                first_match = self.closest_matches == 1
+            if first_match:
+                logger.info(f"Answering requests missing from {self.path} like the most similar recorded ones")
+        return best_key
+
+
+# Absolute path -> recording
+_recordings: Dict[str, Recording] = {}
+_registry_lock = threading.Lock()
+
+
+def get_recording(path: str) -> Recording:
+    """
+    Get the shared recording of a file, loading it on first use.
+
+    Args:
+        path: Path of the JSONL file
+
+    Returns:
+        The recording
+    """
+    key = os.path.abspath(path)
+    with _registry_lock:
+        recording = _recordings.get(key)
+        if recording is None:
+            recording = Recording(path)
+            _recordings[key] = recording
+        return recording
+
+
+def get_recordings() -> List[Recording]:
+    """
+    Get every recording loaded in this process.
+
+    Returns:
+        The recordings
+    """
+    with _registry_lock:
+        return list(_recordings.values())
+
+
+class ReplayLLM(BaseLLM):
+    """LLM that records the responses of another LLM, or replays them without network."""
+
+    def __init__(
+        self,
+        model: str,
+        recording_path: str,
+        mode: str = "replay",
+        recorded_llm: Optional[BaseLLM] = None,
+        latency_config: Optional[Dict[str, Any]] = None,
+        rate_limits: Optional[Dict[str, Any]] = None,
+        on_miss: str = "error"
+    ):
+        """
+        Initialize the replay LLM.
+
+        Args:
+            model: Name of the recorded model; part of the request keys
+            recording_path: Path of the recording
+            mode: "record" to answer with recorded_llm and record its responses, or
+                  "replay" to answer from the recording
+            recorded_llm: The LLM to record, required in record mode
+            latency_config: Optional latency section: "scale" multiplies the recorded
+                            latency (default 1.0, 0 answers at once), "per_request"
+                            replaces it by fixed seconds, and "per_output_token" adds
+                            seconds per recorded output token (default 0.0)
+            rate_limits: Token prices for the replayed usage, as in the rate_limits
+                         section of the recorded provider
+            on_miss: What to do with a request missing from the recording: "error" to
+                     raise a KeyError, or "closest" to answer it like the most similar
+                     recorded request of the same agent, for concurrent runs
+
+        Raises:
+            ValueError: If the mode or on_miss is not supported, or record mode has no
+                        LLM to record
+        """
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unsupported replay mode: {mode}")
+        if on_miss not in ("closest", "error"):
+            raise ValueError(f"Unsupported replay on_miss: {on_miss}")
+        if mode == "record" and recorded_llm is None:
+            raise ValueError("Record mode needs the recorded_llm to send the requests to")
+
+        self.model = model
+        self.mode = mode
+        self.recorded_llm = recorded_llm
+        self.recording = get_recording(recording_path)
+        self.on_miss = on_miss
+
+        latency_config = latency_config or {}
+        self.latency_scale = latency_config.get("scale", 1.0)
+        self.latency_per_request = latency_config.get("per_request")
+        self.latency_per_output_token = latency_config.get("per_output_token", 0.0)
+
+        # Local counts for recorded LLMs that don't report their usage
+        self.tokenizer = get_tokenizer()
+
+        # Recorded requests are counted by the recorded LLM, replayed ones on a limiter of
+        # their own, which never has to wait
+        limits = rate_limits or {}
+        if mode == "record":
+            self.rate_limiter = getattr(recorded_llm, "rate_limiter", None)
+        else:
+            self.rate_limiter = get_rate_limiter(
+                provider="Replay",
+                api_key=os.path.abspath(recording_path),
+                requests_per_minute=limits.get("requests_per_minute", 1_000_000),
+                input_tokens_per_minute=limits.get("input_tokens_per_minute", 1_000_000_000),
+                output_tokens_per_minute=limits.get("output_tokens_per_minute", 1_000_000_000)
+            )
+        self.prices = TokenPrices.per_million(
+            limits.get("input_token_price_per_million", 0.0),
+            limits.get("output_token_price_per_million", 0.0)
+        )
+
+    def request_key(self, messages: List[Dict[str, str]], temperature: float, max_tokens: Optional[int]) -> str:
+        """
+        Build the key of a request in the recording.
+
+        Args:
+            messages: List of message dictionaries
+            temperature: Sampling temperature
+            max_tokens: Maximum tokens to generate
+
+        Returns:
+            Hex digest identifying the request
+        """
+        return ResponseCache.make_key("replay", self.model, temperature, max_tokens, messages)
+
+    def request_shape(self, messages: List[Dict[str, str]], temperature: float, max_tokens: Optional[int]) -> str:
+        """
+        Build the key of the requests that only differ in their non-system contents.
+
+        Requests of the same shape come from the same agent at the same step of its loop.
+
+        Args:
+            messages: List of message dictionaries
+            temperature: Sampling temperature
+            max_tokens: Maximum tokens to generate
+
+        Returns:
+            Hex digest identifying the shape
+        """
+        outline = [
+            {"role": message["role"], "content": message["content"] if message["role"] == "system" else ""}
+            for message in messages
+        ]
+        return ResponseCache.make_key("replay", self.model, temperature, max_tokens, outline)
+
+    def _record(self, messages: List[Dict[str, str]], temperature: float, max_tokens: Optional[int],
+                response: str, usage: Any, latency: float) -> None:
+        """Add a request and the response of the recorded LLM to the recording."""
+        if usage.requests:
+            input_tokens, output_tokens = usage.input_tokens, usage.output_tokens
+        else:
+            input_tokens = self.tokenizer.count_messages(messages)
+            output_tokens = self.tokenizer.count(response)
+        self.recording.append(RecordedResponse(
+            key=self.request_key(messages, temperature, max_tokens),
+            shape=self.request_shape(messages, temperature, max_tokens),
+            messages=messages,
+            response=response,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            latency=latency
+        ))
+
+    def _replay(self, messages: List[Dict[str, str]], temperature: float, max_tokens: Optional[int]) -> RecordedResponse:
+        """
+        Get the recorded response of a request and count its usage.
+
+        Raises:
+            KeyError: If the request wasn't recorded, nor a similar one if on_miss allows it
+        """
+        key = self.request_key(messages, temperature, max_tokens)
+        recorded = self.recording.next_response(key)
+        if recorded is None and self.on_miss == "closest":
+            closest_key = self.recording.closest_key(self.request_shape(messages, temperature, max_tokens), messages)
+            if closest_key is not None:
+                recorded = self.recording.next_response(closest_key)
+        if recorded is None:
+            raise KeyError(f"Request {key[:12]} is not in the recording {self.recording.path}; "
+                           f"record it again with mode: record")
+        self.rate_limiter.record_request(recorded.input_tokens, recorded.output_tokens,
+                                         model=self.model, prices=self.prices)
+        return recorded
+
+    def _simulated_latency(self, recorded: RecordedResponse) -> float:
+        """Get the seconds a replayed request takes."""
+        if self.latency_per_request is not None:
+            latency = self.latency_per_request
+        else:
+            latency = recorded.latency * self.latency_scale
+        return latency + self.latency_per_output_token * recorded.output_tokens
+
+    def generate(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None
+    ) -> str:
+        """
+        Record the response of the recorded LLM, or replay it.
+
+        Args:
+            messages: List of message dictionaries
+            temperature: Sampling temperature
+            max_tokens: Maximum number of tokens to generate
+
+        Returns:
+            The generated or recorded response text
+
+        Raises:
+            KeyError: If the request wasn't recorded, nor a similar one if on_miss
+                      allows it, in replay mode
+        """
+        if self.mode == "record":
+            start_time = time.monotonic()
+            with track_usage() as usage:
+                response = self.recorded_llm.generate(messages=messages, temperature=temperature, max_tokens=max_tokens)
+            self._record(messages, temperature, max_tokens, response, usage, time.monotonic() - start_time)
+            return response
+
+        recorded = self._replay(messages, temperature, max_tokens)
+        time.sleep(self._simulated_latency(recorded))
+        return recorded.response
+
+    async def agenerate(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None
+    ) -> str:
+        """
+        Async version of generate that yields to the event loop while waiting.
+
+        Args:
+            messages: List of message dictionaries
+            temperature: Sampling temperature
+            max_tokens: Maximum number of tokens to generate
+
+        Returns:
+            The generated or recorded response text
+
+        Raises:
+            KeyError: If the request wasn't recorded, nor a similar one if on_miss
+                      allows it, in replay mode
+        """
+        if self.mode == "record":
+            start_time = time.monotonic()
+            with track_usage() as usage:
+                response = await self.recorded_llm.agenerate(messages=messages, temperature=temperature, max_tokens=max_tokens)
+            self._record(messages, temperature, max_tokens, response, usage, time.monotonic() - start_time)
+            return response
+
+        recorded = self._replay(messages, temperature, max_tokens)
+        await asyncio.sleep(self._simulated_latency(recorded))
+        return recorded.response
+
+    def format_message(self, role: str, content: str) -> Dict[str, str]:
+        """
+        Format a message like the recorded LLM, so requests match the recorded ones.
+
+        Args:
+            role: Message role (system, user, assistant)
+            content: Message content
+
+        Returns:
+            Formatted message dictionary
+        """
+        if self.recorded_llm is not None:
+            return self.recorded_llm.format_message(role, content)
+        return {"role": role, "content": content}
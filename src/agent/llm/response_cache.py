@@ -0,0 +1,216 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates
+"""
+Persistent cache of LLM responses.
+
+Re-running a repository after a small change sends most agents exactly the same prompts
+as before. Responses are stored in a SQLite database, keyed by a hash of the provider,
+model, sampling parameters and messages, so identical requests are answered from disk
+instead of being paid for again. Entries expire after a TTL and the least recently
+used ones are evicted once the database outgrows its size limit.
+"""
+
+import os
+import time
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("ResponseCache")
+
+
+class ResponseCache:
+    """SQLite-backed LRU cache of LLM responses with a TTL."""
+
+    def __init__(self, path: str, max_size_mb: float = 512, ttl_days: Optional[float] = 30):
+        """
+        Open the cache database, creating it if needed.
+
+        Args:
+            path: Path of the SQLite database
+            max_size_mb: Total size of the cached responses beyond which the least
+                         recently used ones are evicted
+            ttl_days: Age after which a response is not reused, or None to keep responses
+                      until they are evicted
+        """
+        self.path = path
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.ttl = ttl_days * 24 * 3600 if ttl_days else None
+
+        # Statistics of this process
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        cache_dir = os.path.dirname(path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        # One connection shared by all threads; WAL lets other processes read while one writes
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+        if self.ttl:
+            self._connection.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        self._size = self._total_size()
+
+    @staticmethod
+    def make_key(provider: str, model: str, temperature: float, max_tokens: Optional[int],
+                 messages: List[Dict[str, Any]]) -> str:
+        """
+        Build the cache key of a request.
+
+        Args:
+            provider: LLM provider type (e.g. "claude")
+            model: Model identifier
+            temperature: Sampling temperature
+            max_tokens: Maximum tokens to generate
+            messages: List of message dictionaries
+
+        Returns:
+            Hex digest identifying the request
+        """
+        request = {
+            "provider": provider,
+            "model": model,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "messages": messages
+        }
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _total_size(self) -> int:
+        """Get the total size of the cached responses from the database."""
+        return self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Get the cached response of a request.
+
+        Args:
+            key: Cache key of the request, see make_key
+
+        Returns:
+            The response, or None if it isn't cached or has expired
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl and row[1] < now - self.ttl):
+                self.misses += 1
+                return None
+            self._connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        """
+        Cache the response of a request, evicting old responses if the cache is full.
+
+        Args:
+            key: Cache key of the request, see make_key
+            response: The response to cache
+        """
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            # A replaced response no longer counts; read its size in the same transaction
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                    (key, response, size, now, now)
+                )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._size += size - (row[0] if row else 0)
+            if self._size > self.max_size:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Evict the least recently used responses down to 90% of the size limit. Must be called with the lock held."""
+        # Other processes may have written to the database too
+        self._size = self._total_size()
+        target_size = self.max_size * 0.9
+        while self._size > target_size:
+            rows = self._connection.execute(
+                "SELECT key, size FROM responses ORDER BY last_used LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            
+            # Only evict as many as needed, the batch may reach recently used responses
+            evicted = []
+            for key, size in rows:
+                if self._size <= target_size:
+                    break
+                evicted.append((key,))
+                self._size -= size
+            self._connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+            self.evictions += len(evicted)
+
+    def print_stats(self) -> None:
+        """Print the hit and miss statistics of this process."""
+        with self._lock:
+            requests = self.hits + self.misses
+            hit_rate = self.hits / requests if requests else 0.0
+            entries = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            logger.info(f"Response cache {self.path}:")
+            logger.info(f"  Hits: {self.hits} | Misses: {self.misses} | Hit rate: {hit_rate:.1%}")
+            logger.info(f"  Evictions: {self.evictions} | Entries: {entries} | Size: {self._size / (1024 * 1024):.2f} MB")
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
+
+
+# Database path -> cache, shared by every agent of the process
+_caches: Dict[str, ResponseCache] = {}
+_registry_lock = threading.Lock()
+
+
+def get_response_cache(path: str, max_size_mb: float = 512, ttl_days: Optional[float] = 30) -> ResponseCache:
+    """
+    Get the shared cache of a database, opening it on first use.
+
+    Args:
+        path: Path of the SQLite database
+        max_size_mb: Size limit, used when the cache is opened
+        ttl_days: Time to live, used when the cache is opened
+
+    Returns:
+        The cache
+    """
+    key = os.path.abspath(path)
+    with _registry_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = ResponseCache(path, max_size_mb=max_size_mb, ttl_days=ttl_days)
+            _caches[key] = cache
+        return cache
+
+
+def get_response_caches() -> List[ResponseCache]:
+    """
+    Get every cache opened in this process.
+
+    Returns:
+        The caches
+    """
+    with _registry_lock:
+        return list(_caches.values())
@@ -0,0 +1,276 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates
+"""
+Retries of LLM API calls that failed because of rate limits or server errors.
+
+Failed calls are retried with exponential backoff and jitter, or after the delay the
+provider asked for in a retry-after header. The rate limit headers of every response,
+failed or not, are fed back into the rate limiter, so its limits follow the quota the
+provider actually grants instead of the configured one.
+"""
+
+import time
+import random
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Mapping, Optional, TypeVar
+
+logger = logging.getLogger("LLMRetry")
+
+T = TypeVar("T")
+
+# Request timeout, conflict, rate limited, server errors and Anthropic's "overloaded"
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+# Errors without a status code that are worth retrying, by class name, so that the
+# provider SDKs don't need to be imported here
+RETRYABLE_ERROR_NAMES = {"APIConnectionError", "APITimeoutError", "ConnectionError", "TimeoutError"}
+
+
+@dataclass
+class RateLimitInfo:
+    """Rate limit state reported by a provider in its response headers."""
+    retry_after: Optional[float] = None
+    requests_limit: Optional[float] = None
+    requests_remaining: Optional[float] = None
+    input_tokens_limit: Optional[float] = None
+    input_tokens_remaining: Optional[float] = None
+    output_tokens_limit: Optional[float] = None
+    output_tokens_remaining: Optional[float] = None
+
+
+def _parse_number(value: Optional[str]) -> Optional[float]:
+    """Parse a numeric header value, ignoring malformed ones."""
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Get the seconds to wait from retry-after-ms or retry-after, in seconds or as an HTTP date."""
+    retry_after_ms = _parse_number(headers.get("retry-after-ms"))
+    if retry_after_ms is not None:
+        return max(0.0, retry_after_ms / 1000)
+
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    seconds = _parse_number(value)
+    if seconds is not None:
+        return max(0.0, seconds)
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_rate_limit_headers(headers: Optional[Mapping[str, str]]) -> RateLimitInfo:
+    """
+    Read the rate limit headers of an Anthropic or OpenAI response.
+
+    OpenAI reports a single token limit for input and output together; it is applied
+    to the input tokens, which make up most of it.
+
+    Args:
+        headers: Response headers, or None
+
+    Returns:
+        The reported rate limit state; fields without a header are None
+    """
+    if not headers:
+        return RateLimitInfo()
+    headers = {key.lower(): value for key, value in headers.items()}
+
+    def first(*names: str) -> Optional[float]:
+        for name in names:
+            value = _parse_number(headers.get(name))
+            if value is not None:
+                return value
+        return None
+
+    return RateLimitInfo(
+        retry_after=_parse_retry_after(headers),
+        requests_limit=first("anthropic-ratelimit-requests-limit", "x-ratelimit-limit-requests"),
+        requests_remaining=first("anthropic-ratelimit-requests-remaining", "x-ratelimit-remaining-requests"),
+        input_tokens_limit=first("anthropic-ratelimit-input-tokens-limit", "x-ratelimit-limit-tokens"),
+        input_tokens_remaining=first("anthropic-ratelimit-input-tokens-remaining", "x-ratelimit-remaining-tokens"),
+        output_tokens_limit=first("anthropic-ratelimit-output-tokens-limit"),
+        output_tokens_remaining=first("anthropic-ratelimit-output-tokens-remaining")
+    )
+
+
+def _error_status(error: BaseException) -> Optional[int]:
+    """Get the HTTP status of an API error (status_code in OpenAI and Anthropic, code in Google)."""
+    for name in ("status_code", "code"):
+        status = getattr(error, name, None)
+        if isinstance(status, int):
+            return int(status)
+    return None
+
+
+def _error_headers(error: BaseException) -> Optional[Mapping[str, str]]:
+    """Get the response headers of an API error, if it has a response."""
+    return getattr(getattr(error, "response", None), "headers", None)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Check whether a failed call may succeed when tried again.
+
+    Args:
+        error: The error raised by the call
+
+    Returns:
+        True for rate limits, server errors, timeouts and connection errors
+    """
+    status = _error_status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__)
+
+
+class RetryPolicy:
+    """How often and how long to retry failed LLM API calls."""
+
+    def __init__(self, max_retries: int = 6, initial_delay: float = 1.0, max_delay: float = 60.0):
+        """
+        Initialize the policy.
+
+        Args:
+            max_retries: Retries after the first attempt before the error is raised
+            initial_delay: Backoff before the first retry in seconds, doubled for every retry
+            max_delay: Longest backoff in seconds; a longer retry-after is still honored
+        """
+        self.max_retries = max_retries
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Compute how long to wait before a retry.
+
+        Args:
+            attempt: Number of retries made so far
+            retry_after: Seconds the provider asked to wait, if it did
+
+        Returns:
+            Seconds to wait
+        """
+        if retry_after is not None:
+            # Callers that were told the same time shouldn't all come back at once
+            return retry_after + random.uniform(0, 0.1 * retry_after + 0.1)
+
+        # Exponential backoff with equal jitter: at least half the backoff, at most all of it
+        backoff = min(self.max_delay, self.initial_delay * 2 ** attempt)
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+def _prepare_retry(error: BaseException, attempt: int, policy: RetryPolicy, rate_limiter: Any) -> Optional[float]:
+    """
+    Decide whether to retry a failed call and report its rate limit headers.
+
+    Args:
+        error: The error raised by the call
+        attempt: Number of retries made so far
+        policy: The retry policy
+        rate_limiter: Rate limiter to report the headers to, or None
+
+    Returns:
+        Seconds to wait before retrying, or None if the error should be raised
+    """
+    if attempt >= policy.max_retries or not is_retryable(error):
+        return None
+
+    info = parse_rate_limit_headers(_error_headers(error))
+    delay = policy.delay(attempt, info.retry_after)
+    if rate_limiter:
+        rate_limiter.observe(info)
+        if _error_status(error) == 429:
+            # Hold back the other callers of the same account too
+            rate_limiter.pause(delay)
+
+    status = _error_status(error)
+    reason = f"status {status}" if status is not None else type(error).__name__
+    logger.warning(f"LLM call failed with {reason}; retry {attempt + 1}/{policy.max_retries} in {delay:.1f} seconds")
+    return delay
+
+
+def call_with_retries(send: Callable[[], T], policy: RetryPolicy, rate_limiter: Any = None,
+                      get_headers: Optional[Callable[[T], Mapping[str, str]]] = None) -> T:
+    """
+    Call an LLM API, retrying rate limit and server errors.
+
+    Args:
+        send: Function making the call
+        policy: The retry policy
+        rate_limiter: Rate limiter to report rate limit headers to and to wait for before
+                      every retry, or None
+        get_headers: Function returning the headers of a successful result, or None
+
+    Returns:
+        The result of the first successful call
+
+    Raises:
+        Exception: The error of the last attempt, if no attempt succeeded or the error
+                   is not worth retrying
+    """
+    attempt = 0
+    while True:
+        try:
+            result = send()
+        except Exception as error:
+            delay = _prepare_retry(error, attempt, policy, rate_limiter)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            if rate_limiter:
+                # The retry is another request; the tokens are still covered by the
+                # reservation of the first attempt
+                rate_limiter.wait_if_needed(0, 0)
+            attempt += 1
+            continue
+
+        if rate_limiter and get_headers:
+            rate_limiter.observe(parse_rate_limit_headers(get_headers(result)))
+        return result
+
+
+async def acall_with_retries(send: Callable[[], Awaitable[T]], policy: RetryPolicy, rate_limiter: Any = None,
+                             get_headers: Optional[Callable[[T], Mapping[str, str]]] = None) -> T:
+    """
+    Async version of call_with_retries that yields to the event loop while waiting.
+
+    Args:
+        send: Function returning an awaitable that makes the call
+        policy: The retry policy
+        rate_limiter: Rate limiter to report rate limit headers to and to wait for before
+                      every retry, or None
+        get_headers: Function returning the headers of a successful result, or None
+
+    Returns:
+        The result of the first successful call
+
+    Raises:
+        Exception: The error of the last attempt, if no attempt succeeded or the error
+                   is not worth retrying
+    """
+    attempt = 0
+    while True:
+        try:
+            result = await send()
+        except Exception as error:
+            delay = _prepare_retry(error, attempt, policy, rate_limiter)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            if rate_limiter:
+                await rate_limiter.acquire(0, 0)
+            attempt += 1
+            continue
+
+        if rate_limiter and get_headers:
+            rate_limiter.observe(parse_rate_limit_headers(get_headers(result)))
+        return result
@@ -0,0 +1,296 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates
+"""
+Process-wide tokenizers with memoized token counts.
+
+The same texts are counted over and over: prompts, focal components, context sections
+and the growing message histories of the agents. Every encoding is loaded once per
+process, and its token counts are kept in an LRU cache keyed by a hash of the text,
+so a text already seen costs a hash instead of a full encode. Providers whose tokenizer
+isn't available locally get an estimate calibrated against the counts they report,
+instead of a network round trip per count.
+"""
+
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+import tiktoken
+
+
+class Tokenizer:
+    """A tiktoken encoding with an LRU cache of token counts."""
+
+    def __init__(self, encoding: Any, cache_size: int = 65536):
+        """Initialize the tokenizer.
+
+        Args:
+            encoding: The tiktoken encoding
+            cache_size: Maximum number of token counts kept
+        """
+        self.encoding = encoding
+        self.name = encoding.name
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+
+        # Content hash -> token count, least recently used first
+        self._counts: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode(self, text: str) -> List[int]:
+        """Encode a text into tokens."""
+        return self.encoding.encode(text)
+
+    def decode(self, tokens: List[int]) -> str:
+        """Decode tokens into a text."""
+        return self.encoding.decode(tokens)
+
+    def count(self, text: str) -> int:
+        """Count the tokens of a text, reusing the count of an identical text.
+
+        Args:
+            text: Text to count tokens for
+
+        Returns:
+            Token count
+        """
+        if not text:
+            return 0
+
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+                self.hits += 1
+                return count
+
+        # Encode without holding the lock, so other threads can count meanwhile
+        count = len(self.encoding.encode(text))
+
+        with self._lock:
+            self.misses += 1
+            self._counts[key] = count
+            if len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+        return count
+
+    def truncate(self, text: str, max_tokens: int, keep_end: bool = False) -> str:
+        """Cut a text down to its first (or last) max_tokens tokens.
+
+        Args:
+            text: Text to truncate
+            max_tokens: Maximum number of tokens to keep
+            keep_end: Keep the last tokens instead of the first ones
+
+        Returns:
+            The text itself if it fits, otherwise its truncated version
+        """
+        if self.count(text) <= max_tokens:
+            return text
+        if max_tokens <= 0:
+            return ""
+        tokens = self.encoding.encode(text)
+        return self.encoding.decode(tokens[-max_tokens:] if keep_end else tokens[:max_tokens])
+
+    def count_messages(self, messages: List[Dict[str, Any]], tokens_per_message: int = 0,
+                       tokens_per_reply: int = 0) -> int:
+        """Count the tokens of a list of messages.
+
+        Args:
+            messages: List of message dictionaries
+            tokens_per_message: Formatting overhead of every message
+            tokens_per_reply: Overhead of priming the reply
+
+        Returns:
+            Total token count
+        """
+        total_tokens = sum(self.count(message.get("content")) for message in messages)
+        return total_tokens + tokens_per_message * len(messages) + tokens_per_reply
+
+
+class MessageTokenCounter:
+    """
+    Counts the tokens of a message history that grows between calls.
+
+    The messages counted last are remembered with their running total. As long as the
+    next list starts with the very same message objects and contents, that prefix is
+    not counted again, so adding a turn only costs the tokens of the new messages.
+    """
+
+    def __init__(self, tokenizer: Tokenizer, tokens_per_message: int = 0, tokens_per_reply: int = 0):
+        """Initialize the counter.
+
+        Args:
+            tokenizer: Tokenizer of the model
+            tokens_per_message: Formatting overhead of every message
+            tokens_per_reply: Overhead of priming the reply
+        """
+        self.tokenizer = tokenizer
+        self.tokens_per_message = tokens_per_message
+        self.tokens_per_reply = tokens_per_reply
+
+        # (message, content, total tokens up to and including the message)
+        self._counted: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def count(self, messages: List[Dict[str, Any]]) -> int:
+        """Count the tokens of a list of messages.
+
+        Args:
+            messages: List of message dictionaries
+
+        Returns:
+            Total token count, including the message and reply overheads
+        """
+        if not messages:
+            return 0
+
+        with self._lock:
+            counted = self._counted
+
+        # Find how many leading messages are unchanged since the last call
+        prefix = 0
+        for message, (counted_message, counted_content, _) in zip(messages, counted):
+            if message is not counted_message or message.get("content") is not counted_content:
+                break
+            prefix += 1
+
+        counted = counted[:prefix]
+        total_tokens = counted[-1][2] if counted else 0
+        for message in messages[prefix:]:
+            content = message.get("content")
+            total_tokens += self.tokenizer.count(content) + self.tokens_per_message
+            counted.append((message, content, total_tokens))
+
+        with self._lock:
+            self._counted = counted
+        return total_tokens + self.tokens_per_reply
+
+
+# Encoding name -> tokenizer, shared by every agent of the process
+_tokenizers: Dict[str, Tokenizer] = {}
+# Model name -> encoding name
+_model_encodings: Dict[str, str] = {}
+_registry_lock = threading.Lock()
+
+
+def get_tokenizer(encoding_name: str = "cl100k_base") -> Tokenizer:
+    """Get the shared tokenizer of an encoding, loading the encoding on first use.
+
+    Args:
+        encoding_name: Name of the tiktoken encoding
+
+    Returns:
+        The tokenizer
+    """
+    with _registry_lock:
+        tokenizer = _tokenizers.get(encoding_name)
+        if tokenizer is None:
+            tokenizer = Tokenizer(tiktoken.get_encoding(encoding_name))
+            _tokenizers[encoding_name] = tokenizer
+        return tokenizer
+
+
+def get_tokenizer_for_model(model: str, default_encoding: str = "cl100k_base") -> Tokenizer:
+    """Get the shared tokenizer of a model's encoding.
+
+    Args:
+        model: Model identifier
+        default_encoding: Encoding used for models tiktoken doesn't know
+
+    Returns:
+        The tokenizer
+    """
+    with _registry_lock:
+        encoding_name = _model_encodings.get(model)
+    if encoding_name is None:
+        try:
+            encoding_name = tiktoken.encoding_for_model(model).name
+        except KeyError:
+            # Fall back to the default encoding for new or non-OpenAI models
+            encoding_name = default_encoding
+        with _registry_lock:
+            _model_encodings[model] = encoding_name
+    return get_tokenizer(encoding_name)
+
+
+class CalibratedTokenEstimator:
+    """
+    Estimates a provider's token counts locally, for providers with their own tokenizer.
+
+    Messages are counted with a tiktoken tokenizer and scaled by the ratio between the
+    input tokens the provider reported for earlier requests and the local counts of the
+    same requests. The ratio is a running average that favors recent requests, so it
+    follows the mix of prompts and code being sent.
+    """
+
+    def __init__(self, tokenizer: Tokenizer, tokens_per_message: int = 0, initial_ratio: float = 1.1,
+                 decay: float = 0.9):
+        """Initialize the estimator.
+
+        Args:
+            tokenizer: Tokenizer used for the local counts
+            tokens_per_message: Formatting overhead of every message
+            initial_ratio: Ratio used until the first reported count; a bit above 1 keeps
+                           the rate limiter on the safe side
+            decay: Weight kept by earlier requests at every calibration
+        """
+        self.tokenizer = tokenizer
+        self.message_counter = MessageTokenCounter(tokenizer, tokens_per_message=tokens_per_message)
+        self.ratio = initial_ratio
+        self.decay = decay
+
+        # Decayed sums of local and reported counts
+        self._local_tokens = 0.0
+        self._reported_tokens = 0.0
+        self._lock = threading.Lock()
+
+    def count_local(self, messages: List[Dict[str, Any]]) -> int:
+        """Count the tokens of a message list with the local tokenizer.
+
+        Args:
+            messages: List of message dictionaries
+
+        Returns:
+            Uncalibrated token count
+        """
+        return self.message_counter.count(messages)
+
+    def estimate(self, local_tokens: int) -> int:
+        """Turn a local token count into an estimate of the provider's count.
+
+        Args:
+            local_tokens: Token count of the local tokenizer
+
+        Returns:
+            Estimated provider token count
+        """
+        return math.ceil(local_tokens * self.ratio)
+
+    def estimate_text(self, text: str) -> int:
+        """Estimate the provider's token count of a text.
+
+        Args:
+            text: Text to count tokens for
+
+        Returns:
+            Estimated provider token count
+        """
+        return self.estimate(self.tokenizer.count(text))
+
+    def calibrate(self, local_tokens: int, reported_tokens: int) -> None:
+        """Update the ratio with the count the provider reported for a request.
+
+        Args:
+            local_tokens: Local token count of the request
+            reported_tokens: Token count reported by the provider for the same request
+        """
+        if local_tokens <= 0 or reported_tokens <= 0:
+            return
+        with self._lock:
+            self._local_tokens = self.decay * self._local_tokens + local_tokens
+            self._reported_tokens = self.decay * self._reported_tokens + reported_tokens
+            self.ratio = self._reported_tokens / self._local_tokens
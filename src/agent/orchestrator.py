@@ -1,16 +1,16 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates
-from typing import Dict, Any, Optional, List
-import time
+from typing import Dict, Any, Generator, Optional, List, Tuple
 from .base import BaseAgent
 from .reader import Reader
 from .searcher import Searcher
 from .writer import Writer
 from .verifier import Verifier
+from .llm.batch import BatchCollector, BatchingLLM
+from .llm.factory import LLMFactory
+from .llm.tokenizer import get_tokenizer
 from visualizer import StatusVisualizer
 import re
-import yaml
 import ast
-import tiktoken
 
 # Dummy visualizer class that mimics StatusVisualizer but does nothing
 class DummyVisualizer:
@@ -27,17 +27,23 @@ class DummyVisualizer:
     def update(self, agent_name, status):
         """Do nothing."""
         pass
+    
+    def close(self):
+        """Do nothing."""
+        pass
 
 class Orchestrator(BaseAgent):
     """Agent responsible for managing the workflow between all other agents."""
     
-    def __init__(self, repo_path: str, config_path: Optional[str] = None, test_mode: Optional[str] = None):
+    def __init__(self, repo_path: str, config_path: Optional[str] = None, test_mode: Optional[str] = None,
+                 show_status: bool = True):
         """Initialize the Orchestrator agent and its sub-agents.
         
         Args:
             repo_path: Path to the repository being analyzed
             config_path: Optional path to the configuration file
             test_mode: Optional test mode to run only specific components. Values: "reader_searcher", "context_print" or None
+            show_status: Whether to display the agent workflow status; headless runs pass False
         """
         super().__init__("Orchestrator")
         self.repo_path = repo_path
@@ -47,13 +53,13 @@ class Orchestrator(BaseAgent):
         # Load configuration
         self.config = {}
         if config_path:
-            with open(config_path, 'r') as f:
-                self.config = yaml.safe_load(f)
+            self.config = LLMFactory.load_config(config_path)
         
         # Get flow control parameters with defaults
         flow_config = self.config.get('flow_control', {})
         self.max_reader_search_attempts = flow_config.get('max_reader_search_attempts', 4)
         self.max_verifier_rejections = flow_config.get('max_verifier_rejections', 3)
+        # Refresh interval of the status display; it paces the display only, never the workflow
         self.status_sleep_time = flow_config.get('status_sleep_time', 3)
         
         # Check model type for context constraints
@@ -64,11 +70,11 @@ class Orchestrator(BaseAgent):
         if 'max_input_tokens' not in self.config:
             self.config['max_input_tokens'] = llm_config.get('max_input_tokens', 10000)
         
-        # Initialize visualization - use dummy visualizer for "context_print" test mode
-        if test_mode == "context_print":
+        # Initialize visualization - use dummy visualizer for "context_print" test mode and headless runs
+        if test_mode == "context_print" or not show_status:
             self.visualizer = DummyVisualizer()
         else:
-            self.visualizer = StatusVisualizer()
+            self.visualizer = StatusVisualizer(refresh_interval=self.status_sleep_time)
         
         # Initialize all sub-agents
         self.reader = Reader(config_path=config_path)
@@ -79,6 +85,16 @@ class Orchestrator(BaseAgent):
             self.writer = Writer(config_path=config_path)
             self.verifier = Verifier(config_path=config_path)
 
+    def use_batches(self, collector: BatchCollector) -> None:
+        """Send the async requests of all agents through provider batch jobs.
+        
+        Args:
+            collector: The collector shared by the orchestrators running concurrently
+        """
+        for agent in (self, self.reader, self.searcher, getattr(self, "writer", None), getattr(self, "verifier", None)):
+            if agent is not None and not isinstance(agent.llm, BatchingLLM):
+                agent.llm = BatchingLLM(agent.llm, collector)
+
     def _parse_verifier_response(self, response: str) -> Dict[str, Any]:
         """Parse the verifier's XML response into a structured format.
         
@@ -146,6 +162,72 @@ class Orchestrator(BaseAgent):
         Returns:
             The generated and verified docstring, or reader response in test mode
         """
+        steps = self._workflow(focal_component, file_path, ast_node, ast_tree, dependency_graph,
+                                focal_node_dependency_path, token_consume_focal)
+        try:
+            agent, args = next(steps)
+            while True:
+                agent, args = steps.send(agent.process(*args))
+        except StopIteration as finished:
+            return finished.value
+
+    async def aprocess(
+        self,
+        focal_component: str,
+        file_path: str,
+        ast_node: ast.AST = None,
+        ast_tree: ast.AST = None,
+        dependency_graph: Dict[str, List[str]] = None,
+        focal_node_dependency_path: str = None,
+        token_consume_focal: int = 0
+    ) -> str:
+        """Async version of process that awaits every agent call.
+        
+        The orchestrator keeps the state of one component at a time (context and agent
+        memories), so concurrent components each need their own orchestrator; their
+        requests then share a single event loop instead of one thread each.
+        
+        Args:
+            focal_component: The code component needing a docstring (full code snippet)
+            file_path: Path to the file containing the component (Only input relative file path to the belonged repo!)
+            ast_node: Optional AST node representing the focal component
+            ast_tree: Optional AST tree for the entire file
+            
+        Returns:
+            The generated and verified docstring, or reader response in test mode
+        """
+        steps = self._workflow(focal_component, file_path, ast_node, ast_tree, dependency_graph,
+                                focal_node_dependency_path, token_consume_focal)
+        try:
+            agent, args = next(steps)
+            while True:
+                agent, args = steps.send(await agent.aprocess(*args))
+        except StopIteration as finished:
+            return finished.value
+
+    def _workflow(
+        self,
+        focal_component: str,
+        file_path: str,
+        ast_node: ast.AST = None,
+        ast_tree: ast.AST = None,
+        dependency_graph: Dict[str, List[str]] = None,
+        focal_node_dependency_path: str = None,
+        token_consume_focal: int = 0
+    ) -> Generator[Tuple[BaseAgent, tuple], Any, str]:
+        """The agent workflow of process and aprocess, as a generator of agent calls.
+        
+        Every agent call is yielded as the agent and the arguments of its process method,
+        and the caller sends the agent's response back, calling the agent either
+        synchronously or asynchronously. The generator returns the final docstring.
+        
+        Args:
+            See process
+            
+        Returns:
+            Generator yielding (agent, args) and returning the docstring, or reader
+            response in test mode
+        """
         # Reset visualization and set current component
         self.visualizer.reset()
         self.visualizer.set_current_component(focal_component, file_path)
@@ -158,10 +240,7 @@ class Orchestrator(BaseAgent):
         while True:
             # Step 1: Reader determines if more context is needed
             self.visualizer.update('reader', "Analyzing code component...")
-            reader_response = self.reader.process(
-                focal_component,
-                self.context
-            )
+            reader_response = yield self.reader, (focal_component, self.context)
             # add reader_response to reader's memory (assistant)
             self.reader.add_to_memory("assistant", reader_response)
             
@@ -172,13 +251,10 @@ class Orchestrator(BaseAgent):
             if needs_info and reader_search_attempts < self.max_reader_search_attempts:
                 reader_search_attempts += 1
                 self.visualizer.update('reader', f"Need more information (attempt {reader_search_attempts}/{self.max_reader_search_attempts}), ask Searcher to search additional context...")
-                if self.test_mode != "context_print":
-                    time.sleep(self.status_sleep_time)
                 # Use Searcher to gather more information
                 self.visualizer.update('searcher', "Searching for additional context...")
-                if self.test_mode != "context_print":
-                    time.sleep(self.status_sleep_time)
-                search_results = self.searcher.process(reader_response, ast_node, ast_tree, dependency_graph, focal_node_dependency_path)
+                search_results = yield self.searcher, (reader_response, ast_node, ast_tree, dependency_graph,
+                                                       focal_node_dependency_path)
                 self._update_context(search_results, token_consume_focal)
                 # Refresh reader's memory with new context
                 self.reader.refresh_memory([
@@ -186,17 +262,11 @@ class Orchestrator(BaseAgent):
                     {"role": "user", "content": f"Current context:\n{self.context}"}
                 ])
                 self.visualizer.update('reader', "Search complete, Context updated, restarting analysis...")
-                if self.test_mode != "context_print":
-                    time.sleep(self.status_sleep_time)
                 continue
             elif needs_info:
                 self.visualizer.update('reader', f"Max search attempts ({self.max_reader_search_attempts}) reached, proceeding with current context...")
-                if self.test_mode != "context_print":
-                    time.sleep(self.status_sleep_time)
 
             self.visualizer.update('reader', "No additional context needed, starting docstring generation...")
-            if self.test_mode != "context_print":
-                time.sleep(self.status_sleep_time)
             
             # If in reader_searcher test mode, return after context gathering
             if self.test_mode == "reader_searcher":
@@ -212,21 +282,14 @@ class Orchestrator(BaseAgent):
                     print(self.context)
                     print("=== END OF CONTEXT ===\n")
                 
-                docstring = self.writer.process(
-                    focal_component,
-                    self.context
-                )
+                docstring = yield self.writer, (focal_component, self.context)
                 # assert docstring is not empty
                 # add writer_response to writer's memory (assistant)
                 self.writer.add_to_memory("assistant", docstring)
 
                 # Step 4: Use Verifier to check the quality
                 self.visualizer.update('verifier', "Verifying docstring quality...")
-                verification_response = self.verifier.process(
-                    focal_component,
-                    docstring,
-                    self.context
-                )
+                verification_response = yield self.verifier, (focal_component, docstring, self.context)
                 
                 # Step 5: Parse and process verification results
                 verification_result = self._parse_verifier_response(verification_response)
@@ -236,8 +299,6 @@ class Orchestrator(BaseAgent):
                         self.visualizer.update('verifier', f"Max rejection attempts ({self.max_verifier_rejections}) reached, accepting current docstring.")
                     else:
                         self.visualizer.update('verifier', "Docstring generated successfully! No need for revision.")
-                    if self.test_mode != "context_print":
-                        time.sleep(self.status_sleep_time)
                     return docstring
                 # if needs_revision is true, then needs_context is true
                 else:
@@ -246,8 +307,6 @@ class Orchestrator(BaseAgent):
                     self.verifier.clear_memory()
                     if verification_result['needs_context'] and reader_search_attempts < self.max_reader_search_attempts:
                         self.visualizer.update('verifier', f"Need more context (rejection {verifier_rejection_count}/{self.max_verifier_rejections}), hands back to reader...")
-                        if self.test_mode != "context_print":
-                            time.sleep(self.status_sleep_time)
                         # Add context suggestion to reader's memory and break inner loop to get more context
                         self.reader.add_to_memory(
                             "user",
@@ -260,8 +319,6 @@ class Orchestrator(BaseAgent):
                         break  # Break inner loop to return to reader-searcher cycle
                     else:
                         self.visualizer.update('verifier', f"Content is not good enough (rejection {verifier_rejection_count}/{self.max_verifier_rejections}), hands back to writer...")
-                        if self.test_mode != "context_print":
-                            time.sleep(self.status_sleep_time)
                         # Add improvement suggestion to writer's memory and continue inner loop
                         self.writer.add_to_memory(
                             "user",
@@ -372,9 +429,9 @@ class Orchestrator(BaseAgent):
             token_consume_focal: Number of tokens consumed by the focal component itself
         """
         try:
-            # Use tiktoken to count tokens
-            encoding = tiktoken.get_encoding("cl100k_base")  # Using a common encoding
-            current_tokens = len(encoding.encode(self.context))
+            # Use the shared tokenizer, which remembers the counts of unchanged sections
+            tokenizer = get_tokenizer("cl100k_base")  # Using a common encoding
+            current_tokens = tokenizer.count(self.context)
             
             # Check if we need to truncate considering both context and focal component tokens
             if current_tokens + token_consume_focal <= max_input_tokens:
@@ -394,7 +451,7 @@ class Orchestrator(BaseAgent):
                 match = re.search(pattern, self.context, re.DOTALL)
                 if match:
                     content = match.group(1)
-                    tokens = len(encoding.encode(content))
+                    tokens = tokenizer.count(content)
                     component_tokens[name] = (content, tokens)
             
             # Find the component with the most tokens
@@ -420,9 +477,7 @@ class Orchestrator(BaseAgent):
                 new_content = ""
             else:
                 # Truncate the content by removing tokens from the end
-                encoded_content = encoding.encode(content)
-                truncated_encoded = encoded_content[:-tokens_to_remove]
-                new_content = encoding.decode(truncated_encoded)
+                new_content = tokenizer.truncate(content, component_token_count - tokens_to_remove)
             
             # Update the context with truncated content
             pattern = f'<{component_name}>(.*?)</{component_name}>'
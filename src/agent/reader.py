@@ -126,19 +126,17 @@ class Reader(BaseAgent):
         """
         self.add_to_memory("system", self.system_prompt)
 
-    def process(self, focal_component: str, context: str = "") -> str:
-        """Process the input and determine if more context is needed.
+    def _task_description(self, focal_component: str, context: str = "") -> str:
+        """Build the user message of the analysis task for a component.
 
         Args:
-            instruction: The instruction for docstring generation
             focal_component: The code component needing a docstring (full code snippet)
-            component_type: The type of the code component (function, method, or class)
             context: Current context information (if any)
 
         Returns:
-            A string containing the analysis and <INFO_NEED> tag indicating if more information is needed
+            The task description sent to the LLM
         """
-        # Add the current task to memory
+        # Describe the current task
         task_description = f"""
         <context>
         Current context:
@@ -151,8 +149,45 @@ class Reader(BaseAgent):
         {focal_component}
         </component>
         """
-        self.add_to_memory("user", task_description)
+        return task_description
+
+    def _add_task_to_memory(self, focal_component: str, context: str = "") -> None:
+        """Add the analysis task for a component to memory.
+
+        Args:
+            focal_component: The code component needing a docstring (full code snippet)
+            context: Current context information (if any)
+        """
+        self.add_to_memory("user", self._task_description(focal_component, context))
+
+    def process(self, focal_component: str, context: str = "") -> str:
+        """Process the input and determine if more context is needed.
+
+        Args:
+            focal_component: The code component needing a docstring (full code snippet)
+            context: Current context information (if any)
+
+        Returns:
+            A string containing the analysis and <INFO_NEED> tag indicating if more information is needed
+        """
+        self._add_task_to_memory(focal_component, context)
 
         # Generate response using LLM
         response = self.generate_response()
         return response
+
+    async def aprocess(self, focal_component: str, context: str = "") -> str:
+        """Async version of process.
+
+        Args:
+            focal_component: The code component needing a docstring (full code snippet)
+            context: Current context information (if any)
+
+        Returns:
+            A string containing the analysis and <INFO_NEED> tag indicating if more information is needed
+        """
+        self._add_task_to_memory(focal_component, context)
+
+        # Generate response using LLM
+        response = await self.agenerate_response()
+        return response
@@ -1,5 +1,6 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates
 from typing import Dict, List, Any, Optional
+import asyncio
 from .base import BaseAgent
 from .reader import InformationRequest
 from .tool.internal_traverse import ASTNodeAnalyzer  # Updated import to use only ASTNodeAnalyzer
@@ -100,6 +101,39 @@ class Searcher(BaseAgent):
             'external': external_info
         }
 
+    async def aprocess(
+        self, 
+        reader_response: str, 
+        ast_node: ast.AST,
+        ast_tree: ast.AST,
+        dependency_graph: Dict[str, List[str]],
+        focal_node_dependency_path: str
+    ) -> Dict[str, Any]:
+        """Async version of process.
+        
+        Searching walks the repository's ASTs and queries the Perplexity API with a
+        blocking client, so the work runs in a worker thread.
+        
+        Args:
+            reader_response: Response from the Reader agent containing
+                           information requests in structured XML format
+            ast_node: AST node representing the focal component
+            ast_tree: AST tree for the entire file
+            dependency_graph: Dictionary mapping component paths to their dependencies
+            focal_node_dependency_path: Dependency path of the focal component
+                        
+        Returns:
+            The gathered information, structured as in process
+        """
+        return await asyncio.to_thread(
+            self.process,
+            reader_response,
+            ast_node,
+            ast_tree,
+            dependency_graph,
+            focal_node_dependency_path
+        )
+
     def _parse_reader_response(self, reader_response: str) -> ParsedInfoRequest:
         """Parse the reader's structured XML response.
         
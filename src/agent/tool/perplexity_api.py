@@ -3,7 +3,14 @@ import os
 import requests
 from typing import List, Dict, Any
 from dataclasses import dataclass
-import yaml
+from requests.adapters import HTTPAdapter
+
+from ..llm.factory import LLMFactory
+
+# One session for every query of the process, so connections to the API are kept
+# alive and reused by all searcher workers
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
 
 @dataclass
 class PerplexityResponse:
@@ -35,9 +42,8 @@ class PerplexityAPI:
     def _load_config(self, config_path: str) -> Dict[str, Any]:
         """Load configuration from yaml file."""
         try:
-            with open(config_path, 'r') as f:
-                config = yaml.safe_load(f)
-                return config.get('perplexity', {})
+            config = LLMFactory.load_config(config_path)
+            return config.get('perplexity', {})
         except Exception as e:
             print(f"Warning: Could not load config file: {e}")
             return {}
@@ -83,7 +89,7 @@ class PerplexityAPI:
             "return_related_questions": False
         }
         
-        response = requests.post(self.base_url, json=payload, headers=self.headers)
+        response = _session.post(self.base_url, json=payload, headers=self.headers)
         response.raise_for_status()
         
         response_data = response.json()
@@ -59,23 +59,16 @@ class Verifier(BaseAgent):
         """
         self.add_to_memory("system", self.system_prompt)
 
-    def process(
-        self,
-        focal_component: str,
-        docstring: str,
-        context: str = ""
-    ) -> str:
-        """Verify the quality of a generated docstring.
+    def _task_description(self, focal_component: str, docstring: str, context: str = "") -> str:
+        """Build the user message of the verification task for a docstring.
         
         Args:
-            instruction: The original instruction for docstring generation
             focal_component: The code component with the docstring
-            component_type: The type of the code component
             docstring: The generated docstring to verify
             context: The context used to generate the docstring
-            
+        
         Returns:
-            List of VerificationFeedback objects for each aspect that needs improvement
+            The task description sent to the LLM
         """
         task_description = f"""
         Context Used:
@@ -90,8 +83,57 @@ class Verifier(BaseAgent):
         {docstring}
 
         """
-        self.add_to_memory("user", task_description)
+        return task_description
+
+    def _add_task_to_memory(self, focal_component: str, docstring: str, context: str = "") -> None:
+        """Add the verification task for a docstring to memory.
+        
+        Args:
+            focal_component: The code component with the docstring
+            docstring: The generated docstring to verify
+            context: The context used to generate the docstring
+        """
+        self.add_to_memory("user", self._task_description(focal_component, docstring, context))
+
+    def process(
+        self,
+        focal_component: str,
+        docstring: str,
+        context: str = ""
+    ) -> str:
+        """Verify the quality of a generated docstring.
+        
+        Args:
+            focal_component: The code component with the docstring
+            docstring: The generated docstring to verify
+            context: The context used to generate the docstring
+            
+        Returns:
+            The verifier's response with the NEED_REVISION verdict and suggestions
+        """
+        self._add_task_to_memory(focal_component, docstring, context)
         
         full_response = self.generate_response()
         return full_response
+
+    async def aprocess(
+        self,
+        focal_component: str,
+        docstring: str,
+        context: str = ""
+    ) -> str:
+        """Async version of process.
+        
+        Args:
+            focal_component: The code component with the docstring
+            docstring: The generated docstring to verify
+            context: The context used to generate the docstring
+            
+        Returns:
+            The verifier's response with the NEED_REVISION verdict and suggestions
+        """
+        self._add_task_to_memory(focal_component, docstring, context)
+        
+        full_response = await self.agenerate_response()
+        return full_response
     
\ No newline at end of file
@@ -162,21 +162,16 @@ class Writer(BaseAgent):
             logger.warning("\033[93mError parsing, no DOCSTRING XML tags found in response, directly return the response as docstring %s\033[0m")
             return response
 
-    def process(
-        self,
-        focal_component: str,
-        context: Dict[str, Any],
-    ) -> str:
-        """Generate a docstring for the given code component.
+    def _task_description(self, focal_component: str, context: Dict[str, Any]) -> str:
+        """Build the user message of the docstring generation task for a component.
         
         Args:
             focal_component: The code component needing a docstring
             context: Dictionary containing gathered context information
-            
+        
         Returns:
-            str: The generated docstring following the specified format
+            The task description sent to the LLM
         """
-        
         task_description = f"""
         Available context:
         {context}
@@ -195,11 +190,58 @@ class Writer(BaseAgent):
         3. Do not add triple quotes (\"\"\") to your generated docstring.
         4. Always double check if the generated docstring is within the XML tags: <DOCSTRING> and </DOCSTRING>. This is critical for parsing the docstring.
         """
-        self.add_to_memory("user", task_description)
+        return task_description
+
+    def _add_task_to_memory(self, focal_component: str, context: Dict[str, Any]) -> None:
+        """Add the docstring generation task for a component to memory.
+        
+        Args:
+            focal_component: The code component needing a docstring
+            context: Dictionary containing gathered context information
+        """
+        self.add_to_memory("user", self._task_description(focal_component, context))
+
+    def process(
+        self,
+        focal_component: str,
+        context: Dict[str, Any],
+    ) -> str:
+        """Generate a docstring for the given code component.
+        
+        Args:
+            focal_component: The code component needing a docstring
+            context: Dictionary containing gathered context information
+            
+        Returns:
+            str: The generated docstring following the specified format
+        """
+        self._add_task_to_memory(focal_component, context)
         
         # Generate response using LLM
         full_response = self.generate_response()
         
         # Extract and return just the docstring part
         return self.extract_docstring(full_response)
+
+    async def aprocess(
+        self,
+        focal_component: str,
+        context: Dict[str, Any],
+    ) -> str:
+        """Async version of process.
+        
+        Args:
+            focal_component: The code component needing a docstring
+            context: Dictionary containing gathered context information
+            
+        Returns:
+            str: The generated docstring following the specified format
+        """
+        self._add_task_to_memory(focal_component, context)
+        
+        # Generate response using LLM
+        full_response = await self.agenerate_response()
+        
+        # Extract and return just the docstring part
+        return self.extract_docstring(full_response)
     
@@ -5,13 +5,27 @@ between Python code components.
 """
 
 from .ast_parser import CodeComponent, DependencyParser
-from .topo_sort import topological_sort, resolve_cycles, build_graph_from_components, dependency_first_dfs
+from .parse_cache import ParseCache
+from .docstring_cache import DocstringCache, component_source_hash
+from .topo_sort import (
+    topological_sort,
+    resolve_cycles,
+    condense_sccs,
+    build_graph_from_components,
+    dependency_first_dfs,
+    dependency_levels
+)
 
 __all__ = [
     'CodeComponent', 
     'DependencyParser',
+    'ParseCache',
+    'DocstringCache',
+    'component_source_hash',
     'topological_sort',
     'resolve_cycles',
+    'condense_sccs',
     'build_graph_from_components',
-    'dependency_first_dfs'
+    'dependency_first_dfs',
+    'dependency_levels'
 ]
\ No newline at end of file
@@ -11,6 +11,7 @@ import os
 import json
 import logging
 import builtins
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass, field
 from typing import Dict, List, Set, Tuple, Optional, Any, Union
 from pathlib import Path
@@ -91,12 +92,104 @@ class CodeComponent:
             depends_on=set(data.get('depends_on', [])),
             start_line=data.get('start_line', 0),
             end_line=data.get('end_line', 0),
+            source_code=data.get('source_code'),
             has_docstring=data.get('has_docstring', False),
             docstring=data.get('docstring', "")
         )
         return component
 
 
+@dataclass
+class ParsedModule:
+    """
+    Per-file data collected in a single parse of a Python source file.
+    
+    Holds the file's imports and, for every component defined in it, the dependencies
+    that could be determined from the file alone plus the references whose resolution
+    depends on which modules exist in the repository. The references are resolved in a
+    later in-memory pass, so each file only needs to be read and parsed once.
+    """
+    # Full path to the parsed file
+    file_path: str
+    
+    # Relative path within the repo
+    relative_path: str
+    
+    # Python module path of the file, e.g. package.module
+    module_path: str
+    
+    # Modules imported with 'import x'
+    imports: Set[str] = field(default_factory=set)
+    
+    # Names imported with 'from x import y', as module -> [names]
+    from_imports: Dict[str, List[str]] = field(default_factory=dict)
+    
+    # IDs of the components defined in the file
+    component_ids: List[str] = field(default_factory=list)
+    
+    # Component ID -> dependencies that do not depend on the repository's module set
+    dependencies: Dict[str, Set[str]] = field(default_factory=dict)
+    
+    # Component ID -> unresolved references, each a list of (dependency_id, required_module)
+    # candidates of which the first one whose module is in the repository wins
+    references: Dict[str, List[Tuple[Tuple[str, Optional[str]], ...]]] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert this module data to a dictionary representation for JSON serialization."""
+        return {
+            'file_path': self.file_path,
+            'relative_path': self.relative_path,
+            'module_path': self.module_path,
+            'imports': sorted(self.imports),
+            'from_imports': self.from_imports,
+            'component_ids': self.component_ids,
+            'dependencies': {
+                comp_id: sorted(deps) for comp_id, deps in self.dependencies.items()
+            },
+            'references': {
+                comp_id: [[list(candidate) for candidate in candidates] for candidates in refs]
+                for comp_id, refs in self.references.items()
+            }
+        }
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> 'ParsedModule':
+        """Create a ParsedModule from a dictionary representation."""
+        return ParsedModule(
+            file_path=data['file_path'],
+            relative_path=data['relative_path'],
+            module_path=data['module_path'],
+            imports=set(data.get('imports', [])),
+            from_imports=data.get('from_imports', {}),
+            component_ids=data.get('component_ids', []),
+            dependencies={
+                comp_id: set(deps) for comp_id, deps in data.get('dependencies', {}).items()
+            },
+            references={
+                comp_id: [tuple(tuple(candidate) for candidate in candidates) for candidates in refs]
+                for comp_id, refs in data.get('references', {}).items()
+            }
+        )
+
+
+def resolve_reference(candidates: Tuple[Tuple[str, Optional[str]], ...], repo_modules: Set[str]) -> Optional[str]:
+    """
+    Resolve a deferred reference against the set of repository modules.
+    
+    Args:
+        candidates: Ordered (dependency_id, required_module) pairs; a required_module of
+                    None means the candidate always applies
+        repo_modules: Module paths present in the repository
+        
+    Returns:
+        The first applicable dependency ID, or None if no candidate applies
+    """
+    for dependency_id, required_module in candidates:
+        if required_module is None or required_module in repo_modules:
+            return dependency_id
+    return None
+
+
 class ImportCollector(ast.NodeVisitor):
     """Collects import statements from Python code."""
     
@@ -172,12 +265,15 @@ class DependencyCollector(ast.NodeVisitor):
     attribute access, function calls, and class references.
     """
     
-    def __init__(self, imports, from_imports, current_module, repo_modules):
+    def __init__(self, imports, from_imports, current_module, repo_modules=None):
         self.imports = imports
         self.from_imports = from_imports
         self.current_module = current_module
+        # When repo_modules is None, references that depend on the repository's
+        # modules are recorded in self.references instead of being resolved
         self.repo_modules = repo_modules
         self.dependencies = set()
+        self.references = []
         self._current_class = None
         # Track local variables defined in the current context
         self.local_variables = set()
@@ -258,10 +354,9 @@ class DependencyCollector(ast.NodeVisitor):
                     return
                     
                 # If it's a repo module, add as dependency
-                if module_path in self.repo_modules:
-                    if len(parts) > 1:
-                        # Example: module.Class or module.function
-                        self.dependencies.add(f"{module_path}.{parts[1]}")
+                if len(parts) > 1:
+                    # Example: module.Class or module.function
+                    self._add_candidates(((f"{module_path}.{parts[1]}", module_path),))
             
             # Check from imports
             elif parts[0] in self.from_imports.keys():
@@ -288,18 +383,33 @@ class DependencyCollector(ast.NodeVisitor):
             return
             
         # Check if name is directly imported from a module
+        candidates = []
         for module, imported_names in self.from_imports.items():
             # Skip standard library modules
             if module in STANDARD_MODULES:
                 continue
                 
-            if name in imported_names and module in self.repo_modules:
-                self.dependencies.add(f"{module}.{name}")
-                return
+            if name in imported_names:
+                candidates.append((f"{module}.{name}", module))
                 
-        # Check if name refers to a component in the current module
+        # Otherwise the name refers to a component in the current module
         local_component_id = f"{self.current_module}.{name}"
-        self.dependencies.add(local_component_id)
+        if not candidates:
+            self.dependencies.add(local_component_id)
+            return
+        
+        candidates.append((local_component_id, None))
+        self._add_candidates(tuple(candidates))
+    
+    def _add_candidates(self, candidates):
+        """Add the first candidate whose module is in the repo, or defer the choice."""
+        if self.repo_modules is None:
+            self.references.append(candidates)
+            return
+        
+        dependency = resolve_reference(candidates, self.repo_modules)
+        if dependency is not None:
+            self.dependencies.add(dependency)
 
 
 def add_parent_to_nodes(tree: ast.AST) -> None:
@@ -314,6 +424,30 @@ def add_parent_to_nodes(tree: ast.AST) -> None:
             child.parent = node
 
 
+def _parse_file_worker(task: Tuple[str, str, str, str]) -> Optional[Tuple[ParsedModule, List[CodeComponent]]]:
+    """
+    Parse a single file in a worker process.
+    
+    Args:
+        task: Tuple of (repo_path, file_path, relative_path, module_path)
+        
+    Returns:
+        The file's ParsedModule and its components in collection order, with AST nodes
+        stripped so the result can be pickled back to the parent process, or None if
+        the file could not be parsed
+    """
+    repo_path, file_path, relative_path, module_path = task
+    parser = DependencyParser(repo_path)
+    file_components = parser._parse_file(file_path, relative_path, module_path)
+    if file_components is None:
+        return None
+    
+    components = list(file_components.values())
+    for component in components:
+        component.node = None
+    return parser.parsed_modules[file_path], components
+
+
 class DependencyParser:
     """
     Parses Python code to build a dependency graph between code components.
@@ -324,14 +458,27 @@ class DependencyParser:
         self.components: Dict[str, CodeComponent] = {}
         self.dependency_graph: Dict[str, List[str]] = {}
         self.modules: Set[str] = set()
+        # File path -> data collected from the single parse of that file
+        self.parsed_modules: Dict[str, ParsedModule] = {}
         
-    def parse_repository(self):
+    def parse_repository(self, workers: int = 1, cache_path: Optional[str] = None):
         """
         Parse all Python files in the repository to build the dependency graph.
+        
+        Args:
+            workers: Number of processes used to parse files. With more than one worker,
+                     files are parsed in a process pool and the per-file results are merged
+                     in the same order as the serial path, so the resulting graph is
+                     identical; components then carry no AST node.
+            cache_path: Optional path to a persistent parse cache. Files whose content
+                        hash matches a cached record are rebuilt from the cache instead of
+                        being parsed (their components carry no AST node), and the cache
+                        is updated with the files parsed in this run.
         """
         logger.info(f"Parsing repository at {self.repo_path}")
         
-        # First pass: collect all modules and code components
+        # Collect all Python files and their module paths
+        file_tasks = []
         for root, _, files in os.walk(self.repo_path):
             for file in files:
                 if not file.endswith(".py"):
@@ -343,9 +490,49 @@ class DependencyParser:
                 # Convert file path to module path
                 module_path = self._file_to_module_path(relative_path)
                 self.modules.add(module_path)
-                
-                # Parse the file to collect components
-                self._parse_file(file_path, relative_path, module_path)
+                file_tasks.append((file_path, relative_path, module_path))
+        
+        # Look up unchanged files in the parse cache
+        cache = None
+        content_hashes = {}
+        cached_results = {}
+        if cache_path:
+            from .parse_cache import ParseCache, hash_file_content
+            cache = ParseCache(cache_path)
+            for file_path, relative_path, _ in file_tasks:
+                content_hashes[file_path] = hash_file_content(file_path)
+                cached = cache.get(file_path, relative_path, content_hashes[file_path])
+                if cached is not None:
+                    cached_results[file_path] = cached
+        
+        # First pass: collect code components, imports and raw dependencies per file
+        files_to_parse = [task for task in file_tasks if task[0] not in cached_results]
+        use_pool = workers > 1 and len(files_to_parse) > 1
+        if use_pool:
+            parsed_results = self._parse_files_in_pool(files_to_parse, workers)
+        
+        # Merge cached and freshly parsed files in walk order
+        for file_path, relative_path, module_path in file_tasks:
+            if file_path in cached_results:
+                self._add_parsed_file(*cached_results[file_path])
+                continue
+            
+            if use_pool:
+                if file_path not in parsed_results:
+                    continue
+                module_info, components = parsed_results[file_path]
+                self._add_parsed_file(module_info, components)
+            else:
+                file_components = self._parse_file(file_path, relative_path, module_path)
+                if file_components is None:
+                    continue
+                module_info, components = self.parsed_modules[file_path], list(file_components.values())
+            
+            if cache is not None:
+                cache.put(relative_path, content_hashes[file_path], module_info, components)
+        
+        if cache is not None:
+            cache.save()
         
         # Second pass: resolve dependencies
         self._resolve_dependencies()
@@ -356,14 +543,108 @@ class DependencyParser:
         logger.info(f"Found {len(self.components)} code components")
         return self.components
     
+    def _parse_files_in_pool(self, file_tasks: List[Tuple[str, str, str]],
+                             workers: int) -> Dict[str, Tuple[ParsedModule, List[CodeComponent]]]:
+        """
+        Parse files in a process pool.
+        
+        Args:
+            file_tasks: List of (file_path, relative_path, module_path) tuples
+            workers: Number of worker processes
+            
+        Returns:
+            Dictionary mapping each successfully parsed file path to its ParsedModule and
+            components; merging them is left to the caller so that order is preserved
+        """
+        logger.info(f"Parsing {len(file_tasks)} files with {workers} worker processes")
+        tasks = [(self.repo_path, *file_task) for file_task in file_tasks]
+        chunksize = max(1, len(tasks) // (workers * 4))
+        
+        results = {}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for file_task, result in zip(file_tasks, executor.map(_parse_file_worker, tasks, chunksize=chunksize)):
+                if result is not None:
+                    results[file_task[0]] = result
+        return results
+    
+    def _add_parsed_file(self, module_info: ParsedModule, components: List[CodeComponent]):
+        """Merge the parse result of a single file into the parser state."""
+        for component in components:
+            self.components[component.id] = component
+        self.parsed_modules[module_info.file_path] = module_info
+    
+    def update_file(self, file_path: str) -> Dict[str, CodeComponent]:
+        """
+        Re-parse a single file and patch the dependency graph in place.
+        
+        Components previously collected from the file are replaced by freshly parsed
+        ones (with up-to-date line numbers, source and docstrings), their dependencies
+        are re-resolved, and edges from other components to components that no longer
+        exist are dropped. The rest of the repository is not re-read.
+        
+        Args:
+            file_path: Path to the Python file that changed
+            
+        Returns:
+            Dictionary of the components now defined in the file
+        """
+        file_path = os.path.abspath(file_path)
+        relative_path = os.path.relpath(file_path, self.repo_path)
+        module_path = self._file_to_module_path(relative_path)
+        
+        # Drop the stale components of this file
+        old_ids = {
+            comp_id for comp_id, component in self.components.items()
+            if component.file_path == file_path
+        }
+        for comp_id in old_ids:
+            del self.components[comp_id]
+        
+        self.parsed_modules.pop(file_path, None)
+        if os.path.exists(file_path):
+            self.modules.add(module_path)
+            self._parse_file(file_path, relative_path, module_path)
+        else:
+            self.modules.discard(module_path)
+        
+        new_ids = {
+            comp_id for comp_id, component in self.components.items()
+            if component.file_path == file_path
+        }
+        
+        # Re-resolve dependencies only for the components of this file
+        self._resolve_dependencies(new_ids)
+        self._add_class_method_dependencies(new_ids)
+        
+        # Drop edges pointing at components that disappeared from the file
+        removed_ids = old_ids - new_ids
+        if removed_ids:
+            for component in self.components.values():
+                component.depends_on = {
+                    dep for dep in component.depends_on
+                    if dep not in removed_ids or dep.split(".", 1)[0] in self.modules
+                }
+        
+        logger.info(f"Updated {len(new_ids)} code components from {relative_path}")
+        return {comp_id: self.components[comp_id] for comp_id in new_ids}
+    
     def _file_to_module_path(self, file_path: str) -> str:
         """Convert a file path to a Python module path."""
         # Remove .py extension and convert / to .
         path = file_path[:-3] if file_path.endswith(".py") else file_path
         return path.replace(os.path.sep, ".")
     
-    def _parse_file(self, file_path: str, relative_path: str, module_path: str):
-        """Parse a single Python file to collect code components."""
+    def _parse_file(self, file_path: str, relative_path: str,
+                    module_path: str) -> Optional[Dict[str, CodeComponent]]:
+        """
+        Parse a single Python file to collect code components, imports and dependencies.
+        
+        The file is read and parsed exactly once; references that depend on the
+        repository's module set are kept in self.parsed_modules and resolved later.
+        
+        Returns:
+            The components collected from the file, or None if it could not be parsed
+        """
         try:
             with open(file_path, "r", encoding="utf-8") as f:
                 source = f.read()
@@ -378,14 +659,31 @@ class DependencyParser:
             import_collector.visit(tree)
             
             # Collect code components
-            self._collect_components(tree, file_path, relative_path, module_path, source)
+            file_components = self._collect_components(tree, file_path, relative_path, module_path, source)
+            
+            module_info = ParsedModule(
+                file_path=file_path,
+                relative_path=relative_path,
+                module_path=module_path,
+                imports=import_collector.imports,
+                from_imports=import_collector.from_imports,
+                component_ids=list(file_components)
+            )
+            
+            # Collect the dependencies of each component from the same tree
+            self._collect_dependencies(tree, module_info, file_components)
+            self.parsed_modules[file_path] = module_info
+            return file_components
             
         except (SyntaxError, UnicodeDecodeError) as e:
             logger.warning(f"Error parsing {file_path}: {e}")
+            return None
     
     def _collect_components(self, tree: ast.AST, file_path: str, relative_path: str, 
-                          module_path: str, source: str):
+                          module_path: str, source: str) -> Dict[str, CodeComponent]:
         """Collect all code components (functions, classes, methods) from an AST."""
+        file_components: Dict[str, CodeComponent] = {}
+        
         for node in ast.walk(tree):
             if isinstance(node, ast.ClassDef):
                 # Class definition
@@ -416,6 +714,7 @@ class DependencyParser:
                 )
                 
                 self.components[class_id] = component
+                file_components[class_id] = component
                 
                 # Collect methods within the class
                 for item in node.body:
@@ -447,6 +746,7 @@ class DependencyParser:
                         )
                         
                         self.components[method_id] = method_component
+                        file_components[method_id] = method_component
             
             elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
                 # Only collect top-level functions
@@ -478,100 +778,117 @@ class DependencyParser:
                     )
                     
                     self.components[func_id] = component
+                    file_components[func_id] = component
+        
+        return file_components
     
-    def _resolve_dependencies(self):
+    def _collect_dependencies(self, tree: ast.AST, module_info: ParsedModule,
+                              file_components: Dict[str, CodeComponent]):
         """
-        Second pass to resolve dependencies between components.
+        Collect the dependencies of every component of a file from its parsed AST.
+        
+        Each component is analyzed at the first top-level definition matching its name,
+        so repeated definitions resolve the same way regardless of collection order.
         """
-        for component_id, component in self.components.items():
-            file_path = component.file_path
+        # Index top-level definitions by name (the first definition wins)
+        top_level_functions = {}
+        top_level_classes = {}
+        for node in ast.iter_child_nodes(tree):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                top_level_functions.setdefault(node.name, node)
+            elif isinstance(node, ast.ClassDef):
+                top_level_classes.setdefault(node.name, node)
+        
+        for component_id, component in file_components.items():
+            # Find the component node in the tree
+            component_node = None
             
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    source = f.read()
-                
-                # Parse file to get imports
-                tree = ast.parse(source)
-                
-                # Add parent field to AST nodes for easier traversal
-                add_parent_to_nodes(tree)
-                
-                # Collect imports
-                import_collector = ImportCollector()
-                import_collector.visit(tree)
-                
-                # Find the component node in the tree
-                component_node = None
-                module_path = self._file_to_module_path(component.relative_path)
-                
-                if component.component_type == "function":
-                    # Find top-level function
-                    for node in ast.iter_child_nodes(tree):
-                        if (isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) 
-                                and node.name == component.id.split(".")[-1]):
-                            component_node = node
-                            break
-                
-                elif component.component_type == "class":
-                    # Find class
-                    for node in ast.iter_child_nodes(tree):
-                        if isinstance(node, ast.ClassDef) and node.name == component.id.split(".")[-1]:
-                            component_node = node
-                            break
-                
-                elif component.component_type == "method":
-                    # Find method inside class
-                    class_name, method_name = component.id.split(".")[-2:]
-                    class_node = None
-                    
-                    for node in ast.iter_child_nodes(tree):
-                        if isinstance(node, ast.ClassDef) and node.name == class_name:
-                            class_node = node
-                            for item in node.body:
-                                if (isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) 
-                                        and item.name == method_name):
-                                    component_node = item
-                                    break
+            if component.component_type == "function":
+                component_node = top_level_functions.get(component_id.split(".")[-1])
+            
+            elif component.component_type == "class":
+                component_node = top_level_classes.get(component_id.split(".")[-1])
+            
+            elif component.component_type == "method":
+                # Find method inside class
+                class_name, method_name = component_id.split(".")[-2:]
+                class_node = top_level_classes.get(class_name)
+                if class_node is not None:
+                    for item in class_node.body:
+                        if (isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) 
+                                and item.name == method_name):
+                            component_node = item
                             break
-                
-                if component_node:
-                    # Collect dependencies for this specific component
-                    dependency_collector = DependencyCollector(
-                        import_collector.imports,
-                        import_collector.from_imports,
-                        module_path,
-                        self.modules
-                    )
-                    
-                    # For functions and methods, collect variables defined in the function
-                    if isinstance(component_node, (ast.FunctionDef, ast.AsyncFunctionDef)):
-                        # Add function parameters to local variables
-                        for arg in component_node.args.args:
-                            dependency_collector.local_variables.add(arg.arg)
-                            
-                    dependency_collector.visit(component_node)
-                    
-                    # Add dependencies to the component
-                    component.depends_on.update(dependency_collector.dependencies)
+            
+            if not component_node:
+                continue
+            
+            # Collect dependencies for this specific component; references to other
+            # modules are resolved once all modules of the repository are known
+            dependency_collector = DependencyCollector(
+                module_info.imports,
+                module_info.from_imports,
+                module_info.module_path
+            )
+            
+            # For functions and methods, collect variables defined in the function
+            if isinstance(component_node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                # Add function parameters to local variables
+                for arg in component_node.args.args:
+                    dependency_collector.local_variables.add(arg.arg)
                     
-                    # Filter out non-existent dependencies
-                    component.depends_on = {
-                        dep for dep in component.depends_on 
-                        if dep in self.components or dep.split(".", 1)[0] in self.modules
-                    }
-                
-            except (SyntaxError, UnicodeDecodeError) as e:
-                logger.warning(f"Error analyzing dependencies in {file_path}: {e}")
+            dependency_collector.visit(component_node)
+            
+            module_info.dependencies[component_id] = dependency_collector.dependencies
+            module_info.references[component_id] = dependency_collector.references
+    
+    def _resolve_dependencies(self, component_ids: Optional[Set[str]] = None):
+        """
+        Second pass to resolve dependencies between components.
+        
+        Works entirely on the data collected while parsing each file, so no file is
+        read or parsed again.
+        
+        Args:
+            component_ids: Optional subset of component IDs to resolve; all components
+                           are resolved when omitted
+        """
+        for component_id, component in self.components.items():
+            if component_ids is not None and component_id not in component_ids:
+                continue
+            
+            module_info = self.parsed_modules.get(component.file_path)
+            if module_info is None or component_id not in module_info.dependencies:
+                continue
+            
+            # Add dependencies to the component
+            component.depends_on.update(module_info.dependencies[component_id])
+            for candidates in module_info.references.get(component_id, []):
+                dependency = resolve_reference(candidates, self.modules)
+                if dependency is not None:
+                    component.depends_on.add(dependency)
+            
+            # Filter out non-existent dependencies
+            component.depends_on = {
+                dep for dep in component.depends_on 
+                if dep in self.components or dep.split(".", 1)[0] in self.modules
+            }
     
-    def _add_class_method_dependencies(self):
+    def _add_class_method_dependencies(self, component_ids: Optional[Set[str]] = None):
         """
         Third pass to make classes dependent on their methods (except __init__).
+        
+        Args:
+            component_ids: Optional subset of component IDs to consider; all components
+                           are considered when omitted
         """
         # Group components by class
         class_methods = {}
         
         # Collect all methods for each class
         for component_id, component in self.components.items():
+            if component_ids is not None and component_id not in component_ids:
+                continue
             if component.component_type == "method":
                 parts = component_id.split(".")
                 if len(parts) >= 2:
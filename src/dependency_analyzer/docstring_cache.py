@@ -0,0 +1,192 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates
+"""
+Persistent cache of accepted docstrings, keyed by a fingerprint of the code they describe.
+
+A component's code is hashed after dropping the docstrings of the component and its
+members and normalizing the formatting, so writing a docstring into a file doesn't
+change the hash. A docstring is reused in a later run as long as the hashes of its
+component and of the component's direct dependencies are unchanged.
+"""
+
+import os
+import ast
+import json
+import hashlib
+import logging
+import tempfile
+import textwrap
+from typing import Dict, Optional
+
+from .ast_parser import CodeComponent
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the fingerprint changes, to invalidate old caches
+CACHE_VERSION = 1
+
+
+def component_source_hash(component: CodeComponent) -> str:
+    """
+    Hash the code of a component, ignoring docstrings and formatting.
+
+    The hash doesn't change when a docstring is written into the component or its
+    methods, so it identifies the code a docstring was generated for.
+
+    Args:
+        component: The component to hash
+
+    Returns:
+        Hex digest of the SHA-256 hash of the component's normalized code
+    """
+    source = component.source_code or ""
+    # The first line of a nested component's source has no indentation, the rest has
+    lines = source.split("\n")
+    rest_indents = [len(line) - len(line.lstrip()) for line in lines[1:] if line.strip()]
+    first_line_indent = " " * max(0, min(rest_indents, default=0) - 4)
+
+    normalized = source
+    for candidate in (source, first_line_indent + source):
+        try:
+            tree = ast.parse(textwrap.dedent(candidate))
+        except SyntaxError:
+            continue
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) and node.body:
+                first_stmt = node.body[0]
+                if (isinstance(first_stmt, ast.Expr) and isinstance(first_stmt.value, ast.Constant)
+                        and isinstance(first_stmt.value.value, str)):
+                    node.body = node.body[1:] or [ast.Pass()]
+        normalized = ast.dump(tree)
+        break
+
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class DocstringCache:
+    """
+    On-disk cache of accepted docstrings, reused across runs.
+
+    A docstring is stored with a fingerprint of the component's normalized code and the
+    normalized code of its direct dependencies. As long as the fingerprint is unchanged
+    in a later run, e.g. a nightly run on a fresh checkout, the stored docstring is
+    reused without going through the agents.
+    """
+
+    def __init__(self, cache_path: str):
+        """
+        Initialize the cache and load existing entries from disk.
+
+        Args:
+            cache_path: Path to the JSON cache file
+        """
+        self.cache_path = cache_path
+        self._entries: Dict[str, Dict[str, str]] = {}
+        self._source_hashes: Dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        """Load the cache file if it exists and matches the current cache version."""
+        if not os.path.exists(self.cache_path):
+            return
+
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable docstring cache {self.cache_path}: {e}")
+            return
+
+        if data.get("version") != CACHE_VERSION:
+            logger.info(f"Ignoring docstring cache {self.cache_path} from another cache version")
+            return
+
+        self._entries = data.get("components", {})
+        logger.info(f"Loaded docstring cache with {len(self._entries)} components from {self.cache_path}")
+
+    def _source_hash(self, component: CodeComponent) -> str:
+        """Hash a component's code once per run; only docstrings change during a run."""
+        source_hash = self._source_hashes.get(component.id)
+        if source_hash is None:
+            source_hash = component_source_hash(component)
+            self._source_hashes[component.id] = source_hash
+        return source_hash
+
+    def fingerprint(self, component: CodeComponent, components: Dict[str, CodeComponent]) -> str:
+        """
+        Fingerprint a component's code together with the code of its direct dependencies.
+
+        Args:
+            component: The component to fingerprint
+            components: All components, to look up the dependencies
+
+        Returns:
+            Hex digest of the SHA-256 hash of the source hashes
+        """
+        parts = [self._source_hash(component)]
+        for dep_id in sorted(component.depends_on):
+            dep = components.get(dep_id)
+            if dep:
+                parts.append(f"{dep_id}:{self._source_hash(dep)}")
+        return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+    def lookup(self, component: CodeComponent, components: Dict[str, CodeComponent]) -> Optional[str]:
+        """
+        Get the cached docstring of a component, if neither it nor its dependencies changed.
+
+        Args:
+            component: The component to look up
+            components: All components, to look up the dependencies
+
+        Returns:
+            The cached docstring, or None on a miss
+        """
+        entry = self._entries.get(component.id)
+        if entry is None or entry["fingerprint"] != self.fingerprint(component, components):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry["docstring"]
+
+    def put(self, component: CodeComponent, components: Dict[str, CodeComponent], docstring: str):
+        """
+        Store the accepted docstring of a component.
+
+        Args:
+            component: The component the docstring belongs to
+            components: All components, to look up the dependencies
+            docstring: The docstring
+        """
+        self._entries[component.id] = {
+            "fingerprint": self.fingerprint(component, components),
+            "docstring": docstring
+        }
+
+    def save(self, components: Dict[str, CodeComponent]):
+        """
+        Write the cache to disk, dropping components that no longer exist.
+
+        The file is replaced through a temporary file, so an interrupted save leaves the
+        previous cache intact.
+
+        Args:
+            components: All components of the repository
+        """
+        cache_dir = os.path.dirname(os.path.abspath(self.cache_path))
+        os.makedirs(cache_dir, exist_ok=True)
+
+        entries = {component_id: entry for component_id, entry in self._entries.items() if component_id in components}
+        fd, temp_path = tempfile.mkstemp(dir=cache_dir, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": CACHE_VERSION, "components": entries}, f)
+            os.replace(temp_path, self.cache_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+        logger.info(
+            f"Saved docstring cache with {len(entries)} components to {self.cache_path} "
+            f"({self.hits} hits, {self.misses} misses)"
+        )
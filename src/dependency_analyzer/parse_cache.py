@@ -0,0 +1,146 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates
+"""
+Persistent, content-addressed cache of per-file parse results.
+
+Each Python file of a repository is stored under its relative path together with the
+hash of its content, the components collected from it, its imports and the dependency
+references that still need to be resolved against the whole repository. On a re-run,
+files whose content hash is unchanged are rebuilt from the cache instead of being parsed.
+"""
+
+import os
+import json
+import hashlib
+import logging
+from typing import Dict, List, Tuple, Optional, Any
+
+from .ast_parser import CodeComponent, ParsedModule
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the parser's per-file output changes, to invalidate old caches
+CACHE_VERSION = 1
+
+
+def hash_file_content(file_path: str) -> str:
+    """
+    Compute the content hash used as cache key for a file.
+
+    Args:
+        file_path: Path to the file
+
+    Returns:
+        Hex digest of the SHA-256 hash of the file's bytes
+    """
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class ParseCache:
+    """
+    On-disk cache of ParsedModule records and components, keyed by relative file path
+    and content hash.
+
+    Only entries that were looked up successfully or stored during the current run are
+    written back by save(), so records of deleted files are dropped automatically.
+    """
+
+    def __init__(self, cache_path: str):
+        """
+        Initialize the cache and load existing entries from disk.
+
+        Args:
+            cache_path: Path to the JSON cache file
+        """
+        self.cache_path = cache_path
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._used: Dict[str, Dict[str, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        """Load the cache file if it exists and matches the current cache version."""
+        if not os.path.exists(self.cache_path):
+            return
+
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable parse cache {self.cache_path}: {e}")
+            return
+
+        if data.get("version") != CACHE_VERSION:
+            logger.info(f"Ignoring parse cache {self.cache_path} from another cache version")
+            return
+
+        self._entries = data.get("files", {})
+        logger.info(f"Loaded parse cache with {len(self._entries)} files from {self.cache_path}")
+
+    def get(self, file_path: str, relative_path: str,
+            content_hash: str) -> Optional[Tuple[ParsedModule, List[CodeComponent]]]:
+        """
+        Look up the parse result of a file.
+
+        Args:
+            file_path: Current full path of the file
+            relative_path: Path of the file relative to the repository
+            content_hash: Hash of the file's current content
+
+        Returns:
+            The file's ParsedModule and components (without AST nodes), or None on a miss
+        """
+        entry = self._entries.get(relative_path)
+        if entry is None or entry.get("content_hash") != content_hash:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._used[relative_path] = entry
+
+        module_info = ParsedModule.from_dict(entry["module"])
+        module_info.file_path = file_path
+        components = []
+        for comp_data in entry["components"]:
+            component = CodeComponent.from_dict(comp_data)
+            component.file_path = file_path
+            components.append(component)
+        return module_info, components
+
+    def put(self, relative_path: str, content_hash: str, module_info: ParsedModule,
+            components: List[CodeComponent]):
+        """
+        Store the parse result of a file.
+
+        Must be called before dependency resolution, while the components only hold
+        the data collected from their own file.
+
+        Args:
+            relative_path: Path of the file relative to the repository
+            content_hash: Hash of the file's content
+            module_info: The file's ParsedModule
+            components: The file's components in collection order
+        """
+        self._used[relative_path] = {
+            "content_hash": content_hash,
+            "module": module_info.to_dict(),
+            "components": [
+                dict(component.to_dict(), depends_on=[], source_code=component.source_code)
+                for component in components
+            ]
+        }
+
+    def save(self):
+        """Write the entries used in this run back to disk."""
+        cache_dir = os.path.dirname(self.cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        with open(self.cache_path, "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "files": self._used}, f)
+
+        logger.info(
+            f"Saved parse cache with {len(self._used)} files to {self.cache_path} "
+            f"({self.hits} hits, {self.misses} misses)"
+        )
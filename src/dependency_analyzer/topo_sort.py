@@ -12,80 +12,158 @@ from collections import defaultdict, deque
 
 logger = logging.getLogger(__name__)
 
-def detect_cycles(graph: Dict[str, Set[str]]) -> List[List[str]]:
+def _strongly_connected_components(graph: Dict[str, Set[str]]) -> Tuple[List[List[str]], Dict[str, int]]:
     """
-    Detect cycles in a dependency graph using Tarjan's algorithm to find
-    strongly connected components.
+    Find the strongly connected components of a dependency graph with an iterative
+    version of Tarjan's algorithm, so long dependency chains cannot hit the recursion limit.
     
     Args:
         graph: A dependency graph represented as adjacency lists
                (node -> set of dependencies)
     
     Returns:
-        A list of lists, where each inner list contains the nodes in a cycle
+        A tuple of (components, postorder): the list of all strongly connected components,
+        in the order Tarjan's algorithm emits them (every component comes after the
+        components it depends on), and the DFS post-order index of every node.
+        Dependencies that are not nodes of the graph are ignored.
     """
-    # Implementation of Tarjan's algorithm
-    index_counter = [0]
+    index_counter = 0
     index = {}  # node -> index
     lowlink = {}  # node -> lowlink value
     onstack = set()  # nodes currently on the stack
     stack = []  # stack of nodes
-    result = []  # list of cycles (strongly connected components)
-    
-    def strongconnect(node):
-        # Set the depth index for node
-        index[node] = index_counter[0]
-        lowlink[node] = index_counter[0]
-        index_counter[0] += 1
-        stack.append(node)
-        onstack.add(node)
+    postorder = {}  # node -> DFS post-order index
+    result = []  # list of strongly connected components
+    
+    for root in graph:
+        if root in index:
+            continue
         
-        # Consider successors
-        for successor in graph.get(node, set()):
-            if successor not in index:
-                # Successor has not yet been visited; recurse on it
-                strongconnect(successor)
-                lowlink[node] = min(lowlink[node], lowlink[successor])
-            elif successor in onstack:
-                # Successor is on the stack and hence in the current SCC
-                lowlink[node] = min(lowlink[node], index[successor])
+        # Each work item is a node and the iterator over its remaining successors
+        index[root] = lowlink[root] = index_counter
+        index_counter += 1
+        stack.append(root)
+        onstack.add(root)
+        work = [(root, iter(graph[root]))]
         
-        # If node is a root node, pop the stack and generate an SCC
-        if lowlink[node] == index[node]:
-            # Start a new strongly connected component
-            scc = []
-            while True:
-                successor = stack.pop()
-                onstack.remove(successor)
-                scc.append(successor)
-                if successor == node:
+        while work:
+            node, successors = work[-1]
+            
+            # Consider successors until one needs to be visited first
+            descended = False
+            for successor in successors:
+                if successor not in graph:
+                    continue
+                if successor not in index:
+                    # Successor has not yet been visited; descend into it
+                    index[successor] = lowlink[successor] = index_counter
+                    index_counter += 1
+                    stack.append(successor)
+                    onstack.add(successor)
+                    work.append((successor, iter(graph[successor])))
+                    descended = True
                     break
+                elif successor in onstack:
+                    # Successor is on the stack and hence in the current SCC
+                    lowlink[node] = min(lowlink[node], index[successor])
+            
+            if descended:
+                continue
             
-            # Only include SCCs with more than one node (actual cycles)
-            if len(scc) > 1:
+            # All successors are done: finish the node and update its parent
+            work.pop()
+            postorder[node] = len(postorder)
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            
+            # If node is a root node, pop the stack and generate an SCC
+            if lowlink[node] == index[node]:
+                scc = []
+                while True:
+                    member = stack.pop()
+                    onstack.remove(member)
+                    scc.append(member)
+                    if member == node:
+                        break
                 result.append(scc)
     
-    # Visit each node
-    for node in graph:
-        if node not in index:
-            strongconnect(node)
+    return result, postorder
+
+def detect_cycles(graph: Dict[str, Set[str]]) -> List[List[str]]:
+    """
+    Detect cycles in a dependency graph using Tarjan's algorithm to find
+    strongly connected components.
+    
+    Args:
+        graph: A dependency graph represented as adjacency lists
+               (node -> set of dependencies)
     
-    return result
+    Returns:
+        A list of lists, where each inner list contains the nodes in a cycle
+    """
+    sccs, _ = _strongly_connected_components(graph)
+    
+    # Only include SCCs with more than one node (actual cycles)
+    return [scc for scc in sccs if len(scc) > 1]
+
+def condense_sccs(graph: Dict[str, Set[str]]) -> Tuple[List[List[str]], Dict[int, Set[int]]]:
+    """
+    Condense every strongly connected component of a dependency graph into a single node.
+    
+    Args:
+        graph: A dependency graph represented as adjacency lists
+               (node -> set of dependencies)
+    
+    Returns:
+        A tuple of (components, dag): components[i] lists the nodes of component i, and
+        dag maps each component index to the set of component indices it depends on.
+        The dag is acyclic and components are numbered dependencies first, so
+        range(len(components)) is a valid processing order.
+    """
+    sccs, _ = _strongly_connected_components(graph)
+    
+    scc_of = {}
+    for i, scc in enumerate(sccs):
+        for node in scc:
+            scc_of[node] = i
+    
+    dag = {i: set() for i in range(len(sccs))}
+    for node, deps in graph.items():
+        node_scc = scc_of[node]
+        for dep in deps:
+            dep_scc = scc_of.get(dep)
+            if dep_scc is not None and dep_scc != node_scc:
+                dag[node_scc].add(dep_scc)
+    
+    return sccs, dag
 
 def resolve_cycles(graph: Dict[str, Set[str]]) -> Dict[str, Set[str]]:
     """
     Resolve cycles in a dependency graph by identifying strongly connected
     components and breaking cycles.
     
+    Within each strongly connected component, the dependencies that point back to a
+    node still being explored in the DFS (back edges, including self-dependencies) are
+    removed. Dependencies between components are kept, so the result is acyclic.
+    
     Args:
         graph: A dependency graph represented as adjacency lists
                (node -> set of dependencies)
     
     Returns:
-        A new acyclic graph with the same nodes but with cycles broken
+        A new acyclic graph with the same nodes but with cycles broken. Dependency
+        sets of nodes outside cycles are shared with the input graph.
     """
-    # Detect cycles (SCCs)
-    cycles = detect_cycles(graph)
+    sccs, postorder = _strongly_connected_components(graph)
+    
+    scc_of = {}
+    cycles = []
+    for i, scc in enumerate(sccs):
+        for node in scc:
+            scc_of[node] = i
+        if len(scc) > 1 or scc[0] in graph[scc[0]]:
+            cycles.append(scc)
     
     if not cycles:
         logger.info("No cycles detected in the dependency graph")
@@ -93,32 +171,55 @@ def resolve_cycles(graph: Dict[str, Set[str]]) -> Dict[str, Set[str]]:
     
     logger.info(f"Detected {len(cycles)} cycles in the dependency graph")
     
-    # Create a copy of the graph to modify
-    new_graph = {node: deps.copy() for node, deps in graph.items()}
+    # Only the nodes whose dependencies change get a new set
+    new_graph = dict(graph)
+    removed_edges = 0
     
-    # Process each cycle
     for i, cycle in enumerate(cycles):
-        logger.info(f"Cycle {i+1}: {' -> '.join(cycle)}")
+        logger.debug(f"Cycle {i+1}: {' -> '.join(cycle)}")
         
-        # Strategy: Break the cycle by removing the "weakest" dependency
-        # Here, we just arbitrarily remove the last edge to make the graph acyclic
-        # In a real-world scenario, you might use heuristics to determine which edge to break
-        # For example, removing edges between different modules before edges within the same module
-        for j in range(len(cycle) - 1):
-            current = cycle[j]
-            next_node = cycle[j + 1]
-            
-            if next_node in new_graph[current]:
-                logger.info(f"Breaking cycle by removing dependency: {current} -> {next_node}")
-                new_graph[current].remove(next_node)
-                break
-    
+        for node in cycle:
+            # A back edge points to a node that finishes after this one in the same SCC
+            back_edges = {
+                dep for dep in graph[node]
+                if scc_of.get(dep) == scc_of[node] and postorder[dep] >= postorder[node]
+            }
+            if back_edges:
+                for dep in back_edges:
+                    logger.debug(f"Breaking cycle by removing dependency: {node} -> {dep}")
+                new_graph[node] = graph[node] - back_edges
+                removed_edges += len(back_edges)
+    
+    logger.info(f"Removed {removed_edges} dependencies to break cycles")
     return new_graph
 
+def build_reverse_index(graph: Dict[str, Set[str]]) -> Dict[str, List[str]]:
+    """
+    Build the reverse adjacency index of a dependency graph.
+    
+    Args:
+        graph: A dependency graph represented as adjacency lists
+               (node -> set of dependencies)
+    
+    Returns:
+        A dictionary mapping every node of the graph to the list of nodes that depend
+        on it, in graph iteration order. Dependencies that are not nodes of the graph
+        are ignored.
+    """
+    dependents = {node: [] for node in graph}
+    for node, deps in graph.items():
+        for dep in deps:
+            if dep in dependents:
+                dependents[dep].append(node)
+    return dependents
+
 def topological_sort(graph: Dict[str, Set[str]]) -> List[str]:
     """
     Perform a topological sort on a dependency graph.
     
+    Uses Kahn's algorithm over a precomputed reverse adjacency index, so the sort
+    runs in O(V + E) after cycle resolution.
+    
     Args:
         graph: A dependency graph represented as adjacency lists
                (node -> set of dependencies)
@@ -129,17 +230,17 @@ def topological_sort(graph: Dict[str, Set[str]]) -> List[str]:
     # First, check for and resolve cycles
     acyclic_graph = resolve_cycles(graph)
     
-    # Initialize in-degree counter for all nodes
-    in_degree = {node: 0 for node in acyclic_graph}
+    # Index the nodes that depend on each node
+    dependents = build_reverse_index(acyclic_graph)
     
-    # Count in-degrees
-    for node, dependencies in acyclic_graph.items():
-        for dep in dependencies:
-            if dep in in_degree:
-                in_degree[dep] += 1
+    # Count the unprocessed dependencies of each node
+    remaining_deps = {
+        node: sum(1 for dep in deps if dep in dependents)
+        for node, deps in acyclic_graph.items()
+    }
     
-    # Queue of nodes with no dependencies (in-degree of 0)
-    queue = deque([node for node, degree in in_degree.items() if degree == 0])
+    # Queue of nodes with no dependencies
+    queue = deque([node for node, count in remaining_deps.items() if count == 0])
     
     # Result list to store the topological order
     result = []
@@ -149,12 +250,11 @@ def topological_sort(graph: Dict[str, Set[str]]) -> List[str]:
         node = queue.popleft()
         result.append(node)
         
-        # Reduce in-degree for each node that depends on the current node
-        for dependent, deps in acyclic_graph.items():
-            if node in deps:
-                in_degree[dependent] -= 1
-                if in_degree[dependent] == 0:
-                    queue.append(dependent)
+        # Release each node that depends on the current node
+        for dependent in dependents[node]:
+            remaining_deps[dependent] -= 1
+            if remaining_deps[dependent] == 0:
+                queue.append(dependent)
     
     # Check if the sort was successful (all nodes included)
     if len(result) != len(acyclic_graph):
@@ -162,8 +262,55 @@ def topological_sort(graph: Dict[str, Set[str]]) -> List[str]:
         # Return all nodes in some order to avoid breaking the process
         return list(acyclic_graph.keys())
     
-    # Reverse the result to get dependencies first
-    return result[::-1]
+    return result
+
+def dependency_levels(graph: Dict[str, Set[str]]) -> List[List[str]]:
+    """
+    Group the nodes of a dependency graph into levels (wavefronts) that can be
+    processed in parallel.
+    
+    Every node in level k depends only on nodes in levels 0 to k-1, so all nodes of a
+    level can be processed concurrently once the previous levels are done. The number
+    of levels is the length of the critical path (the longest dependency chain).
+    
+    Args:
+        graph: A dependency graph with natural direction (A→B if A depends on B)
+    
+    Returns:
+        A list of levels, each a sorted list of nodes, dependencies first
+    """
+    # First, resolve cycles to ensure we have a DAG
+    acyclic_graph = resolve_cycles(graph)
+    
+    # Index the nodes that depend on each node
+    dependents = build_reverse_index(acyclic_graph)
+    
+    # Count the unprocessed dependencies of each node
+    remaining_deps = {
+        node: sum(1 for dep in deps if dep in dependents)
+        for node, deps in acyclic_graph.items()
+    }
+    
+    levels = []
+    current_level = [node for node, count in remaining_deps.items() if count == 0]
+    
+    while current_level:
+        current_level.sort()
+        levels.append(current_level)
+        
+        # Nodes whose last dependency is in the current level form the next level
+        next_level = []
+        for node in current_level:
+            for dependent in dependents[node]:
+                remaining_deps[dependent] -= 1
+                if remaining_deps[dependent] == 0:
+                    next_level.append(dependent)
+        current_level = next_level
+    
+    if sum(len(level) for level in levels) != len(acyclic_graph):
+        logger.warning("Dependency levels are incomplete: graph has cycles that weren't resolved")
+    
+    return levels
 
 def dependency_first_dfs(graph: Dict[str, Set[str]]) -> List[str]:
     """
@@ -207,18 +354,27 @@ def dependency_first_dfs(graph: Dict[str, Set[str]]) -> List[str]:
     visited = set()
     result = []
     
-    # DFS function that processes dependencies first
-    def dfs(node):
-        if node in visited:
+    # Iterative DFS that processes dependencies first
+    def dfs(start):
+        if start in visited:
             return
-        visited.add(node)
+        visited.add(start)
         
-        # Visit all dependencies first
-        for dep in sorted(acyclic_graph.get(node, set())):
-            dfs(dep)
-        
-        # Add this node to the result after all its dependencies
-        result.append(node)
+        # Each work item is a node and the iterator over its sorted dependencies
+        work = [(start, iter(sorted(acyclic_graph.get(start, set()))))]
+        while work:
+            node, deps = work[-1]
+            
+            # Visit the next unvisited dependency first
+            for dep in deps:
+                if dep not in visited:
+                    visited.add(dep)
+                    work.append((dep, iter(sorted(acyclic_graph.get(dep, set())))))
+                    break
+            else:
+                # Add this node to the result after all its dependencies
+                work.pop()
+                result.append(node)
     
     # Start DFS from each root node
     for root in sorted(root_nodes):
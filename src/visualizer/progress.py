@@ -164,8 +164,14 @@ class ProgressVisualizer:
         # Add some space after the component status
         print()
     
-    def show_dependency_stats(self):
-        """Show statistics about the dependency graph."""
+    def show_dependency_stats(self, levels: Optional[List[List[str]]] = None):
+        """
+        Show statistics about the dependency graph.
+        
+        Args:
+            levels: Optional dependency levels (see dependency_levels), used to report
+                    how much parallelism the graph offers
+        """
         # Calculate dependency metrics
         total_deps = sum(len(self.components[comp_id].depends_on) for comp_id in self.components)
         max_deps = max((len(self.components[comp_id].depends_on), comp_id) for comp_id in self.components)
@@ -186,6 +192,22 @@ class ProgressVisualizer:
         print(f"Average dependencies per component: {avg_deps:.2f}")
         print(f"Max dependencies: {max_deps[0]} (in component '{max_deps[1]}')")
         
+        # Print per-level statistics if available
+        if levels:
+            widths = [len(level) for level in levels]
+            max_width = max(widths)
+            widest_level = widths.index(max_width)
+            print(f"\n{Fore.CYAN}Dependency Levels:{Style.RESET_ALL}")
+            print(f"Critical path length: {len(levels)} levels")
+            print(f"Max level width: {max_width} (level {widest_level})")
+            print(f"Average level width: {sum(widths) / len(levels):.2f}")
+            
+            # Show the width of the first levels, where most of the parallelism usually is
+            shown_widths = ", ".join(str(width) for width in widths[:20])
+            if len(widths) > 20:
+                shown_widths += ", ..."
+            print(f"Level widths: {shown_widths}")
+        
         # Print information about cycles if available
         print(f"\nComponents will be processed in topological order.")
         print() 
\ No newline at end of file
@@ -4,12 +4,23 @@ from colorama import Fore, Back, Style, init
 import sys
 import time
 import ast
+import threading
 from agent.tool.ast import _get_component_name_from_code
 class StatusVisualizer:
-    """Visualizes the workflow status of DocAssist agents in the terminal."""
+    """Visualizes the workflow status of DocAssist agents in the terminal.
     
-    def __init__(self):
-        """Initialize the status visualizer."""
+    Status changes only update the visualizer's state. A background render thread
+    draws the latest state at most once per refresh interval, so the agent workflow
+    never waits on the display and quick intermediate states are simply skipped.
+    """
+    
+    def __init__(self, refresh_interval: float = 1.0):
+        """Initialize the status visualizer.
+        
+        Args:
+            refresh_interval: Minimum time between two frames (seconds), which keeps
+                each status on screen long enough to be read
+        """
         init()  # Initialize colorama
         self.active_agent = None  # Track only the currently active agent
         self._agent_art = {
@@ -37,18 +48,56 @@ class StatusVisualizer:
         self._status_message = ""
         self._current_component = ""
         self._current_file = ""
+        
+        # State shared with the render thread, which only draws when _version changed
+        self._lock = threading.Lock()
+        self._version = 0
+        self._rendered_version = 0
+        self._refresh_interval = refresh_interval
+        self._stop_event = threading.Event()
+        self._render_thread = None
     
-    def _clear_screen(self):
-        """Clear the terminal screen."""
-        sys.stdout.write("\033[2J\033[H")
+    def _state_changed(self):
+        """Mark the state as changed and start the render thread on first use."""
+        self._version += 1
+        if self._render_thread is None:
+            self._render_thread = threading.Thread(
+                target=self._render_loop, name="StatusVisualizer", daemon=True
+            )
+            self._render_thread.start()
+    
+    def _render_loop(self):
+        """Draw the latest state until the visualizer is closed."""
+        while True:
+            self._render()
+            if self._stop_event.wait(self._refresh_interval):
+                break
+        self._render()
+    
+    def _render(self):
+        """Draw a frame if the state changed since the last one."""
+        with self._lock:
+            if self._version == self._rendered_version:
+                return
+            self._rendered_version = self._version
+            frame = self._build_frame()
+        
+        # Clear the screen and draw the frame in one write
+        sys.stdout.write("\033[2J\033[H" + frame + "\n")
         sys.stdout.flush()
     
+    def close(self):
+        """Draw the final state and stop the render thread."""
+        self._stop_event.set()
+        if self._render_thread is not None:
+            self._render_thread.join()
+    
     def _get_agent_color(self, agent: str) -> str:
         """Get the color for an agent based on its state."""
         return Fore.GREEN if agent == self.active_agent else Fore.WHITE
     
     def set_current_component(self, focal_component: str, file_path: str):
-        """Set the current component being processed and display its information.
+        """Set the current component being processed.
         
         Args:
             focal_component: The code component being processed
@@ -56,31 +105,36 @@ class StatusVisualizer:
         """
         # Try to extract the component name from the code
         try:
-            self._current_component = _get_component_name_from_code(focal_component)
+            component_name = _get_component_name_from_code(focal_component)
         except:
             # If parsing fails, just use a generic name
-            self._current_component = "unknown component"
+            component_name = "unknown component"
         
-        self._current_file = file_path
-        self._display_component_info()
-    
-    def _display_component_info(self):
-        """Display information about the current component being processed."""
-        # print(f"\n{Fore.CYAN}Currently Processing:{Style.RESET_ALL}")
-        print(f"Component: {self._current_component}")
-        print(f"File: {self._current_file}\n")
+        with self._lock:
+            self._current_component = component_name
+            self._current_file = file_path
+            self._state_changed()
     
     def update(self, active_agent: str, status_message: str = ""):
         """Update the visualization with the current active agent and status.
         
+        Only records the new state; the render thread draws it.
+        
         Args:
             active_agent: Name of the currently active agent
             status_message: Current status message to display
         """
-        self.active_agent = active_agent  # Update the single active agent
-        self._status_message = status_message
-        self._clear_screen()
+        with self._lock:
+            self.active_agent = active_agent  # Update the single active agent
+            self._status_message = status_message
+            self._state_changed()
+    
+    def _build_frame(self) -> str:
+        """Build the visualization of the current state.
         
+        Returns:
+            The lines of the frame joined with newlines
+        """
         # Build the visualization
         lines = []
         
@@ -134,14 +188,13 @@ class StatusVisualizer:
             lines.append("")
             lines.append(f"{Fore.YELLOW}Status: {self._status_message}{Style.RESET_ALL}")
         
-        # Print the visualization
-        print("\n".join(lines))
-        sys.stdout.flush()
+        return "\n".join(lines)
     
     def reset(self):
         """Reset the visualization state."""
-        self.active_agent = None
-        self._status_message = ""
-        self._current_component = ""
-        self._current_file = ""
-        self._clear_screen() 
\ No newline at end of file
+        with self._lock:
+            self.active_agent = None
+            self._status_message = ""
+            self._current_component = ""
+            self._current_file = ""
+            self._state_changed() 
\ No newline at end of file
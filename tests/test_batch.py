@@ -0,0 +1,196 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates
+"""
+Tests of the collection of concurrent requests into batch jobs.
+
+A fake LLM with a batch API answers every request with its last message, so the tests
+can check which requests went into which job. Every pipeline run is bounded by a
+timeout: a pipeline the collector forgets to wake up would otherwise hang the test.
+"""
+
+import asyncio
+from typing import Dict, Hashable, List, Optional
+
+import pytest
+
+from src.agent.llm.base import BaseLLM, BatchRequest, BatchResult
+from src.agent.llm.batch import BatchCollector, BatchingLLM
+
+TIMEOUT = 5.0
+
+
+class FakeBatchLLM(BaseLLM):
+    """LLM whose batch jobs answer with the content of each request's last message."""
+
+    def __init__(self, key: Hashable = "fake", fail_on: Optional[str] = None, polls_until_done: int = 1):
+        """
+        Args:
+            key: Batch key; LLMs with the same key share batch jobs
+            fail_on: Content of the request that errors in the job
+            polls_until_done: Polls a job takes before it has ended
+        """
+        self.key = key
+        self.fail_on = fail_on
+        self.polls_until_done = polls_until_done
+        self.jobs: Dict[str, List[BatchRequest]] = {}
+        self.polls: Dict[str, int] = {}
+        self.recorded: List[BatchResult] = []
+
+    def generate(self, messages, temperature=0.7, max_tokens=None) -> str:
+        raise AssertionError("Batched pipelines must not call the LLM directly")
+
+    async def agenerate(self, messages, temperature=0.7, max_tokens=None) -> str:
+        raise AssertionError("Batched pipelines must not call the LLM directly")
+
+    @property
+    def batch_key(self) -> Hashable:
+        return self.key
+
+    def submit_batch(self, requests: List[BatchRequest]) -> str:
+        batch_id = f"{self.key}-{len(self.jobs)}"
+        self.jobs[batch_id] = list(requests)
+        self.polls[batch_id] = 0
+        return batch_id
+
+    def poll_batch(self, batch_id: str) -> Optional[Dict[str, BatchResult]]:
+        self.polls[batch_id] += 1
+        if self.polls[batch_id] < self.polls_until_done:
+            return None
+        results = {}
+        for request in self.jobs[batch_id]:
+            content = request.messages[-1]["content"]
+            if content == self.fail_on:
+                results[request.custom_id] = BatchResult(error="invalid_request")
+            else:
+                results[request.custom_id] = BatchResult(text=f"answer to {content}", input_tokens=10, output_tokens=5)
+        return results
+
+    def record_batch_usage(self, result: BatchResult) -> None:
+        self.recorded.append(result)
+
+    def format_message(self, role: str, content: str) -> Dict[str, str]:
+        return {"role": role, "content": content}
+
+
+class DirectLLM(FakeBatchLLM):
+    """LLM without a batch API, answering right away."""
+
+    submit_batch = BaseLLM.submit_batch
+
+    async def agenerate(self, messages, temperature=0.7, max_tokens=None) -> str:
+        await asyncio.sleep(0)
+        return f"direct answer to {messages[-1]['content']}"
+
+
+async def pipeline(llm: BaseLLM, name: str, steps: int) -> List[str]:
+    """A component pipeline making its requests one after the other."""
+    answers = []
+    for step in range(steps):
+        answers.append(await llm.agenerate([{"role": "user", "content": f"{name}/{step}"}], temperature=0.1))
+    return answers
+
+
+def run_pipelines(collector: BatchCollector, pipelines: list, return_exceptions: bool = False) -> list:
+    """Run pipelines concurrently through the collector, failing instead of deadlocking."""
+    async def main():
+        runs = [collector.run(coroutine) for coroutine in pipelines]
+        return await asyncio.wait_for(asyncio.gather(*runs, return_exceptions=return_exceptions), TIMEOUT)
+
+    return asyncio.run(main())
+
+
+def test_requests_are_submitted_once_every_pipeline_waits():
+    llm = FakeBatchLLM(polls_until_done=3)
+    collector = BatchCollector(poll_interval=0)
+    batching_llm = BatchingLLM(llm, collector)
+
+    results = run_pipelines(collector, [pipeline(batching_llm, f"c{i}", 2) for i in range(4)])
+
+    assert results == [[f"answer to c{i}/0", f"answer to c{i}/1"] for i in range(4)]
+    # One job per step, holding the request of every pipeline
+    assert [len(requests) for requests in llm.jobs.values()] == [4, 4]
+    assert [request.messages[-1]["content"] for request in llm.jobs["fake-0"]] == [f"c{i}/0" for i in range(4)]
+    assert all(polls == 3 for polls in llm.polls.values())
+    assert collector.batches == 2 and collector.requests == 8
+    assert len(llm.recorded) == 8
+
+
+def test_errored_result_only_fails_its_request():
+    llm = FakeBatchLLM(fail_on="c1/0")
+    collector = BatchCollector(poll_interval=0)
+    batching_llm = BatchingLLM(llm, collector)
+
+    results = run_pipelines(collector, [pipeline(batching_llm, f"c{i}", 2) for i in range(3)],
+                            return_exceptions=True)
+
+    assert isinstance(results[1], RuntimeError)
+    assert "invalid_request" in str(results[1])
+    assert results[0] == ["answer to c0/0", "answer to c0/1"]
+    assert results[2] == ["answer to c2/0", "answer to c2/1"]
+    # The failed pipeline stopped, so the second job only holds the other two
+    assert [len(requests) for requests in llm.jobs.values()] == [3, 2]
+    assert len(llm.recorded) == 4
+
+
+def test_failed_job_fails_every_request_in_it():
+    class FailingLLM(FakeBatchLLM):
+        def submit_batch(self, requests: List[BatchRequest]) -> str:
+            raise ConnectionError("batch API unreachable")
+
+    collector = BatchCollector(poll_interval=0)
+    batching_llm = BatchingLLM(FailingLLM(), collector)
+
+    results = run_pipelines(collector, [pipeline(batching_llm, f"c{i}", 1) for i in range(3)],
+                            return_exceptions=True)
+
+    assert all(isinstance(result, ConnectionError) for result in results)
+
+
+def test_level_with_several_batch_keys_submits_one_job_per_key():
+    first, second = FakeBatchLLM(key="claude"), FakeBatchLLM(key="openai")
+    # Another instance with the same key, e.g. a second agent with the same model and account
+    first_again = FakeBatchLLM(key="claude")
+    collector = BatchCollector(poll_interval=0)
+    llms = [BatchingLLM(llm, collector) for llm in (first, second, first_again, second)]
+
+    results = run_pipelines(collector, [pipeline(llm, f"c{i}", 1) for i, llm in enumerate(llms)])
+
+    assert results == [[f"answer to c{i}/0"] for i in range(4)]
+    assert collector.batches == 2
+    # A job is submitted through the first LLM of its key
+    assert [request.messages[-1]["content"] for request in first.jobs["claude-0"]] == ["c0/0", "c2/0"]
+    assert [request.messages[-1]["content"] for request in second.jobs["openai-0"]] == ["c1/0", "c3/0"]
+    assert first_again.jobs == {}
+
+
+def test_pipelines_of_different_lengths_and_direct_calls_do_not_deadlock():
+    llm = FakeBatchLLM()
+    collector = BatchCollector(poll_interval=0)
+    batching_llm = BatchingLLM(llm, collector)
+    direct_llm = BatchingLLM(DirectLLM(), collector)
+
+    async def mixed(name: str) -> List[str]:
+        # A request without a batch API doesn't hold back the batched ones for long
+        answers = await pipeline(direct_llm, name, 1)
+        return answers + await pipeline(batching_llm, name, 2)
+
+    pipelines = [pipeline(batching_llm, "short", 1), pipeline(batching_llm, "long", 3), mixed("mixed")]
+    results = run_pipelines(collector, pipelines)
+
+    assert results[0] == ["answer to short/0"]
+    assert results[1] == ["answer to long/0", "answer to long/1", "answer to long/2"]
+    assert results[2] == ["direct answer to mixed/0", "answer to mixed/0", "answer to mixed/1"]
+    # Every request was answered by a job, and the finished pipelines woke the others up
+    assert sum(len(requests) for requests in llm.jobs.values()) == 6
+
+
+@pytest.mark.parametrize("pipelines", [0, 1, 8])
+def test_collector_without_waiting_pipelines_submits_nothing(pipelines):
+    collector = BatchCollector(poll_interval=0)
+
+    async def idle():
+        await asyncio.sleep(0)
+
+    run_pipelines(collector, [idle() for _ in range(pipelines)])
+
+    assert collector.batches == 0
+    assert collector._pending == [] and collector._active == 0
@@ -0,0 +1,222 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates
+"""
+Tests of the retries of LLM API calls against a stub HTTP server.
+
+The server answers with a scripted list of responses, so the status codes and rate
+limit headers of real providers can be replayed. Sleeps are recorded instead of
+waited for.
+"""
+
+import asyncio
+import threading
+import time
+import urllib.error
+import urllib.request
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+
+from src.agent.llm import retry
+from src.agent.llm.retry import (
+    RateLimitInfo, RetryPolicy, _parse_retry_after, acall_with_retries, call_with_retries
+)
+
+
+class StubServer:
+    """HTTP server answering every POST with the next scripted (status, headers) response."""
+
+    def __init__(self, responses: List[Tuple[int, Dict[str, str]]]):
+        self.responses = list(responses)
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                status, headers = stub.responses[min(stub.requests, len(stub.responses) - 1)]
+                stub.requests += 1
+                body = b'{"ok": true}' if status == 200 else b'{"error": "stub"}'
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/messages"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self) -> "StubServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class APIStatusError(Exception):
+    """An error like the ones of the provider SDKs, with a status code and the response."""
+
+    def __init__(self, status_code: int, headers: Dict[str, str]):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers)
+
+
+def post(url: str) -> SimpleNamespace:
+    """Send a request to the stub server, raising its error responses like an SDK would."""
+    request = urllib.request.Request(url, data=b"{}", method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return SimpleNamespace(status=response.status, headers=dict(response.headers))
+    except urllib.error.HTTPError as error:
+        raise APIStatusError(error.code, dict(error.headers)) from None
+
+
+class RecordingLimiter:
+    """Rate limiter recording the calls made by the retries."""
+
+    def __init__(self):
+        self.observed: List[RateLimitInfo] = []
+        self.pauses: List[float] = []
+        self.waits = 0
+
+    def observe(self, info: RateLimitInfo):
+        self.observed.append(info)
+
+    def pause(self, seconds: float):
+        self.pauses.append(seconds)
+
+    def wait_if_needed(self, input_tokens: int, estimated_output_tokens: Optional[int] = None):
+        self.waits += 1
+
+    async def acquire(self, input_tokens: int, estimated_output_tokens: Optional[int] = None):
+        self.waits += 1
+
+
+@pytest.fixture
+def sleeps(monkeypatch) -> List[float]:
+    """Record the delays of the retries instead of sleeping."""
+    delays: List[float] = []
+    monkeypatch.setattr(retry.time, "sleep", delays.append)
+    return delays
+
+
+def test_retry_after_takes_precedence_over_backoff(sleeps):
+    responses = [(429, {"retry-after": "7"}), (200, {})]
+    with StubServer(responses) as server:
+        result = call_with_retries(lambda: post(server.url), RetryPolicy(initial_delay=1.0, max_delay=2.0))
+
+    assert result.status == 200
+    assert server.requests == 2
+    # The provider's delay plus at most 10% jitter, although the backoff is capped at 2 seconds
+    assert len(sleeps) == 1
+    assert 7.0 <= sleeps[0] <= 7.0 * 1.1 + 0.1
+
+
+def test_retry_after_ms_takes_precedence_over_retry_after(sleeps):
+    responses = [(529, {"retry-after-ms": "1500", "retry-after": "30"}), (200, {})]
+    with StubServer(responses) as server:
+        call_with_retries(lambda: post(server.url), RetryPolicy())
+
+    assert len(sleeps) == 1
+    assert 1.5 <= sleeps[0] <= 1.5 * 1.1 + 0.1
+
+
+def test_last_error_is_raised_when_retries_are_exhausted(sleeps):
+    responses = [(503, {}), (502, {}), (500, {})]
+    with StubServer(responses) as server:
+        with pytest.raises(APIStatusError) as error:
+            call_with_retries(lambda: post(server.url), RetryPolicy(max_retries=2))
+
+    assert server.requests == 3
+    assert error.value.status_code == 500
+    assert len(sleeps) == 2
+
+
+def test_errors_not_worth_retrying_are_raised_at_once(sleeps):
+    with StubServer([(400, {}), (200, {})]) as server:
+        with pytest.raises(APIStatusError):
+            call_with_retries(lambda: post(server.url), RetryPolicy())
+
+    assert server.requests == 1
+    assert sleeps == []
+
+
+def test_rate_limiter_observes_headers_and_pauses_on_429(sleeps):
+    responses = [
+        (429, {"retry-after": "2", "anthropic-ratelimit-requests-limit": "40",
+               "anthropic-ratelimit-requests-remaining": "0"}),
+        (503, {}),
+        (200, {"anthropic-ratelimit-input-tokens-remaining": "1234"})
+    ]
+    limiter = RecordingLimiter()
+    with StubServer(responses) as server:
+        call_with_retries(lambda: post(server.url), RetryPolicy(), rate_limiter=limiter,
+                          get_headers=lambda result: result.headers)
+
+    assert [info.requests_limit for info in limiter.observed] == [40, None, None]
+    assert limiter.observed[0].requests_remaining == 0
+    assert limiter.observed[-1].input_tokens_remaining == 1234
+    # Only the 429 holds back the other callers, for as long as this caller waits
+    assert limiter.pauses == [sleeps[0]]
+    assert limiter.waits == 2
+
+
+def test_async_retries_pause_the_rate_limiter(monkeypatch):
+    delays: List[float] = []
+
+    async def record_sleep(seconds: float):
+        delays.append(seconds)
+
+    monkeypatch.setattr(retry.asyncio, "sleep", record_sleep)
+    limiter = RecordingLimiter()
+    with StubServer([(429, {"retry-after": "3"}), (200, {})]) as server:
+        async def send():
+            return await asyncio.to_thread(post, server.url)
+
+        result = asyncio.run(acall_with_retries(send, RetryPolicy(), rate_limiter=limiter))
+
+    assert result.status == 200
+    assert 3.0 <= delays[0] <= 3.0 * 1.1 + 0.1
+    assert limiter.pauses == delays
+    assert limiter.waits == 1
+
+
+def test_parse_retry_after_http_date():
+    future = formatdate(time.time() + 30, usegmt=True)
+    assert 28 <= _parse_retry_after({"retry-after": future}) <= 30
+
+    past = formatdate(time.time() - 30, usegmt=True)
+    assert _parse_retry_after({"retry-after": past}) == 0.0
+
+    assert _parse_retry_after({"retry-after": "not a date"}) is None
+    assert _parse_retry_after({}) is None
+
+
+def test_backoff_uses_equal_jitter(monkeypatch):
+    policy = RetryPolicy(initial_delay=1.0, max_delay=8.0)
+
+    monkeypatch.setattr(retry.random, "uniform", lambda low, high: low)
+    assert [policy.delay(attempt) for attempt in range(5)] == [0.5, 1.0, 2.0, 4.0, 4.0]
+
+    monkeypatch.setattr(retry.random, "uniform", lambda low, high: high)
+    assert [policy.delay(attempt) for attempt in range(5)] == [1.0, 2.0, 4.0, 8.0, 8.0]
+
+
+def test_retry_after_jitter_bounds(monkeypatch):
+    policy = RetryPolicy()
+
+    monkeypatch.setattr(retry.random, "uniform", lambda low, high: low)
+    assert policy.delay(3, retry_after=10.0) == 10.0
+
+    monkeypatch.setattr(retry.random, "uniform", lambda low, high: high)
+    assert policy.delay(3, retry_after=10.0) == pytest.approx(11.1)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# Copyright (c) Meta Platforms, Inc. and affiliates
+"""
+Benchmark for RateLimiter with many concurrent callers.
+
+Simulates callers that wait for the limiter, send a request and record its usage, over
+a virtual clock so that hours of traffic take a second. The requests are replayed
+against the provider's side of the limits, which takes max_tokens of output quota
+when a request arrives and gives back the unused part when it is done, and which has
+to admit every request. Reports the throughput each limit reached after the first
+minute and checks that the limiter's totals match the simulated usage. A short run
+with real threads checks that reserving capacity never blocks behind waiting callers.
+
+Usage:
+    python tool/benchmark_rate_limiter.py [--callers 64] [--minutes 60] [--rpm 50]
+                                          [--input-tpm 20000] [--output-tpm 8000]
+"""
+
+import os
+import sys
+import time
+import heapq
+import random
+import logging
+import argparse
+import threading
+from typing import Dict, List
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.agent.llm.rate_limiter import RateLimiter
+
+
+class VirtualClock:
+    """A clock that only moves when the simulation advances it."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class ProviderLimits:
+    """The provider's view of the limits: token buckets that must never be overdrawn."""
+
+    def __init__(self, requests_per_minute: int, input_tokens_per_minute: int, output_tokens_per_minute: int):
+        self.capacities = [requests_per_minute, input_tokens_per_minute, output_tokens_per_minute]
+        self.levels = list(self.capacities)
+        self.lowest = list(self.capacities)
+        self.updated = 0.0
+
+    def _refill(self, now: float):
+        for i, capacity in enumerate(self.capacities):
+            self.levels[i] = min(capacity, self.levels[i] + (now - self.updated) * capacity / 60)
+        self.updated = now
+
+    def arrive(self, now: float, input_tokens: int, max_tokens: int):
+        """Admit a request, taking its max_tokens of output quota."""
+        self._refill(now)
+        for i, amount in enumerate((1, input_tokens, max_tokens)):
+            self.levels[i] -= amount
+            self.lowest[i] = min(self.lowest[i], self.levels[i])
+
+    def complete(self, now: float, max_tokens: int, output_tokens: int):
+        """Give back the output quota a finished request didn't use."""
+        self._refill(now)
+        self.levels[2] = min(self.capacities[2], self.levels[2] + max_tokens - output_tokens)
+
+
+def simulate(args) -> bool:
+    """
+    Run callers against one limiter on a virtual clock and report the achieved rates.
+
+    Args:
+        args: Parsed command line arguments
+
+    Returns:
+        True if the provider admitted every request, the tightest limit was used almost
+        fully and the totals are consistent
+    """
+    rng = random.Random(args.seed)
+    clock = VirtualClock()
+    limiter = RateLimiter("simulated", args.rpm, args.input_tpm, args.output_tpm, 3.0, 15.0,
+                          buffer_percentage=0.0, clock=clock)
+    provider = ProviderLimits(args.rpm, args.input_tpm, args.output_tpm)
+    horizon = args.minutes * 60
+
+    # (time, sequence, caller, request, reservation if the request is in flight)
+    events: List[tuple] = []
+    for caller in range(args.callers):
+        request = (rng.randint(500, 6000), rng.randint(100, 1500))
+        events.append((rng.uniform(0, 1), caller, caller, request, None))
+    heapq.heapify(events)
+    sequence = args.callers
+
+    sent: Dict[str, float] = {"requests": 0, "input tokens": 0, "output tokens": 0}
+    completed: Dict[str, float] = {"requests": 0, "input tokens": 0, "output tokens": 0}
+    reserve_seconds = 0.0
+    reserve_calls = 0
+
+    while events:
+        now, _, caller, request, reservation = heapq.heappop(events)
+        clock.now = now
+        input_tokens, output_tokens = request
+
+        if reservation:
+            # The request is done; record it and move on to the caller's next one
+            limiter.record_request(input_tokens, output_tokens, reservation)
+            provider.complete(now, args.max_tokens, output_tokens)
+            completed["requests"] += 1
+            completed["input tokens"] += input_tokens
+            completed["output tokens"] += output_tokens
+            request = (rng.randint(500, 6000), rng.randint(100, 1500))
+            input_tokens, output_tokens = request
+        if now >= horizon:
+            continue
+
+        start = time.perf_counter()
+        reservation, wait_time = limiter.try_reserve(input_tokens, args.max_tokens)
+        reserve_seconds += time.perf_counter() - start
+        reserve_calls += 1
+
+        if reservation:
+            provider.arrive(now, input_tokens, args.max_tokens)
+            if now >= 60:
+                sent["requests"] += 1
+                sent["input tokens"] += input_tokens
+                sent["output tokens"] += output_tokens
+            done_at = now + rng.uniform(args.min_latency, args.max_latency)
+            heapq.heappush(events, (done_at, sequence, caller, request, reservation))
+        else:
+            heapq.heappush(events, (now + wait_time, sequence, caller, request, None))
+        sequence += 1
+
+    print(f"simulated {args.callers} callers for {args.minutes} minutes, "
+          f"{limiter.total_requests} requests, {reserve_calls} reserve calls, "
+          f"{reserve_seconds / reserve_calls * 1e6:.1f}us per reserve call")
+
+    # Skip the first minute, when the full buckets allow a burst
+    steady_minutes = (horizon - 60) / 60
+    all_ok = True
+    utilizations = []
+    for (name, limit), lowest in zip(
+        (("requests", args.rpm), ("input tokens", args.input_tpm), ("output tokens", args.output_tpm)),
+        provider.lowest
+    ):
+        rate = sent[name] / steady_minutes
+        utilizations.append(rate / limit)
+        admitted = lowest >= -1e-6
+        all_ok &= admitted
+        print(f"  {name}: {rate:,.0f}/min of {limit:,}/min ({rate / limit:.1%}), "
+              f"lowest provider bucket {lowest:,.0f}, never overdrawn: {admitted}")
+
+    # The tightest limit should be used almost fully
+    saturated = max(utilizations) >= 0.95
+    all_ok &= saturated
+    print(f"  tightest limit saturated: {saturated}")
+
+    consistent = (
+        limiter.total_requests == completed["requests"]
+        and limiter.total_input_tokens == completed["input tokens"]
+        and limiter.total_output_tokens == completed["output tokens"]
+    )
+    all_ok &= consistent
+    print(f"  totals consistent: {consistent}")
+    return all_ok
+
+
+def check_threads(args) -> bool:
+    """
+    Run real threads that have to wait and time how long reserving capacity takes.
+
+    The first request of every caller takes the whole token capacity, and the second
+    ones are spread over the next second, so callers sleep while others reserve.
+
+    Args:
+        args: Parsed command line arguments
+
+    Returns:
+        True if no reserve call was held up by a waiting caller
+    """
+    input_tokens_per_minute = args.callers * 6000
+    limiter = RateLimiter("threads", args.callers * 60, input_tokens_per_minute, 10 ** 9, 3.0, 15.0,
+                          buffer_percentage=0.0)
+    reserve_times: List[float] = []
+    times_lock = threading.Lock()
+
+    def caller():
+        for input_tokens in (6000, 100):
+            reservation = None
+            while reservation is None:
+                start = time.perf_counter()
+                reservation, wait_time = limiter.try_reserve(input_tokens, 10)
+                elapsed = time.perf_counter() - start
+                with times_lock:
+                    reserve_times.append(elapsed)
+                time.sleep(wait_time)
+            limiter.record_request(input_tokens, 10, reservation)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=caller) for _ in range(args.callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    longest = max(reserve_times)
+    not_blocked = longest < 0.1
+    print(f"{args.callers} threads, {limiter.total_requests} requests in {elapsed:.2f}s, "
+          f"longest reserve {longest * 1000:.2f}ms, not blocked by waiting callers: {not_blocked}")
+    return not_blocked and limiter.total_requests == 2 * args.callers
+
+
+def main():
+    """Run the simulation and the thread check and report the results."""
+    parser = argparse.ArgumentParser(description="Benchmark RateLimiter with concurrent callers.")
+    parser.add_argument("--callers", type=int, default=64, help="Number of concurrent callers (default: 64)")
+    parser.add_argument("--minutes", type=int, default=60, help="Simulated minutes (default: 60)")
+    parser.add_argument("--rpm", type=int, default=50, help="Requests per minute (default: 50)")
+    parser.add_argument("--input-tpm", type=int, default=20000, help="Input tokens per minute (default: 20000)")
+    parser.add_argument("--output-tpm", type=int, default=8000, help="Output tokens per minute (default: 8000)")
+    parser.add_argument("--max-tokens", type=int, default=4096,
+                        help="Output tokens reserved per request (default: 4096)")
+    parser.add_argument("--min-latency", type=float, default=2.0, help="Shortest request latency in seconds (default: 2)")
+    parser.add_argument("--max-latency", type=float, default=20.0, help="Longest request latency in seconds (default: 20)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    args = parser.parse_args()
+
+    # Keep the per-request logs out of the report
+    logging.disable(logging.WARNING)
+
+    all_ok = simulate(args)
+    all_ok &= check_threads(args)
+    sys.exit(0 if all_ok else 1)
+
+
+if __name__ == "__main__":
+    main()
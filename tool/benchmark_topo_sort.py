@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# Copyright (c) Meta Platforms, Inc. and affiliates
+"""
+Benchmark for topological_sort on synthetic dependency graphs.
+
+Generates layered random DAGs (every node depends on a few nodes of earlier layers),
+times topological_sort on each of them and checks that every dependency is ordered
+before its dependents. The dependency graphs of the test repositories and a long cyclic
+chain are checked the same way, against their graph with cycles broken by resolve_cycles.
+
+Usage:
+    python tool/benchmark_topo_sort.py [--sizes 10000 100000 1000000] [--avg-deps 3]
+"""
+
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+from typing import Dict, List, Set
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.dependency_analyzer import (
+    DependencyParser,
+    build_graph_from_components,
+    resolve_cycles,
+    topological_sort
+)
+
+
+def generate_layered_dag(num_nodes: int, avg_deps: int, num_layers: int, seed: int) -> Dict[str, Set[str]]:
+    """
+    Generate a random layered DAG with natural dependency direction.
+
+    Args:
+        num_nodes: Number of nodes in the graph
+        avg_deps: Average number of dependencies per node
+        num_layers: Number of layers; nodes only depend on nodes of earlier layers
+        seed: Random seed
+
+    Returns:
+        A dependency graph (node -> set of dependencies)
+    """
+    rng = random.Random(seed)
+    layer_size = max(1, num_nodes // num_layers)
+    nodes = [f"pkg.module_{i // 50}.component_{i}" for i in range(num_nodes)]
+
+    graph = {}
+    for i, node in enumerate(nodes):
+        layer_start = (i // layer_size) * layer_size
+        if layer_start == 0:
+            graph[node] = set()
+            continue
+        num_deps = rng.randint(0, 2 * avg_deps)
+        graph[node] = {nodes[rng.randrange(layer_start)] for _ in range(num_deps)}
+
+    # Shuffle insertion order so the sort can't rely on it
+    items = list(graph.items())
+    rng.shuffle(items)
+    return dict(items)
+
+
+def generate_chain(length: int) -> Dict[str, Set[str]]:
+    """
+    Generate a single dependency chain closed into one long cycle.
+
+    Args:
+        length: Number of nodes in the chain
+
+    Returns:
+        A dependency graph where node i depends on node i + 1 and the last node
+        depends on the first one
+    """
+    nodes = [f"pkg.chain.component_{i}" for i in range(length)]
+    return {node: {nodes[(i + 1) % length]} for i, node in enumerate(nodes)}
+
+
+def check_order(graph: Dict[str, Set[str]], order: List[str]) -> bool:
+    """
+    Check that order contains every node once and lists dependencies first.
+
+    Args:
+        graph: The sorted dependency graph
+        order: The order returned by topological_sort
+
+    Returns:
+        True if the order is a valid topological order of the graph
+    """
+    if len(order) != len(graph) or set(order) != set(graph):
+        return False
+
+    position = {node: i for i, node in enumerate(order)}
+    return all(
+        position[dep] < position[node]
+        for node, deps in graph.items()
+        for dep in deps
+        if dep in position
+    )
+
+
+def main():
+    """Run the benchmark and report timing and correctness for each graph."""
+    parser = argparse.ArgumentParser(description="Benchmark topological_sort on synthetic graphs.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="Number of nodes of the synthetic graphs (default: 10k, 100k, 1M)")
+    parser.add_argument("--avg-deps", type=int, default=3,
+                        help="Average number of dependencies per node (default: 3)")
+    parser.add_argument("--layers", type=int, default=20,
+                        help="Number of layers of the synthetic graphs (default: 20)")
+    parser.add_argument("--fixtures", nargs="*", default=["data/raw_test_repo", "data/raw_test_repo_simple"],
+                        help="Repositories whose dependency graphs are sorted and checked")
+    parser.add_argument("--chain-length", type=int, default=100_000,
+                        help="Length of the cyclic dependency chain, which is deeper than the recursion limit (default: 100k)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    args = parser.parse_args()
+
+    # Keep cycle resolution logs out of the report
+    logging.disable(logging.WARNING)
+
+    all_ok = True
+
+    for repo_path in args.fixtures:
+        components = DependencyParser(repo_path).parse_repository()
+        graph = build_graph_from_components(components)
+        order = topological_sort(graph)
+        valid = check_order(resolve_cycles(graph), order)
+        all_ok &= valid
+        print(f"fixture {repo_path}: {len(graph)} nodes, valid order: {valid}")
+
+    for size in args.sizes:
+        graph = generate_layered_dag(size, args.avg_deps, args.layers, args.seed)
+        num_edges = sum(len(deps) for deps in graph.values())
+
+        start = time.perf_counter()
+        order = topological_sort(graph)
+        elapsed = time.perf_counter() - start
+
+        valid = check_order(graph, order)
+        all_ok &= valid
+        print(f"synthetic {size} nodes / {num_edges} edges: {elapsed:.3f}s, valid order: {valid}")
+
+    if args.chain_length:
+        graph = generate_chain(args.chain_length)
+
+        start = time.perf_counter()
+        order = topological_sort(graph)
+        elapsed = time.perf_counter() - start
+
+        valid = check_order(resolve_cycles(graph), order)
+        all_ok &= valid
+        print(f"cyclic chain of {args.chain_length} nodes: {elapsed:.3f}s, valid order: {valid}")
+
+    sys.exit(0 if all_ok else 1)
+
+
+if __name__ == "__main__":
+    main()